@@ -1,10 +1,13 @@
 import os
+import json
 import uuid
 import logging
+import threading
 import yaml
 from fastapi import FastAPI, UploadFile, File, Form
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
 from pathlib import Path
 from pydantic import BaseModel
 from typing import List, Optional
@@ -14,7 +17,10 @@ import sys
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from core.riko_core import RikoCore
-from providers.tts.sovits_ping import sovits_gen
+from core.worker_pool import PoolSaturatedError, create_stage_pools
+from core.metrics import metrics
+from providers.tts.sovits_ping import get_tts_client, sovits_gen
+from providers.tts.tts_pipeline import TTSPipeline
 from providers.vrm.vrm_controller import VRMController
 
 logging.basicConfig(level=logging.INFO)
@@ -22,9 +28,12 @@ logger = logging.getLogger(__name__)
 
 app = FastAPI()
 
-# Global state for visuals and interruption
+# Global state for visuals and interruption, used by stateless clients that send their own history.
+# Session-based clients get their own VRM state and cancel flag from riko.sessions.
 vrm = VRMController()
 is_interrupted = False
+# Cancellation flags for in-flight /chat/stream connections, keyed by stream_id
+active_streams = {}
 
 app.add_middleware(
     CORSMiddleware,
@@ -35,61 +44,276 @@ app.add_middleware(
 )
 
 riko = None
+# Bounded per-stage worker pools (ASR / LLM / TTS), see core/worker_pool.py
+pools = create_stage_pools()
+
+@app.exception_handler(PoolSaturatedError)
+async def pool_saturated_handler(request, exc):
+    logger.warning(f"Rejecting request, {exc.stage} pool saturated: {pools[exc.stage].stats()}")
+    return JSONResponse(status_code=429, content={"detail": str(exc), "stage": exc.stage}, headers={"Retry-After": "1"})
 
 @app.on_event("startup")
 async def startup_event():
-    global riko
+    global riko, pools
     try:
         # Adjusted config path
         CONFIG_PATH = os.path.join(os.path.dirname(__file__), '..', 'configs', 'character_config.yaml')
+        # Subsystems keep loading in the background; /ready reports when they are up
         riko = RikoCore(config_path=CONFIG_PATH)
-        logger.info("RikoCore initialized successfully for Web API.")
+        logger.info("RikoCore started for Web API.")
+        for pool in pools.values():
+            pool.shutdown()
+        pools = create_stage_pools(riko.config.get('api_pools'))
+
+        otel_config = riko.config.get('metrics', {}).get('otel', {})
+        if otel_config.get('enabled'):
+            metrics.enable_tracing(otel_config.get('service_name', 'riko'), otel_config.get('endpoint'))
     except Exception as e:
         logger.error(f"Failed to initialize RikoCore: {e}")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    for pool in pools.values():
+        pool.shutdown()
+    if riko is not None and riko.subsystems.is_ready("memory"):
+        if riko.compactor is not None:
+            riko.compactor.stop()
+        # Write out memories still waiting in the write-behind buffer
+        riko.memory_db.close()
+    tts_client = get_tts_client()
+    await tts_client.aclose()
+    tts_client.close()
+
 class ChatRequest(BaseModel):
     text: str
+    # Send history for stateless mode; omit it to let the server keep history under session_id.
+    # In session mode replies carry only the turn's new `messages` (with seq numbers).
     history: Optional[List[dict]] = None
+    session_id: Optional[str] = None
+
+class InterruptRequest(BaseModel):
+    stream_id: Optional[str] = None
+    session_id: Optional[str] = None
 
 class ModelSettings(BaseModel):
     provider: str
     model: Optional[str] = None
 
+@app.get("/ready")
+async def readiness():
+    """Per-subsystem startup status; 503 until every eagerly loaded subsystem is up."""
+    if riko is None:
+        return JSONResponse(status_code=503, content={"ready": False, "subsystems": {}})
+    ready = riko.subsystems.ready()
+    return JSONResponse(status_code=200 if ready else 503, content={"ready": ready, "subsystems": riko.subsystems.status()})
+
 @app.get("/settings")
 async def get_settings():
     return {
         "provider": riko.llm_provider,
         "model": riko.real_llm_path,
-        "available_providers": ["gemini", "openai", "ollama", "openvino", "cpu_legacy", "llama_cpp"]
+        "available_providers": ["gemini", "openai", "ollama", "openvino", "cpu_legacy", "llama_cpp"],
+        "pools": {stage: pool.stats() for stage, pool in pools.items()},
+        "residency": riko.model_pool.stats(),
+        "memory_compaction": riko.compactor.status() if riko.compactor else None
     }
 
 @app.post("/settings")
 async def update_settings(settings: ModelSettings):
     try:
-        msg = riko.switch_model(settings.provider, settings.model)
+        msg = await pools["llm"].run(riko.switch_model, settings.provider, settings.model)
         return {"message": msg, "provider": riko.llm_provider, "model": riko.real_llm_path}
+    except PoolSaturatedError:
+        raise
     except Exception as e:
         logger.error(f"Failed to switch model: {e}")
         return JSONResponse(status_code=500, content={"detail": str(e)})
 
+@app.post("/settings/preload", status_code=202)
+async def preload_model(settings: ModelSettings):
+    """Starts loading a model in the background; /settings shows it once resident."""
+    riko.preload_model(settings.provider, settings.model)
+    return {"message": "Preloading", "provider": settings.provider, "model": settings.model}
+
 @app.post("/interrupt")
-async def interrupt_endpoint():
+async def interrupt_endpoint(request: Optional[InterruptRequest] = None):
     global is_interrupted
+    if request and request.session_id:
+        if not riko.sessions.cancel(request.session_id):
+            return JSONResponse(status_code=404, content={"detail": "Session not found"})
+        logger.info(f"❌ Interruption signal received for session {request.session_id}.")
+        return {"status": "ok", "message": "Stopping generation/playback", "session_id": request.session_id}
+
+    if request and request.stream_id:
+        cancel = active_streams.get(request.stream_id)
+        if cancel is None:
+            return JSONResponse(status_code=404, content={"detail": "Stream not found"})
+        cancel.set()
+        logger.info(f"❌ Interruption signal received for stream {request.stream_id}.")
+        return {"status": "ok", "message": "Stopping stream", "stream_id": request.stream_id}
+
     is_interrupted = True
+    for cancel in list(active_streams.values()):
+        cancel.set()
     logger.info("❌ Interruption signal received.")
     return {"status": "ok", "message": "Stopping generation/playback"}
 
+def _collect_gauges():
+    for stage, pool in pools.items():
+        stats = pool.stats()
+        yield "riko_pool_in_flight", "Jobs running per worker pool.", {"stage": stage}, stats["in_flight"]
+        yield "riko_pool_queued", "Jobs waiting per worker pool.", {"stage": stage}, stats["queued"]
+    if riko is not None:
+        yield "riko_sessions_active", "Sessions held in memory.", {}, riko.sessions.stats()["active"]
+        residency = riko.model_pool.stats()
+        yield "riko_models_resident", "LLMs loaded in the model pool.", {}, len(residency["models"])
+        yield "riko_models_resident_mb", "Estimated memory held by loaded LLMs.", {}, residency["resident_mb"]
+        if riko.subsystems.is_ready("memory"):
+            memory = riko.memory_db.stats()
+            yield "riko_memories", "Lines in long-term memory.", {}, memory["memories"]
+            yield "riko_memory_pending_writes", "Memories waiting for the batched writer.", {}, memory["pending_writes"]
+
+def _collect_counters():
+    # Running totals kept by MemoryManager itself, exported as counters
+    if riko is not None and riko.subsystems.is_ready("memory"):
+        memory = riko.memory_db.stats()
+        yield "riko_memory_query_cache_hits_total", "Query embedding cache hits.", {}, memory["query_cache_hits"]
+        yield "riko_memory_query_cache_misses_total", "Query embedding cache misses.", {}, memory["query_cache_misses"]
+
+metrics.add_collector(_collect_gauges)
+metrics.add_collector(_collect_counters, kind="counter")
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Prometheus scrape endpoint: per-stage latency, TTFT, queue wait, tokens, cache hits."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+def _timed(stage, fn):
+    """Wraps a blocking stage call so it is timed where it actually runs (inside the pool)."""
+    def run(*args, **kwargs):
+        with metrics.span(stage):
+            return fn(*args, **kwargs)
+    return run
+
+async def _get_session(session_id, history):
+    """Session mode unless the client ships its own history (stateless mode)."""
+    if history is not None:
+        return None
+    # May read history from SQLite and run eviction hooks that wait on the LLM
+    return await run_in_threadpool(riko.sessions.get_or_create, session_id)
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/chat/stream")
+async def chat_stream_endpoint(request: ChatRequest):
+    """
+    Server-sent events version of /chat. Emits `start` (with the stream_id to pass to
+    /interrupt), `delta` text chunks, `vrm_state` whenever the expression changes,
+    one `audio` event per synthesized sentence (in order, with its index) and finally
+    `done` (or `interrupted` / `error`).
+    """
+    # Reject up front (429) while TTS is already full, rather than streaming a reply with no audio
+    pools["tts"].check()
+    session = await _get_session(request.session_id, request.history)
+    session_id = session.session_id if session else None
+    stream_vrm = session.vrm if session else vrm
+
+    stream_id = uuid.uuid4().hex
+    cancel = session.cancel_event if session else threading.Event()
+    active_streams[stream_id] = cancel
+
+    def audio_event(index, text, path):
+        audio_url = f"/audio/{Path(path).name}" if path else None
+        return _sse("audio", {"index": index, "text": text, "audio_url": audio_url})
+
+    # TTS segments go through the TTS pool's admission limit; a refused segment just has no audio
+    pipeline = TTSPipeline(synthesize=_timed("tts", sovits_gen), prefix="web_output", executor=pools["tts"])
+    finished = {}
+
+    # Runs on an LLM pool thread and ends with the generation, so the LLM slot is not held while TTS finishes
+    def llm_stage():
+        gen = None
+        try:
+            yield _sse("start", {"stream_id": stream_id, "session_id": session_id})
+
+            gen = riko.chat_stream(request.text, history=request.history, session_id=session_id)
+            text = ""
+            expression = None
+            while True:
+                try:
+                    delta = next(gen)
+                except StopIteration as stop:
+                    response_text, updated_history = stop.value
+                    break
+                if cancel.is_set() and not session:
+                    yield _sse("interrupted", {"message": "Interrupted"})
+                    return
+                text += delta
+                yield _sse("delta", {"text": delta})
+                pipeline.feed(delta)
+
+                vrm_state = stream_vrm.update_vrm_state(text)
+                if vrm_state["expression"] != expression:
+                    expression = vrm_state["expression"]
+                    yield _sse("vrm_state", vrm_state)
+
+                for segment in pipeline.poll():
+                    yield audio_event(*segment)
+
+            if response_text is None:
+                # Session turn interrupted inside chat_stream
+                yield _sse("interrupted", {"message": "Interrupted"})
+                return
+
+            pipeline.close()
+            finished["done"] = {"text": response_text, "session_id": session_id}
+            finished["done"]["messages" if session else "history"] = updated_history
+        except Exception as e:
+            logger.error(f"Chat stream failed: {e}")
+            yield _sse("error", {"detail": str(e)})
+        finally:
+            if gen is not None:
+                gen.close()
+
+    async def event_stream(llm_events):
+        try:
+            async for event in llm_events:
+                yield event
+            if "done" not in finished:
+                return
+            async for segment in pipeline.adrain():
+                if cancel.is_set():
+                    yield _sse("interrupted", {"message": "Interrupted"})
+                    return
+                yield audio_event(*segment)
+            yield _sse("done", finished["done"])
+        finally:
+            # Stops the LLM producer too if the client went away mid-generation
+            await llm_events.aclose()
+            pipeline.cancel()
+            active_streams.pop(stream_id, None)
+
+    try:
+        llm_events = pools["llm"].stream(llm_stage)
+    except PoolSaturatedError:
+        active_streams.pop(stream_id, None)
+        raise
+    return StreamingResponse(event_stream(llm_events), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 @app.post("/chat")
 async def chat_endpoint(request: ChatRequest):
     global is_interrupted
     is_interrupted = False 
     try:
-        response_text, updated_history = riko.chat(request.text, history=request.history)
+        session = await _get_session(request.session_id, request.history)
+        session_id = session.session_id if session else None
+        response_text, updated_history = await pools["llm"].run(riko.chat, request.text, history=request.history, session_id=session_id)
         
-        if is_interrupted:
+        if session.cancel_event.is_set() if session else is_interrupted:
             return JSONResponse(status_code=204, content={"message": "Interrupted"})
 
-        vrm_state = vrm.update_vrm_state(response_text)
+        vrm_state = (session.vrm if session else vrm).update_vrm_state(response_text)
         
         uid = uuid.uuid4().hex
         audio_filename = f"web_output_{uid}.wav"
@@ -98,24 +322,32 @@ async def chat_endpoint(request: ChatRequest):
         
         audio_url = None
         try:
-            gen_path = sovits_gen(response_text, str(audio_path))
+            async with pools["tts"].admit():
+                with metrics.span("tts"):
+                    gen_path = await get_tts_client().synthesize(response_text, str(audio_path))
             if gen_path:
                 audio_url = f"/audio/{audio_filename}"
+        except PoolSaturatedError:
+            logger.warning("TTS pool saturated, replying without audio.")
         except Exception as e:
             logger.error(f"TTS Failed: {e}")
 
-        return {
+        result = {
             "text": response_text,
-            "history": updated_history,
             "audio_url": audio_url,
-            "vrm_state": vrm_state
+            "vrm_state": vrm_state,
+            "session_id": session_id
         }
+        result["messages" if session else "history"] = updated_history
+        return result
+    except PoolSaturatedError:
+        raise
     except Exception as e:
         logger.error(f"Chat failed: {e}")
         return JSONResponse(status_code=500, content={"detail": str(e)})
 
 @app.post("/voice")
-async def voice_endpoint(file: UploadFile = File(...), history: str = Form(None)):
+async def voice_endpoint(file: UploadFile = File(...), history: str = Form(None), session_id: str = Form(None)):
     global is_interrupted
     is_interrupted = False
     try:
@@ -124,20 +356,23 @@ async def voice_endpoint(file: UploadFile = File(...), history: str = Form(None)
         with open(temp_audio, "wb") as buffer:
             buffer.write(await file.read())
 
-        user_text = riko.asr.transcribe(str(temp_audio))
-        temp_audio.unlink()
+        try:
+            user_text = await pools["asr"].run(_timed("asr", riko.asr.transcribe), str(temp_audio))
+        finally:
+            temp_audio.unlink()
         
         if not user_text:
             return JSONResponse(status_code=400, content={"detail": "Could not hear anything."})
 
-        import json
         history_list = json.loads(history) if history else None
-        response_text, updated_history = riko.chat(user_text, history=history_list)
+        session = await _get_session(session_id, history_list)
+        session_id = session.session_id if session else None
+        response_text, updated_history = await pools["llm"].run(riko.chat, user_text, history=history_list, session_id=session_id)
 
-        if is_interrupted:
+        if session.cancel_event.is_set() if session else is_interrupted:
             return JSONResponse(status_code=204, content={"message": "Interrupted"})
 
-        vrm_state = vrm.update_vrm_state(response_text)
+        vrm_state = (session.vrm if session else vrm).update_vrm_state(response_text)
 
         uid = uuid.uuid4().hex
         audio_filename = f"web_output_{uid}.wav"
@@ -145,23 +380,39 @@ async def voice_endpoint(file: UploadFile = File(...), history: str = Form(None)
         
         audio_url = None
         try:
-            gen_path = sovits_gen(response_text, str(audio_path))
+            async with pools["tts"].admit():
+                with metrics.span("tts"):
+                    gen_path = await get_tts_client().synthesize(response_text, str(audio_path))
             if gen_path:
                 audio_url = f"/audio/{audio_filename}"
+        except PoolSaturatedError:
+            logger.warning("TTS pool saturated, replying without audio.")
         except Exception as e:
             logger.error(f"TTS Failed: {e}")
 
-        return {
+        result = {
             "user_text": user_text,
             "text": response_text,
-            "history": updated_history,
             "audio_url": audio_url,
-            "vrm_state": vrm_state
+            "vrm_state": vrm_state,
+            "session_id": session_id
         }
+        result["messages" if session else "history"] = updated_history
+        return result
+    except PoolSaturatedError:
+        raise
     except Exception as e:
         logger.error(f"Voice chat failed: {e}")
         return JSONResponse(status_code=500, content={"detail": str(e)})
 
+@app.get("/conversations/{session_id}")
+async def get_conversation(session_id: str, since: int = 0, limit: Optional[int] = None):
+    """Messages stored for a session after seq `since`, for clients that need to (re)sync."""
+    messages = riko.conversations.get_messages(session_id, since=since, limit=limit)
+    if not messages and since == 0 and riko.sessions.get(session_id) is None:
+        return JSONResponse(status_code=404, content={"detail": "Conversation not found"})
+    return {"session_id": session_id, "messages": messages}
+
 @app.get("/audio/{filename}")
 async def get_audio(filename: str):
     path = Path("audio") / filename
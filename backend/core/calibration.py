@@ -0,0 +1,243 @@
+import os
+import gc
+import sys
+import json
+import time
+import math
+import wave
+import array
+import logging
+import argparse
+import tempfile
+
+# Fix path to allow local imports when run as a script
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+
+from core.hardware import HardwareDetector
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RESULTS_PATH = os.path.join(os.path.dirname(__file__), '..', '..', 'model_cache', 'backend_calibration.json')
+
+# A typical voice turn, used to fold the probes into one comparable number
+TURN_AUDIO_SECONDS = 5.0
+TURN_REPLY_TOKENS = 64
+
+PROBE_PROMPT = [
+    {"role": "system", "content": "You are Riko, a cheerful assistant. Answer briefly."},
+    {"role": "user", "content": "Tell me something nice about today in two sentences."}
+]
+
+def llm_provider_for(backend):
+    """The local LLM provider RikoCore would pair with a backend, or None for remote ones."""
+    if backend == 'cuda':
+        return None
+    if backend == 'openvino':
+        return "openvino"
+    if backend in ['mps', 'rocm', 'cpu_modern']:
+        return "llama_cpp"
+    return "cpu_legacy"
+
+def candidate_backends(hw_config):
+    """(backend, openvino_device) pairs available on this machine, from the detector's priority list."""
+    mapping = {
+        "cuda": ("cuda", None),
+        "rocm": ("rocm", None),
+        "mps": ("mps", None),
+        "openvino_npu": ("openvino", "NPU"),
+        "openvino_gpu": ("openvino", "GPU"),
+        "openvino_cpu": ("openvino", "CPU"),
+        "cpu_modern": ("cpu_modern", None),
+        "cpu_legacy": ("cpu_legacy", None)
+    }
+    return [mapping[p] for p in hw_config['priority_list'] if p in mapping]
+
+def _write_probe_wav(path, seconds=TURN_AUDIO_SECONDS, rate=16000):
+    """Writes a quiet swept tone; only the ASR timing matters, not the transcript."""
+    samples = array.array('h', (
+        int(3000 * math.sin(2 * math.pi * (200 + 300 * i / (seconds * rate)) * i / rate))
+        for i in range(int(seconds * rate))
+    ))
+    with wave.open(path, 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(rate)
+        f.writeframes(samples.tobytes())
+
+class BackendCalibrator:
+    """
+    Measures each available backend instead of trusting the fixed priority order.
+
+    For every backend the detector found, a short ASR probe records the real-time
+    factor and a short LLM probe records time-to-first-token and tokens/sec. Results
+    are saved together with the hardware fingerprint, and best_backend() returns the
+    backend with the lowest estimated time for a typical voice turn, counting only
+    the stages every backend measured.
+    """
+    def __init__(self, config, model_manager=None, results_path=DEFAULT_RESULTS_PATH):
+        self.config = config
+        self.results_path = results_path
+        if model_manager is None:
+            from managers.model_manager import ModelManager
+            model_manager = ModelManager()
+        self.mm = model_manager
+
+    def _probe_asr(self, backend, device, wav_path):
+        from providers.asr.asr_factory import ASRFactory
+
+        start = time.time()
+        asr = ASRFactory.create_asr(backend, self.config.get('local_asr_path', 'base.en'), openvino_device=device or "CPU")
+        load_seconds = time.time() - start
+        asr.transcribe(wav_path)  # warm-up
+        start = time.time()
+        asr.transcribe(wav_path)
+        rtf = (time.time() - start) / TURN_AUDIO_SECONDS
+        return {"load_seconds": round(load_seconds, 2), "rtf": round(rtf, 4)}
+
+    def _probe_llm(self, backend, device):
+        from providers.llm.llm_factory import LLMFactory
+
+        provider = llm_provider_for(backend)
+        if provider is None:
+            return None
+        model_path = self.mm.find_model(self.config.get('local_llm_path', 'models/riko-llm'), provider)
+        options = dict(self.config.get('openvino' if provider == "openvino" else 'llama_cpp', {}))
+        options.pop('draft_model', None)
+
+        start = time.time()
+        llm = LLMFactory.create_llm(provider, model_path, openvino_device=device or "CPU", llm_options=options)
+        load_seconds = time.time() - start
+        "".join(llm.generate_stream(PROBE_PROMPT))  # warm-up
+
+        start = time.time()
+        first = None
+        parts = []
+        for delta in llm.generate_stream(PROBE_PROMPT):
+            if first is None:
+                first = time.time() - start
+            parts.append(delta)
+        total = time.time() - start
+        tokens = llm.count_tokens("".join(parts))
+        decode = max(total - (first or 0), 1e-6)
+        return {
+            "provider": provider,
+            "model": model_path,
+            "load_seconds": round(load_seconds, 2),
+            "ttft": round(first or total, 4),
+            "tokens": tokens,
+            "tokens_per_second": round(max(tokens - 1, 1) / decode, 2)
+        }
+
+    @staticmethod
+    def _stage_seconds(result, stage):
+        """Seconds the stage adds to a typical turn, or None if it was not measured."""
+        probe = result.get(stage)
+        if not probe or "error" in probe:
+            return None
+        if stage == "asr":
+            return probe["rtf"] * TURN_AUDIO_SECONDS
+        return probe["ttft"] + TURN_REPLY_TOKENS / probe["tokens_per_second"]
+
+    @classmethod
+    def _score(cls, results, stages):
+        """
+        Sets turn_seconds on every result, summed over the stages all backends measured.
+
+        A backend whose probe failed is left out (turn_seconds None). A stage that some
+        backend could not measure (cuda has no local LLM) is not scored for any, so the
+        totals stay comparable; if that leaves nothing, the stages anyone measured are
+        scored and backends missing one are marked incomplete instead.
+        """
+        usable = [r for r in results if not any("error" in (r.get(stage) or {}) for stage in stages)]
+        scored = [stage for stage in stages if all(cls._stage_seconds(r, stage) is not None for r in usable)]
+        if not scored:
+            scored = [stage for stage in stages if any(cls._stage_seconds(r, stage) is not None for r in usable)]
+        for result in results:
+            seconds = [cls._stage_seconds(result, stage) for stage in scored]
+            if result in usable and scored and None not in seconds:
+                result["turn_seconds"] = round(sum(seconds), 3)
+            else:
+                result["turn_seconds"] = None
+                if result in usable:
+                    result["incomplete"] = True
+        return scored
+
+    def run(self, hw_config, include_asr=True, include_llm=True):
+        """Probes every candidate backend and saves the results."""
+        results = []
+        with tempfile.TemporaryDirectory() as tmp:
+            wav_path = os.path.join(tmp, "probe.wav")
+            _write_probe_wav(wav_path)
+            for backend, device in candidate_backends(hw_config):
+                name = f"{backend}:{device}" if device else backend
+                logger.info(f"Calibrating {name}...")
+                result = {"backend": backend, "openvino_device": device}
+                for stage, enabled, probe in (("asr", include_asr, lambda: self._probe_asr(backend, device, wav_path)),
+                                              ("llm", include_llm, lambda: self._probe_llm(backend, device))):
+                    if not enabled:
+                        continue
+                    try:
+                        result[stage] = probe()
+                    except Exception as e:
+                        logger.warning(f"{stage.upper()} probe failed on {name}: {e}")
+                        result[stage] = {"error": str(e)}
+                    # Free the model before loading the next one
+                    gc.collect()
+                logger.info(f"{name}: {result}")
+                results.append(result)
+
+        stages = [stage for stage, enabled in (("asr", include_asr), ("llm", include_llm)) if enabled]
+        scored = self._score(results, stages)
+        logger.info(f"Turn time scored on: {', '.join(scored) or 'nothing'}")
+        calibration = {
+            "fingerprint": HardwareDetector._fingerprint(),
+            "calibrated_at": time.time(),
+            "scored_stages": scored,
+            "results": results
+        }
+        os.makedirs(os.path.dirname(self.results_path), exist_ok=True)
+        with open(self.results_path, 'w') as f:
+            json.dump(calibration, f, indent=4)
+        logger.info(f"Calibration saved to {self.results_path}")
+        return calibration
+
+def load_calibration(results_path=DEFAULT_RESULTS_PATH):
+    """Returns saved calibration results if they were measured on this machine, else None."""
+    try:
+        with open(results_path, 'r') as f:
+            calibration = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if calibration.get("fingerprint") != HardwareDetector._fingerprint():
+        logger.info("Backend calibration is from different hardware or libraries; ignoring it.")
+        return None
+    return calibration
+
+def best_backend(calibration):
+    """Returns (backend, openvino_device) with the lowest measured turn time, or None."""
+    measured = [r for r in calibration.get("results", []) if r.get("turn_seconds") is not None]
+    if not measured:
+        return None
+    best = min(measured, key=lambda r: r["turn_seconds"])
+    return best["backend"], best["openvino_device"]
+
+if __name__ == "__main__":
+    import yaml
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Measure ASR / LLM speed on every available backend.")
+    parser.add_argument("--config", default=os.path.join(os.path.dirname(__file__), '..', '..', 'configs', 'character_config.yaml'))
+    parser.add_argument("--output", default=DEFAULT_RESULTS_PATH)
+    parser.add_argument("--skip-asr", action="store_true")
+    parser.add_argument("--skip-llm", action="store_true")
+    parser.add_argument("--reprobe", action="store_true", help="Ignore the cached hardware probe")
+    args = parser.parse_args()
+
+    with open(args.config, 'r') as f:
+        config = yaml.safe_load(f)
+    hw_config = HardwareDetector(reprobe=args.reprobe).get_hardware_config()
+    calibration = BackendCalibrator(config, results_path=args.output).run(hw_config, not args.skip_asr, not args.skip_llm)
+    print("Fastest backend:", best_backend(calibration))
@@ -1,44 +1,158 @@
-import torch
-import cpuinfo
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
 import logging
 import platform
-
-try:
-    from openvino.runtime import Core
-    OPENVINO_AVAILABLE = True
-except ImportError:
-    OPENVINO_AVAILABLE = False
+import importlib.util
+from importlib import metadata
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Probe results are reused until the machine or the relevant libraries change
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(__file__), '..', '..', 'model_cache', 'hardware_probe.json')
+PROBE_VERSION = 1
+
+def reprobe_requested():
+    """True if the process was started with --reprobe (or RIKO_REPROBE=1)."""
+    return "--reprobe" in sys.argv or os.environ.get("RIKO_REPROBE") == "1"
+
+def _library_version(name):
+    try:
+        return metadata.version(name)
+    except metadata.PackageNotFoundError:
+        return None
+
 class HardwareDetector:
-    def __init__(self):
+    """
+    Picks the compute backend for this machine.
+
+    Probing imports torch, starts an OpenVINO Core and inspects the CPU, which takes
+    seconds, so results are cached in cache_path keyed by a fingerprint of the machine
+    and the installed torch / OpenVINO versions. reprobe (or --reprobe) ignores the cache.
+    torch is only imported when a GPU could actually be present.
+    """
+    def __init__(self, cache_path=DEFAULT_CACHE_PATH, reprobe=None):
+        self.cache_path = cache_path
         self.device_priority = []
-        self._detect_hardware()
+        self.modern_cpu = False
+        self.openvino_available = False
+
+        if reprobe is None:
+            reprobe = reprobe_requested()
+        fingerprint = self._fingerprint()
+        if reprobe or not self._load_cache(fingerprint):
+            start = time.time()
+            self._detect_hardware()
+            logger.info(f"Hardware probe took {time.time() - start:.2f}s")
+            self._save_cache(fingerprint)
+
+    @staticmethod
+    def _fingerprint():
+        """Cheap machine + library signature; no heavy imports."""
+        parts = {
+            "probe_version": PROBE_VERSION,
+            "system": platform.system(),
+            "release": platform.release(),
+            "machine": platform.machine(),
+            "processor": platform.processor(),
+            "cpu_count": os.cpu_count(),
+            "python": platform.python_version(),
+            "torch": _library_version("torch"),
+            "openvino": _library_version("openvino"),
+            "accelerators": sorted(p for p in ("/dev/nvidiactl", "/dev/kfd", "/dev/dxg", "/dev/accel/accel0", "/dev/dri/renderD128") if os.path.exists(p))
+        }
+        return hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest()
+
+    def _load_cache(self, fingerprint):
+        try:
+            with open(self.cache_path, 'r') as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if cached.get("fingerprint") != fingerprint:
+            logger.info("Hardware changed since the last probe; probing again.")
+            return False
+        self.device_priority = cached["priority_list"]
+        self.modern_cpu = cached["modern_cpu"]
+        self.openvino_available = cached["openvino_available"]
+        logger.info(f"Using cached hardware probe from {self.cache_path} (--reprobe to refresh).")
+        return True
+
+    def _save_cache(self, fingerprint):
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            with open(self.cache_path, 'w') as f:
+                json.dump({
+                    "fingerprint": fingerprint,
+                    "probed_at": time.time(),
+                    "priority_list": self.device_priority,
+                    "modern_cpu": self.modern_cpu,
+                    "openvino_available": self.openvino_available
+                }, f, indent=4)
+        except OSError as e:
+            logger.warning(f"Could not save hardware probe cache: {e}")
+
+    @staticmethod
+    def _gpu_possible():
+        """Whether torch could find a CUDA / ROCm / MPS device here, judged without importing it."""
+        if importlib.util.find_spec("torch") is None:
+            return False
+        system = platform.system()
+        if system == "Darwin":
+            return platform.machine().lower() in ("arm64", "aarch64")
+        if system == "Linux":
+            # WSL2 exposes GPUs through /dev/dxg instead of the native device nodes
+            return any(os.path.exists(p) for p in ("/dev/nvidiactl", "/dev/kfd", "/dev/dxg")) or bool(shutil.which("nvidia-smi"))
+        # Windows and others: look for the vendor tools
+        return bool(shutil.which("nvidia-smi") or os.environ.get("HIP_PATH"))
+
+    @staticmethod
+    def _cpu_flags():
+        # /proc/cpuinfo is instant; py-cpuinfo is the slow, portable fallback
+        try:
+            with open("/proc/cpuinfo", 'r') as f:
+                for line in f:
+                    if line.startswith("flags"):
+                        return line.split(":", 1)[1].lower().split()
+        except OSError:
+            pass
+        import cpuinfo
+        return [f.lower() for f in cpuinfo.get_cpu_info().get('flags', [])]
 
     def _detect_hardware(self):
         # 1. Check for CUDA / ROCm (AMD GPU)
-        if torch.cuda.is_available():
-            if hasattr(torch.version, 'hip') and torch.version.hip:
-                logger.info("ROCm (AMD GPU) detected.")
-                self.device_priority.append("rocm")
-            else:
-                logger.info("CUDA (NVIDIA GPU) detected.")
-                self.device_priority.append("cuda")
-
-        # 2. Check for Apple Silicon (MPS)
-        if hasattr(torch.backends, 'mps') and torch.backends.mps.is_available():
-            logger.info("Apple Silicon (Metal Performance Shaders) detected!")
-            self.device_priority.append("mps")
+        if self._gpu_possible():
+            import torch
+
+            if torch.cuda.is_available():
+                if hasattr(torch.version, 'hip') and torch.version.hip:
+                    logger.info("ROCm (AMD GPU) detected.")
+                    self.device_priority.append("rocm")
+                else:
+                    logger.info("CUDA (NVIDIA GPU) detected.")
+                    self.device_priority.append("cuda")
+
+            # 2. Check for Apple Silicon (MPS)
+            if hasattr(torch.backends, 'mps') and torch.backends.mps.is_available():
+                logger.info("Apple Silicon (Metal Performance Shaders) detected!")
+                self.device_priority.append("mps")
+        else:
+            logger.info("No GPU runtime possible here; skipping torch import.")
 
         # 3. Check for OpenVINO (specifically Intel NPU / GPU)
-        if OPENVINO_AVAILABLE:
+        self.openvino_available = importlib.util.find_spec("openvino") is not None
+        if self.openvino_available:
             try:
+                from openvino.runtime import Core
+
                 core = Core()
                 devices = core.available_devices
                 logger.info(f"OpenVINO devices: {devices}")
-                
+
                 # Prioritize NPU for ultra-lite power consumption
                 if "NPU" in devices:
                     logger.info("⚡ Intel NPU detected! Activating Super-Lite Battery Saver Mode.")
@@ -51,11 +165,9 @@ class HardwareDetector:
                 logger.warning(f"Failed to initialize OpenVINO Core: {e}")
 
         # 4. Check CPU Architecture (AVX2 / ARM64)
-        info = cpuinfo.get_cpu_info()
-        flags = [f.lower() for f in info.get('flags', [])]
         arch = platform.machine().lower()
 
-        if 'avx2' in flags or 'arm64' in arch or 'aarch64' in arch:
+        if 'arm64' in arch or 'aarch64' in arch or 'avx2' in self._cpu_flags():
             logger.info(f"Modern CPU architecture detected ({arch} with AVX2/ARM).")
             self.modern_cpu = True
             self.device_priority.append("cpu_modern")
@@ -69,11 +181,11 @@ class HardwareDetector:
         # For 'super lite' mode, if NPU exists, use it first!
         if "openvino_npu" in self.device_priority:
             return "openvino"
-            
+
         if "cuda" in self.device_priority:
             return "cuda"
         elif "rocm" in self.device_priority:
-            return "rocm" 
+            return "rocm"
         elif "mps" in self.device_priority:
             return "mps"
         elif any(ov in self.device_priority for ov in ["openvino_gpu", "openvino_cpu"]):
@@ -96,9 +208,9 @@ class HardwareDetector:
         return {
             "backend": self.get_best_backend(),
             "openvino_device": self.get_openvino_device(),
-            "modern_cpu": getattr(self, 'modern_cpu', False),
+            "modern_cpu": self.modern_cpu,
             "priority_list": self.device_priority,
-            "openvino_available": OPENVINO_AVAILABLE
+            "openvino_available": self.openvino_available
         }
 
 if __name__ == "__main__":
@@ -0,0 +1,176 @@
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Seconds; covers memory lookups through long local generations
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+def _format_labels(key, extra=None):
+    items = list(key) + (extra or [])
+    if not items:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in items)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(items, escaped)) + "}"
+
+class _Histogram:
+    def __init__(self, help_text, buckets):
+        self.help = help_text
+        self.buckets = buckets
+        self.series = {}
+
+    def observe(self, key, value):
+        counts, total = self.series.get(key, ([0] * len(self.buckets), [0, 0.0]))
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+        total[0] += 1
+        total[1] += value
+        self.series[key] = (counts, total)
+
+    def render(self, name):
+        lines = [f"# HELP {name} {self.help}", f"# TYPE {name} histogram"]
+        for key, (counts, (count, total)) in sorted(self.series.items()):
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(f"{name}_bucket{_format_labels(key, [('le', bound)])} {bucket_count}")
+            lines.append(f"{name}_bucket{_format_labels(key, [('le', '+Inf')])} {count}")
+            lines.append(f"{name}_sum{_format_labels(key)} {total}")
+            lines.append(f"{name}_count{_format_labels(key)} {count}")
+        return lines
+
+class _Counter:
+    def __init__(self, help_text):
+        self.help = help_text
+        self.series = {}
+
+    def inc(self, key, value):
+        self.series[key] = self.series.get(key, 0) + value
+
+    def render(self, name):
+        lines = [f"# HELP {name} {self.help}", f"# TYPE {name} counter"]
+        lines += [f"{name}{_format_labels(key)} {value}" for key, value in sorted(self.series.items())]
+        return lines
+
+class _Span:
+    """Handle yielded by Metrics.span(); attributes end up on the trace span (if tracing is on)."""
+    def __init__(self, otel_span):
+        self.otel_span = otel_span
+        self.attributes = {}
+
+    def set(self, key, value):
+        self.attributes[key] = value
+        if self.otel_span is not None:
+            self.otel_span.set_attribute(key, value)
+
+class Metrics:
+    """
+    Per-stage timing for the chat pipeline, rendered in the Prometheus text format.
+
+    span(stage) times a block into riko_stage_duration_seconds{stage=...} and, once
+    enable_tracing() succeeded, also opens an OpenTelemetry span with the same name.
+    Counters and extra histograms (tokens, time-to-first-token, queue wait, cache
+    hits) are declared up front; collectors add gauges, or counters kept elsewhere,
+    that are read at scrape time.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+        self._collectors = []
+        self._tracer = None
+
+        self.histogram("riko_stage_duration_seconds", "Time spent in each pipeline stage.")
+        self.histogram("riko_llm_time_to_first_token_seconds", "Time from prompt submission to the first streamed token.")
+        self.histogram("riko_queue_wait_seconds", "Time requests waited for a worker pool slot.")
+        self.counter("riko_llm_tokens_total", "Prompt and completion tokens processed.")
+        self.counter("riko_cache_requests_total", "Cache lookups by cache and result (hit/miss).")
+        self.counter("riko_stage_errors_total", "Pipeline stages that raised.")
+
+    def histogram(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self._metrics[name] = _Histogram(help_text, buckets)
+
+    def counter(self, name, help_text):
+        self._metrics[name] = _Counter(help_text)
+
+    def observe(self, name, value, **labels):
+        with self._lock:
+            self._metrics[name].observe(_label_key(labels), value)
+
+    def inc(self, name, value=1, **labels):
+        with self._lock:
+            self._metrics[name].inc(_label_key(labels), value)
+
+    def cache(self, cache, hit):
+        self.inc("riko_cache_requests_total", cache=cache, result="hit" if hit else "miss")
+
+    def tokens(self, kind, count):
+        if count:
+            self.inc("riko_llm_tokens_total", count, kind=kind)
+
+    def add_collector(self, collect, kind="gauge"):
+        """collect() -> iterable of (name, help, {labels}, value), read on every scrape; kind is gauge or counter."""
+        self._collectors.append((collect, kind))
+
+    @contextmanager
+    def span(self, stage, **attributes):
+        if self._tracer is not None:
+            with self._tracer.start_as_current_span(stage) as otel_span:
+                yield from self._timed(stage, _Span(otel_span), attributes)
+        else:
+            yield from self._timed(stage, _Span(None), attributes)
+
+    def _timed(self, stage, span, attributes):
+        for key, value in attributes.items():
+            span.set(key, value)
+        start = time.perf_counter()
+        try:
+            yield span
+        except BaseException:
+            self.inc("riko_stage_errors_total", stage=stage)
+            raise
+        finally:
+            self.observe("riko_stage_duration_seconds", time.perf_counter() - start, stage=stage)
+
+    def enable_tracing(self, service_name="riko", endpoint=None):
+        """Exports spans over OTLP if the OpenTelemetry SDK is installed."""
+        try:
+            from opentelemetry import trace
+            from opentelemetry.sdk.resources import Resource
+            from opentelemetry.sdk.trace import TracerProvider
+            from opentelemetry.sdk.trace.export import BatchSpanProcessor
+            from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        except ImportError:
+            logger.warning("opentelemetry-sdk / exporter not installed; tracing stays off.")
+            return False
+
+        provider = TracerProvider(resource=Resource.create({"service.name": service_name}))
+        provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter(endpoint=endpoint) if endpoint else OTLPSpanExporter()))
+        trace.set_tracer_provider(provider)
+        self._tracer = trace.get_tracer("riko")
+        logger.info(f"OpenTelemetry tracing enabled ({endpoint or 'default OTLP endpoint'})")
+        return True
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for name, metric in self._metrics.items():
+                lines += metric.render(name)
+
+        collected = {}
+        for collect, kind in self._collectors:
+            try:
+                for name, help_text, labels, value in collect():
+                    collected.setdefault(name, (help_text, kind, []))[2].append((_label_key(labels), value))
+            except Exception as e:
+                logger.error(f"Metrics collector failed: {e}")
+        for name, (help_text, kind, series) in collected.items():
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+            lines += [f"{name}{_format_labels(key)} {value}" for key, value in series]
+        return "\n".join(lines) + "\n"
+
+# Process-wide instance shared by RikoCore, the worker pools and the API
+metrics = Metrics()
@@ -0,0 +1,181 @@
+import gc
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Providers that hold no weights in this process
+REMOTE_PROVIDERS = ("openai", "gemini", "ollama")
+
+class _Resident:
+    def __init__(self, provider, model, llm, size_mb):
+        self.provider = provider
+        self.model = model
+        self.llm = llm
+        self.size_mb = size_mb
+        self.loaded_at = time.time()
+        self.last_used = self.loaded_at
+
+class ModelPool:
+    """
+    Keeps recently used LLM providers loaded so switching back to one is instant.
+
+    Models are keyed by (provider, model path) and kept in LRU order. Each local model's
+    footprint is the process RSS growth while it loaded (or its file size without psutil);
+    once the total passes budget_mb, or more than max_models are resident, the least
+    recently used models other than the active one are dropped. Remote providers count
+    as zero toward the budget. preload() loads a model in the background.
+    """
+    def __init__(self, loader, budget_mb=None, max_models=3):
+        # loader(provider, model) -> LLMProvider
+        self.loader = loader
+        self.budget_mb = budget_mb
+        self.max_models = max_models
+        self.active = None
+        self._models = OrderedDict()
+        self._loading = {}
+        self._lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="riko-preload")
+
+    @staticmethod
+    def _rss_mb():
+        try:
+            import psutil
+            return psutil.Process().memory_info().rss / (1 << 20)
+        except ImportError:
+            return None
+
+    @staticmethod
+    def _file_size_mb(model):
+        if os.path.isdir(model):
+            total = sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(model) for f in files)
+        elif os.path.exists(model):
+            total = os.path.getsize(model)
+        else:
+            return 0
+        return total / (1 << 20)
+
+    def _load(self, provider, model):
+        """Loads one model; concurrent requests for the same key wait for the first load."""
+        key = (provider, model)
+        with self._lock:
+            if key in self._models:
+                return self._models[key]
+            event = self._loading.get(key)
+            if event is None:
+                self._loading[key] = threading.Event()
+        if event is not None:
+            event.wait()
+            with self._lock:
+                if key in self._models:
+                    return self._models[key]
+            # The other load failed; try ourselves
+            return self._load(provider, model)
+
+        try:
+            rss_before = self._rss_mb()
+            start = time.time()
+            llm = self.loader(provider, model)
+            size_mb = 0
+            if provider not in REMOTE_PROVIDERS:
+                rss_after = self._rss_mb()
+                size_mb = self._file_size_mb(model)
+                if rss_before is not None:
+                    size_mb = max(size_mb, rss_after - rss_before)
+            logger.info(f"Loaded {provider}:{model} in {time.time() - start:.1f}s (~{size_mb:.0f} MB)")
+            resident = _Resident(provider, model, llm, size_mb)
+            with self._lock:
+                self._models[key] = resident
+            return resident
+        finally:
+            with self._lock:
+                self._loading.pop(key).set()
+
+    def get(self, provider, model):
+        """Returns the provider for (provider, model), loading it if needed, and makes it the active one."""
+        with self._lock:
+            metrics.cache("model_pool", (provider, model) in self._models)
+        resident = self._load(provider, model)
+        with self._lock:
+            resident.last_used = time.time()
+            self.active = (provider, model)
+            self._models.move_to_end(self.active)
+        self._enforce_budget()
+        return resident.llm
+
+    def preload(self, provider, model):
+        """Loads a model in the background without activating it. Returns a Future."""
+        def _preload():
+            try:
+                self._load(provider, model)
+                self._enforce_budget()
+            except Exception as e:
+                logger.error(f"Failed to preload {provider}:{model}: {e}")
+                raise
+        return self.executor.submit(_preload)
+
+    def _over_budget(self):
+        if len(self._models) > self.max_models:
+            return True
+        if self.budget_mb is None:
+            return False
+        return sum(r.size_mb for r in self._models.values()) > self.budget_mb
+
+    def _enforce_budget(self):
+        evicted = []
+        with self._lock:
+            while self._over_budget():
+                victim = next((key for key in self._models if key != self.active), None)
+                if victim is None:
+                    break
+                evicted.append(self._models.pop(victim))
+        while evicted:
+            resident = evicted.pop()
+            logger.info(f"Evicted {resident.provider}:{resident.model} (~{resident.size_mb:.0f} MB) from the model pool.")
+            if hasattr(resident.llm, "close"):
+                resident.llm.close()
+            # Local backends free their weights once the last reference is gone
+            del resident
+            gc.collect()
+
+    def evict(self, provider, model):
+        with self._lock:
+            if (provider, model) == self.active:
+                return False
+            resident = self._models.pop((provider, model), None)
+        if resident is None:
+            return False
+        if hasattr(resident.llm, "close"):
+            resident.llm.close()
+        return True
+
+    def resident(self):
+        """The loaded providers, most recently used first."""
+        with self._lock:
+            return [r.llm for r in reversed(self._models.values())]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "budget_mb": self.budget_mb,
+                "max_models": self.max_models,
+                "resident_mb": round(sum(r.size_mb for r in self._models.values())),
+                "loading": [{"provider": p, "model": m} for p, m in self._loading],
+                "models": [
+                    {
+                        "provider": r.provider,
+                        "model": r.model,
+                        "size_mb": round(r.size_mb),
+                        "active": key == self.active,
+                        "loaded_at": r.loaded_at,
+                        "last_used": r.last_used
+                    }
+                    for key, r in reversed(self._models.items())
+                ]
+            }
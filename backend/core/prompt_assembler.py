@@ -0,0 +1,115 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Rough per-message overhead of chat templates (role markers, separators)
+MESSAGE_OVERHEAD = 4
+
+# System blocks RikoCore used to append to the history itself; older clients may still send them back
+INJECTED_PREFIXES = ("[System Memory:", "[System: User's clipboard", "[System: The user's current clipboard")
+
+class PromptAssembler:
+    """
+    Rebuilds the prompt from stable parts every turn and fits it to a token budget.
+
+    Layout: one system message (persona, actions, facts), the running conversation
+    summary, the most recent turns that fit, then the user message with retrieved
+    memories. Persona and the user's text always go in; facts, summary, actions,
+    memories and clipboard are added in that order while they fit, and the remaining
+    budget is filled with turns from newest to oldest.
+    The stable persona/actions prefix comes first so local backends can reuse it.
+    """
+    def __init__(self, count_tokens, budget):
+        self.count_tokens = count_tokens
+        self.budget = budget
+        # Estimated size of the last assembled prompt
+        self.used_tokens = 0
+
+    def _cost(self, text):
+        return self.count_tokens(text) + MESSAGE_OVERHEAD if text else 0
+
+    @staticmethod
+    def split_history(history):
+        """Returns (persona, turns) from a stored history, dropping stale injected system blocks."""
+        persona = None
+        turns = []
+        for m in history or []:
+            content = m.get("content", "")
+            if m.get("role") == "system":
+                if not isinstance(content, str):
+                    content = " ".join(item.get("text", "") for item in content)
+                if persona is None and not turns:
+                    persona = content
+                    continue
+                if content.lstrip().startswith(INJECTED_PREFIXES) or "virtual assistant" in content:
+                    continue
+            turns.append(m)
+        return persona, turns
+
+    def _fit_memories(self, memories, remaining):
+        """Keeps as many memory lines (best match first) as fit in the remaining budget."""
+        kept = []
+        for line in memories.splitlines():
+            cost = self.count_tokens(line) + 1
+            if cost > remaining:
+                break
+            kept.append(line)
+            remaining -= cost
+        return "\n".join(kept)
+
+    def assemble(self, persona, user_text, turns=None, actions=None, facts=None, memories=None, clipboard=None, summary=None):
+        remaining = self.budget - self._cost(persona) - self._cost(user_text)
+        if remaining < 0:
+            logger.warning(f"Persona and user message alone exceed the prompt budget ({self.budget} tokens).")
+
+        # Facts win over actions when space is short, but the stable pieces go first in the layout
+        included = set()
+        summary_msg = f"[Conversation summary so far: {summary}]" if summary else None
+        for name, part in (("facts", facts), ("summary", summary_msg), ("actions", actions)):
+            if part and self._cost(part) <= remaining:
+                included.add(name)
+                remaining -= self._cost(part)
+        system_parts = [persona]
+        if "actions" in included:
+            system_parts.append(actions)
+        if "facts" in included:
+            system_parts.append(facts)
+
+        final_user_msg = user_text
+        if memories:
+            header = "Relevant past memories:\n"
+            fitted = self._fit_memories(memories, remaining - self._cost(header))
+            if fitted:
+                final_user_msg = f"{header}{fitted}\n\nUser's current message: {user_text}"
+                remaining -= self._cost(final_user_msg) - self._cost(user_text)
+
+        clipboard_msg = None
+        if clipboard:
+            clipboard_msg = f"[System: User's clipboard: '{clipboard[:500]}']"
+            if self._cost(clipboard_msg) <= remaining:
+                remaining -= self._cost(clipboard_msg)
+            else:
+                clipboard_msg = None
+
+        recent = []
+        for m in reversed(turns or []):
+            content = m.get("content", "")
+            cost = self._cost(content if isinstance(content, str) else " ".join(item.get("text", "") for item in content))
+            if cost > remaining:
+                break
+            recent.append(m)
+            remaining -= cost
+        recent.reverse()
+        dropped = len(turns or []) - len(recent)
+        if dropped:
+            logger.info(f"Prompt budget {self.budget}: dropped {dropped} oldest turns.")
+
+        prompt = [{"role": "system", "content": "\n\n".join(p.strip() for p in system_parts if p)}]
+        if "summary" in included:
+            prompt.append({"role": "system", "content": summary_msg})
+        prompt.extend(recent)
+        if clipboard_msg:
+            prompt.append({"role": "system", "content": clipboard_msg})
+        prompt.append({"role": "user", "content": final_user_msg})
+        self.used_tokens = self.budget - remaining
+        return prompt
@@ -1,7 +1,10 @@
 import os
+import re
 import yaml
+import time
 import uuid
 import logging
+import threading
 from pathlib import Path
 
 # Fix path to allow local imports
@@ -12,12 +15,23 @@ if parent_dir not in sys.path:
     sys.path.append(parent_dir)
 
 from core.hardware import HardwareDetector
+from core.calibration import load_calibration, best_backend
 from managers.model_manager import ModelManager
 from providers.asr.asr_factory import ASRFactory
 from providers.llm.llm_factory import LLMFactory
 from managers.memory_manager import MemoryManager
+from managers.memory_store import create_memory_store
+from managers.memory_compactor import MemoryCompactor
+from managers.embeddings import create_embedding_function
 from managers.fact_manager import FactManager
 from managers.action_manager import ActionManager
+from core.session_manager import SessionManager
+from core.model_pool import ModelPool
+from core.subsystems import SubsystemRegistry
+from core.metrics import metrics
+from core.prompt_assembler import PromptAssembler
+from managers.conversation_store import ConversationStore
+from managers.summary_manager import ConversationSummarizer
 
 logger = logging.getLogger(__name__)
 
@@ -30,129 +44,454 @@ class RikoCore:
         with open(config_path, 'r') as f:
             self.config = yaml.safe_load(f)
 
-        # Hardware Detection
+        self.system_prompt_content = self.config['presets']['default']['system_prompt']
+        self.system_prompt = [{"role": "system", "content": self.system_prompt_content}]
+
+        self.mm = ModelManager()
+        self.asr_path = self.config.get('local_asr_path', 'base.en')
+        self.llm_path = self.config.get('local_llm_path', 'models/riko-llm')
+        # Resolved once hardware detection finishes (see _init_llm)
+        self.llm_provider = self.config.get('llm_provider', 'auto')
+        self.real_llm_path = None
+        self._llm = None
+        self.compactor = None
+
+        # Loaded providers stay warm (within a memory budget) so switching back is instant
+        pool_config = self.config.get('model_pool', {})
+        self.model_pool = ModelPool(
+            self._load_llm,
+            budget_mb=pool_config.get('budget_mb'),
+            max_models=pool_config.get('max_models', 3)
+        )
+
+        # Server-side, append-only conversation history
+        conversations_path = os.path.join(os.path.dirname(__file__), '..', '..', self.config.get('conversation_db', 'conversations.db'))
+        self.conversations = ConversationStore(db_path=conversations_path)
+
+        # Rolling summaries of older turns, optionally with a separate small model (attached once loaded)
+        summary_config = self.config.get('summary', {})
+        self.summarizer = ConversationSummarizer(
+            store=self.conversations,
+            threshold_tokens=summary_config.get('threshold_tokens'),
+            keep_recent=summary_config.get('keep_recent', 6)
+        )
+
+        # Per-session history, VRM state and cancellation (bounded by LRU + TTL)
+        session_config = self.config.get('sessions', {})
+        self.sessions = SessionManager(
+            self.system_prompt,
+            store=self.conversations,
+            max_sessions=session_config.get('max_sessions', 64),
+            ttl=session_config.get('ttl', 3600),
+            on_evict=self._release_llm_session
+        )
+        self._switch_lock = threading.Lock()
+
+        # Heavy subsystems load concurrently in the background; the ones listed in
+        # startup.lazy wait for their first use. Progress is reported by /ready.
+        lazy = set(self.config.get('startup', {}).get('lazy', ['asr']))
+        self.subsystems = SubsystemRegistry()
+        self.subsystems.register("hardware", self._init_hardware)
+        self.subsystems.register("asr", self._init_asr, depends_on=["hardware"], lazy="asr" in lazy)
+        self.subsystems.register("llm", self._init_llm, depends_on=["hardware"], lazy="llm" in lazy)
+        self.subsystems.register("memory", self._init_memory, depends_on=["hardware"], lazy="memory" in lazy)
+        self.subsystems.register("facts", self._init_facts, lazy="facts" in lazy)
+        # Action Manager (Virtual Assistant Features)
+        self.subsystems.register("actions", ActionManager, lazy="actions" in lazy)
+        if summary_config.get('llm_provider'):
+            self.subsystems.register("summary_llm", lambda: self._init_summary_llm(summary_config), depends_on=["hardware"], lazy="summary_llm" in lazy)
+        self.subsystems.start()
+
+    def _init_hardware(self):
         self.detector = HardwareDetector()
         self.hw_config = self.detector.get_hardware_config()
-        
+
         self.backend = self.config.get('backend_preference', 'auto')
         if self.backend == 'auto':
             self.backend = self.hw_config['backend']
+            # Measured speed beats the fixed priority order (see core/calibration.py)
+            if self.config.get('calibration', {}).get('use_results', True):
+                calibration = load_calibration()
+                fastest = best_backend(calibration) if calibration else None
+                if fastest:
+                    self.backend, device = fastest
+                    if device:
+                        self.hw_config['openvino_device'] = device
+                    logger.info(f"Using calibrated backend {self.backend} ({device or 'default device'})")
+        return self.hw_config
 
-        # Initialize ASR
-        self.asr_path = self.config.get('local_asr_path', 'base.en')
-        self.asr = ASRFactory.create_asr(self.backend, self.asr_path)
+    def _init_asr(self):
+        return ASRFactory.create_asr(self.backend, self.asr_path, openvino_device=self.hw_config.get('openvino_device', 'CPU'))
 
-        # Initialize LLM
-        self.mm = ModelManager()
-        self.llm_path = self.config.get('local_llm_path', 'models/riko-llm')
-        
-        self.llm_provider = self.config.get('llm_provider', 'auto')
-        if self.llm_provider == 'auto':
+    def _init_llm(self):
+        llm_provider = self.llm_provider
+        if llm_provider == 'auto':
             if self.backend == 'cuda':
-                self.llm_provider = "openai"
+                llm_provider = "openai"
             elif self.backend == 'openvino':
-                self.llm_provider = "openvino"
+                llm_provider = "openvino"
             elif self.backend in ['mps', 'rocm', 'cpu_modern']:
-                self.llm_provider = "llama_cpp"
+                llm_provider = "llama_cpp"
             else:
-                self.llm_provider = "cpu_legacy"
+                llm_provider = "cpu_legacy"
 
-        if self.llm_provider in ["openvino", "cpu_legacy", "llama_cpp"]:
-            self.real_llm_path = self.mm.find_model(self.llm_path, self.llm_provider)
+        if llm_provider in ["openvino", "cpu_legacy", "llama_cpp"]:
+            real_llm_path = self.mm.find_model(self.llm_path, llm_provider)
         else:
-            self.real_llm_path = self.config['model']
+            real_llm_path = self.config['model']
 
-        self.api_key = self.config.get('OPENAI_API_KEY')
-        if self.llm_provider == "gemini":
-            self.api_key = self.config.get('GEMINI_API_KEY')
+        with self._switch_lock:
+            # A switch_model() that finished first wins; loading the default would make it the pool's active model again
+            if self._llm is not None:
+                llm = self._llm
+            else:
+                llm = self.model_pool.get(llm_provider, real_llm_path)
+                self._llm = llm
+                self.llm_provider = llm_provider
+                self.real_llm_path = real_llm_path
+        for entry in self.config.get('model_pool', {}).get('preload', []):
+            self.preload_model(entry['provider'], entry.get('model'))
+        return llm
 
-        self.llm = LLMFactory.create_llm(
-            self.llm_provider, 
-            self.real_llm_path, 
-            api_key=self.api_key, 
-            openvino_device=self.hw_config.get('openvino_device', 'CPU')
+    def _init_memory(self):
+        # Memory & History, relative to the project root
+        db_path = os.path.join(os.path.dirname(__file__), '..', '..', self.config.get('memory_db', 'chroma_db'))
+        memory_config = self.config.get('memory', {})
+        embedding_function = create_embedding_function(
+            memory_config.get('embedding'), self.backend, self.hw_config.get('openvino_device', 'CPU'),
+            store=memory_config.get('store', 'chroma')
+        )
+        memory = MemoryManager(
+            db_path=db_path,
+            flush_size=memory_config.get('flush_size', 16),
+            flush_interval=memory_config.get('flush_interval', 2.0),
+            embedding_function=embedding_function,
+            query_cache_size=memory_config.get('query_cache_size', 256),
+            store=create_memory_store(memory_config, db_path, embedding_function),
+            hybrid=memory_config.get('hybrid', True),
+            retrieval=memory_config.get('retrieval')
         )
 
-        # Memory & History - Fixed paths
-        db_path = os.path.join(os.path.dirname(__file__), '..', '..', 'chroma_db')
-        self.memory_db = MemoryManager(db_path=db_path)
-        
+        # Retention: summarize and cap old memories in the background (uses the summary model if one is configured)
+        compaction_config = dict(memory_config.get('compaction', {}))
+        if compaction_config.pop('enabled', False):
+            use_llm = compaction_config.pop('use_llm', True)
+            self.compactor = MemoryCompactor(
+                memory,
+                state_path=f"{os.path.normpath(db_path)}.compaction.json",
+                get_llm=(lambda: self.summarizer.llm) if use_llm else None,
+                **compaction_config
+            )
+            self.compactor.start()
+        return memory
+
+    def _init_facts(self):
         # Fact Manager (Mem0 Style)
-        facts_path = os.path.join(os.path.dirname(__file__), '..', '..', 'configs', 'user_facts.json')
-        self.fact_manager = FactManager(storage_path=facts_path)
-        
-        # Action Manager (Virtual Assistant Features)
-        self.action_manager = ActionManager()
-        
-        self.system_prompt_content = self.config['presets']['default']['system_prompt']
-        self.system_prompt = [{"role": "system", "content": self.system_prompt_content}]
+        facts_path = os.path.join(os.path.dirname(__file__), '..', '..', self.config.get('user_facts', 'configs/user_facts.json'))
+        return FactManager(storage_path=facts_path)
+
+    def _init_summary_llm(self, summary_config):
+        self.summarizer.llm = self._create_summary_llm(summary_config)
+        return self.summarizer.llm
+
+    @property
+    def asr(self):
+        return self.subsystems.get("asr")
+
+    @property
+    def llm(self):
+        if self._llm is None:
+            self.subsystems.get("llm")
+        return self._llm
+
+    @llm.setter
+    def llm(self, llm):
+        self._llm = llm
+
+    @property
+    def memory_db(self):
+        return self.subsystems.get("memory")
+
+    @property
+    def fact_manager(self):
+        return self.subsystems.get("facts")
+
+    @property
+    def action_manager(self):
+        return self.subsystems.get("actions")
+
+    @property
+    def api_key(self):
+        return self._api_key(self.llm_provider)
+
+    def _llm_options(self, provider, model_path=None):
+        """Backend-specific settings from the `llama_cpp` / `openvino` config sections."""
+        if provider == "openvino":
+            options = dict(self.config.get('openvino', {}))
+        elif provider in ["cpu_legacy", "llama_cpp", "mps", "rocm", "cpu_modern"]:
+            options = dict(self.config.get('llama_cpp', {}))
+        else:
+            return {}
+
+        # draft_model: "auto" looks for <model>-draft next to the model, anything else names one
+        draft_model = options.pop('draft_model', None)
+        if draft_model and model_path:
+            options['draft_model_path'] = self.mm.find_draft_model(
+                model_path, provider, None if draft_model == "auto" else draft_model
+            )
+        return options
+
+    def _create_summary_llm(self, summary_config):
+        provider = summary_config['llm_provider']
+        model_path = summary_config.get('model', self.config.get('model'))
+        if provider in ["openvino", "cpu_legacy", "llama_cpp"]:
+            model_path = self.mm.find_model(model_path, provider)
+        api_key = self.config.get('GEMINI_API_KEY') if provider == "gemini" else self.config.get('OPENAI_API_KEY')
+        try:
+            return LLMFactory.create_llm(
+                provider,
+                model_path,
+                api_key=api_key,
+                openvino_device=self.hw_config.get('openvino_device', 'CPU'),
+                llm_options=self._llm_options(provider)
+            )
+        except Exception as e:
+            logger.warning(f"Failed to load summary model, falling back to the active LLM: {e}")
+            return None
+
+    def _api_key(self, provider):
+        """Returns the correct API key for the provider."""
+        if provider == "gemini":
+            return self.config.get('GEMINI_API_KEY')
+        if provider == "ollama":
+            return None
+        return self.config.get('OPENAI_API_KEY')
+
+    def _load_llm(self, provider, model_path):
+        """ModelPool loader: builds a provider from scratch."""
+        return LLMFactory.create_llm(
+            provider,
+            model_path,
+            api_key=self._api_key(provider),
+            openvino_device=self.hw_config.get('openvino_device', 'CPU'),
+            llm_options=self._llm_options(provider, model_path),
+            batching=self.config.get('llm_batching')
+        )
 
     def switch_model(self, provider, model_name=None):
-        """Switches the active LLM provider and model."""
+        """Switches the active LLM provider and model, reusing it if it is still loaded."""
         logger.info(f"Switching LLM to Provider: {provider}, Model: {model_name}")
         
-        self.llm_provider = provider
-        if model_name:
-            self.real_llm_path = model_name
-        else:
-            self.real_llm_path = self.config.get('model', 'gpt-3.5-turbo')
-
-        # Get the correct API key for the provider
-        api_key = self.config.get('OPENAI_API_KEY')
-        if self.llm_provider == "gemini":
-            api_key = self.config.get('GEMINI_API_KEY')
-        elif self.llm_provider == "ollama":
-            api_key = None 
-
-        self.llm = LLMFactory.create_llm(
-            self.llm_provider, 
-            self.real_llm_path, 
-            api_key=api_key, 
-            openvino_device=self.hw_config.get('openvino_device', 'CPU')
-        )
+        real_llm_path = model_name or self.config.get('model', 'gpt-3.5-turbo')
+        self.subsystems.get("hardware")
+
+        with self._switch_lock:
+            llm = self.model_pool.get(provider, real_llm_path)
+            # Swap only once the new model loaded; in-flight turns keep their own reference
+            self.llm = llm
+            self.llm_provider = provider
+            self.real_llm_path = real_llm_path
         return f"Successfully switched to {provider} ({self.real_llm_path})"
 
-    def chat(self, user_text, history=None, use_memory=True, use_clipboard=False):
-        if history is None:
-            history = list(self.system_prompt)
+    def preload_model(self, provider, model_name=None):
+        """Loads a model into the pool in the background so a later switch is instant."""
+        real_llm_path = model_name or self.config.get('model', 'gpt-3.5-turbo')
+        logger.info(f"Preloading LLM {provider} ({real_llm_path})")
+        self.subsystems.get("hardware")
+        return self.model_pool.preload(provider, real_llm_path)
 
-        # Ensure Action Capabilities are in the system prompt
-        if not any("virtual assistant" in msg.get("content", "") for msg in history if msg.get("role") == "system"):
-            history.append({"role": "system", "content": self.action_manager.get_system_prompt_addition()})
+    def _release_llm_session(self, session_id):
+        """Frees per-session backend state (KV cache) once a session leaves memory, in every loaded model."""
+        llms = self.model_pool.resident()
+        if self._llm is not None and all(llm is not self._llm for llm in llms):
+            llms.append(self._llm)
+        for llm in llms:
+            if llm.supports_sessions:
+                llm.reset_session(session_id)
 
-        # Inject Core Facts
-        history.append({"role": "system", "content": self.fact_manager.get_fact_prompt()})
+    @staticmethod
+    def _session_kwargs(llm, conversation_id):
+        """Lets backends that keep per-session state (e.g. OpenVINO KV cache) know which session this is."""
+        if conversation_id is not None and llm.supports_sessions:
+            return {"session_id": conversation_id}
+        return {}
 
-        final_user_msg = user_text
+    def _prompt_budget(self, llm):
+        """Prompt tokens allowed for this model: its context window minus the reply reserve, capped by config."""
+        configured = self.config.get('max_prompt_tokens')
+        if llm.context_window:
+            budget = llm.context_window - llm.reply_reserve
+            return min(budget, configured) if configured else budget
+        return configured or 8192
+
+    def _prepare_history(self, user_text, history, use_memory, use_clipboard, llm, conversation_id=None):
+        """
+        Builds this turn's prompt from stable parts (persona, actions, facts, summary,
+        memories, recent turns) fitted to the model's token budget. The durable history
+        is not modified, so injected blocks are never re-sent with it.
+        """
+        persona, turns = PromptAssembler.split_history(history if history is not None else self.system_prompt)
+
+        summary = None
+        if conversation_id is not None:
+            summary, turns = self.summarizer.apply(conversation_id, turns)
+
+        memories = None
         if use_memory:
-            past_context = self.memory_db.get_context(user_text, n_results=3)
-            if past_context:
-                final_user_msg = f"Relevant past memories:\n{past_context}\n\nUser's current message: {user_text}"
+            with metrics.span("memory_retrieval"):
+                memories = self.memory_db.get_context(user_text, n_results=3)
 
+        clip_text = None
         if use_clipboard:
             try:
                 import pyperclip
                 clip_text = pyperclip.paste()
-                if clip_text and clip_text.strip():
-                    history.append({"role": "system", "content": f"[System: User's clipboard: '{clip_text[:500]}']"})
             except:
                 pass
 
-        history.append({"role": "user", "content": final_user_msg})
-        raw_response = self.llm.generate(history)
-        
+        with metrics.span("prompt_assembly") as span:
+            assembler = PromptAssembler(llm.count_tokens, self._prompt_budget(llm))
+            prompt = assembler.assemble(
+                persona or self.system_prompt_content,
+                user_text,
+                turns=turns,
+                actions=self.action_manager.get_system_prompt_addition(),
+                facts=self.fact_manager.get_fact_prompt(),
+                memories=memories,
+                clipboard=clip_text if clip_text and clip_text.strip() else None,
+                summary=summary
+            )
+            span.set("prompt_tokens", assembler.used_tokens)
+        metrics.tokens("prompt", assembler.used_tokens)
+        return prompt
+
+    def _finish_turn(self, user_text, raw_response, history, llm):
+        """Records the turn and returns (clean_response, history + the turn's messages)."""
         # Parse and execute any actions
-        clean_response, action_result = self.action_manager.parse_and_execute(raw_response)
-        
-        self.memory_db.add_memory(user_text, "user")
-        self.memory_db.add_memory(clean_response, "assistant")
-        
-        # Update Core Facts autonomously
-        import threading
-        threading.Thread(target=self.fact_manager.extract_and_update, args=(user_text, clean_response, self.llm)).start()
+        with metrics.span("action_parsing"):
+            clean_response, action_result = self.action_manager.parse_and_execute(raw_response)
+
+        with metrics.span("memory_write"):
+            self.memory_db.add_memory(user_text, "user")
+            self.memory_db.add_memory(clean_response, "assistant")
+
+        # Update Core Facts autonomously (and count the reply's tokens) off the response path
+        threading.Thread(target=self._after_turn, args=(user_text, raw_response, clean_response, llm)).start()
         
+        history = list(self.system_prompt) if history is None else list(history)
+        history.append({"role": "user", "content": user_text})
         history.append({"role": "assistant", "content": clean_response})
         if action_result:
             history.append({"role": "system", "content": f"[Action Result: {action_result}]"})
             
         return clean_response, history
+
+    def _after_turn(self, user_text, raw_response, clean_response, llm):
+        metrics.tokens("completion", llm.count_tokens(raw_response))
+        with metrics.span("fact_extraction"):
+            self.fact_manager.extract_and_update(user_text, clean_response, llm)
+
+    def _commit_session_turn(self, session, history):
+        """Persists the messages a turn added and returns them with their seq numbers."""
+        turn = history[len(session.history):]
+        seq = self.conversations.append(session.session_id, turn)
+        session.history = history
+
+        # Fold older turns into the running summary once they take up half the budget
+        llm = self.llm
+        _, turns = PromptAssembler.split_history(history)
+        self.summarizer.maybe_summarize(session.session_id, turns, llm, llm.count_tokens, self._prompt_budget(llm) // 2)
+
+        first = seq - len(turn) + 1
+        return [{"seq": first + i, **m} for i, m in enumerate(turn)]
+
+    def chat(self, user_text, history=None, use_memory=True, use_clipboard=False, session_id=None):
+        """
+        Returns (clean_response, history). With session_id the history is kept server-side
+        (see ConversationStore) and only this turn's new messages, with their seq numbers,
+        are returned in place of the full history.
+        """
+        if session_id is not None:
+            session = self.sessions.get_or_create(session_id)
+            with session.lock:
+                session.cancel_event.clear()
+                clean_response, history = self._chat(user_text, session.history, use_memory, use_clipboard, session.session_id)
+                return clean_response, self._commit_session_turn(session, history)
+
+        return self._chat(user_text, history, use_memory, use_clipboard)
+
+    def _chat(self, user_text, history, use_memory, use_clipboard, conversation_id=None):
+        llm = self.llm
+        prompt = self._prepare_history(user_text, history, use_memory, use_clipboard, llm, conversation_id)
+        with metrics.span("llm_generate", provider=self.llm_provider, stream=False) as span:
+            start = time.perf_counter()
+            raw_response = llm.generate(prompt, **self._session_kwargs(llm, conversation_id))
+            # Without streaming the first token arrives with the whole reply
+            metrics.observe("riko_llm_time_to_first_token_seconds", time.perf_counter() - start, stream="false")
+            span.set("response_chars", len(raw_response))
+        return self._finish_turn(user_text, raw_response, history, llm)
+
+    def chat_stream(self, user_text, history=None, use_memory=True, use_clipboard=False, session_id=None):
+        """
+        Same as chat(), but yields the reply as text deltas while the LLM produces it.
+        [ACTION: ...] tags are held back from the stream. The generator's return value
+        is (clean_response, history), available via `yield from` or StopIteration.value.
+        If the session is interrupted mid-reply, generation stops, the turn is not
+        recorded and clean_response is None.
+        """
+        if session_id is not None:
+            session = self.sessions.get_or_create(session_id)
+            with session.lock:
+                session.cancel_event.clear()
+                clean_response, history = yield from self._chat_stream(
+                    user_text, session.history, use_memory, use_clipboard, session.cancel_event, session.session_id
+                )
+                if clean_response is None:
+                    return None, []
+                return clean_response, self._commit_session_turn(session, history)
+
+        return (yield from self._chat_stream(user_text, history, use_memory, use_clipboard))
+
+    def _chat_stream(self, user_text, history, use_memory, use_clipboard, cancel_event=None, conversation_id=None):
+        llm = self.llm
+        prompt = self._prepare_history(user_text, history, use_memory, use_clipboard, llm, conversation_id)
+
+        tag = "[ACTION:"
+        raw_response = ""
+        emitted = 0
+        start = time.perf_counter()
+        first_token = None
+        stream = llm.generate_stream(prompt, **self._session_kwargs(llm, conversation_id))
+        try:
+            for delta in stream:
+                if cancel_event is not None and cancel_event.is_set():
+                    logger.info("Generation interrupted.")
+                    return None, history
+                if first_token is None:
+                    first_token = time.perf_counter() - start
+                    metrics.observe("riko_llm_time_to_first_token_seconds", first_token, stream="true")
+                raw_response += delta
+                # Only emit text that can't be the start of an action tag
+                tag_pos = raw_response.find(tag)
+                if tag_pos != -1:
+                    safe_end = tag_pos
+                else:
+                    safe_end = len(raw_response)
+                    for k in range(min(len(tag) - 1, len(raw_response)), 0, -1):
+                        if raw_response.endswith(tag[:k]):
+                            safe_end = len(raw_response) - k
+                            break
+                if safe_end > emitted:
+                    yield raw_response[emitted:safe_end]
+                    emitted = safe_end
+        finally:
+            stream.close()
+            # Spans can't straddle yields cleanly, so the stream's timing is recorded by hand
+            metrics.observe("riko_stage_duration_seconds", time.perf_counter() - start, stage="llm_generate")
+
+        clean_response, history = self._finish_turn(user_text, raw_response, history, llm)
+        # Flush whatever was held back, minus the action tag itself
+        tail = re.sub(r'\[ACTION:\s*({.*?})\s*\]', "", raw_response[emitted:])
+        if tail.strip():
+            yield tail.rstrip()
+        return clean_response, history
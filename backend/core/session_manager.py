@@ -0,0 +1,131 @@
+import time
+import uuid
+import logging
+import threading
+from collections import OrderedDict
+
+from providers.vrm.vrm_controller import VRMController
+
+logger = logging.getLogger(__name__)
+
+class Session:
+    """Everything that belongs to one user's conversation rather than to the process."""
+    def __init__(self, session_id, system_prompt, stored_messages=None):
+        self.session_id = session_id
+        self.history = list(system_prompt) + [{"role": m["role"], "content": m["content"]} for m in stored_messages or []]
+        self.vrm = VRMController()
+        # Set by /interrupt; cleared at the start of each turn
+        self.cancel_event = threading.Event()
+        # Serializes turns within a session so concurrent requests can't interleave history
+        self.lock = threading.RLock()
+        self.created_at = time.time()
+        self.last_used = self.created_at
+
+class SessionManager:
+    """
+    Keeps per-session state keyed by session ID.
+    Bounded by LRU (max_sessions) and idle TTL (ttl seconds) so memory stays flat.
+    With a ConversationStore, the session ID doubles as the conversation ID: evicted
+    sessions are reloaded from the store on their next request.
+    """
+    def __init__(self, system_prompt, store=None, max_sessions=64, ttl=3600, on_evict=None):
+        self.system_prompt = system_prompt
+        self.store = store
+        # Called with the session_id whenever a session leaves memory (expiry, LRU, remove)
+        self.on_evict = on_evict
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _busy(session):
+        """True while another thread is in the middle of a turn on this session."""
+        if not session.lock.acquire(blocking=False):
+            return True
+        session.lock.release()
+        return False
+
+    def _evict_expired(self, now):
+        """Drops idle sessions (under self._lock) and returns their IDs for _notify_evict."""
+        expired = [sid for sid, s in self._sessions.items() if now - s.last_used > self.ttl and not self._busy(s)]
+        for sid in expired:
+            logger.info(f"Session {sid} expired after {self.ttl}s idle.")
+            del self._sessions[sid]
+        return expired
+
+    def _evict_lru(self, keep):
+        """Trims to max_sessions, oldest first, skipping `keep` and sessions mid-turn; returns the evicted IDs."""
+        evicted = []
+        for sid, session in list(self._sessions.items()):
+            if len(self._sessions) <= self.max_sessions:
+                break
+            if sid == keep or self._busy(session):
+                continue
+            del self._sessions[sid]
+            logger.info(f"Session {sid} evicted (LRU, max {self.max_sessions}).")
+            evicted.append(sid)
+        return evicted
+
+    def _notify_evict(self, session_id):
+        if self.on_evict is None:
+            return
+        try:
+            self.on_evict(session_id)
+        except Exception as e:
+            logger.error(f"Eviction hook failed for session {session_id}: {e}")
+
+    def get(self, session_id):
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None:
+                session.last_used = time.time()
+                self._sessions.move_to_end(session_id)
+            return session
+
+    def get_or_create(self, session_id=None):
+        """
+        Returns the session for session_id, creating it (with a fresh ID if none given) when missing.
+        Blocking (history is read from the store); eviction hooks run after the lock is released.
+        """
+        if session_id is None:
+            session_id = uuid.uuid4().hex
+        with self._lock:
+            evicted = self._evict_expired(time.time())
+            session = self._sessions.get(session_id)
+
+        if session is None:
+            # Read history outside the lock so other lookups don't wait on SQLite
+            stored = self.store.get_messages(session_id) if self.store else None
+            loaded = Session(session_id, self.system_prompt, stored)
+            with self._lock:
+                # Another request may have created it in the meantime
+                session = self._sessions.setdefault(session_id, loaded)
+                evicted += self._evict_lru(keep=session_id)
+
+        with self._lock:
+            if session_id in self._sessions:
+                self._sessions.move_to_end(session_id)
+            session.last_used = time.time()
+
+        for sid in evicted:
+            self._notify_evict(sid)
+        return session
+
+    def cancel(self, session_id):
+        session = self.get(session_id)
+        if session is None:
+            return False
+        session.cancel_event.set()
+        return True
+
+    def remove(self, session_id):
+        with self._lock:
+            removed = self._sessions.pop(session_id, None) is not None
+        if removed:
+            self._notify_evict(session_id)
+        return removed
+
+    def stats(self):
+        with self._lock:
+            return {"active": len(self._sessions), "max_sessions": self.max_sessions, "ttl": self.ttl}
@@ -0,0 +1,96 @@
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+class _Subsystem:
+    def __init__(self, name, loader, depends_on, lazy):
+        self.name = name
+        self.loader = loader
+        self.depends_on = tuple(depends_on)
+        self.lazy = lazy
+        self.thread = None
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+        self.started_at = None
+        self.seconds = None
+
+class SubsystemRegistry:
+    """
+    Initializes RikoCore's subsystems concurrently instead of one after another.
+
+    Each subsystem loads on its own thread once the subsystems it depends on are up.
+    Eager ones start with start(); lazy ones start the first time get() asks for them.
+    get() blocks until the subsystem is ready and re-raises its load error, and
+    status() reports per-subsystem state for the readiness endpoint.
+    """
+    def __init__(self):
+        self._subsystems = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, loader, depends_on=(), lazy=False):
+        self._subsystems[name] = _Subsystem(name, loader, depends_on, lazy)
+
+    def start(self):
+        """Starts loading every eager subsystem in the background."""
+        for subsystem in self._subsystems.values():
+            if not subsystem.lazy:
+                self._launch(subsystem)
+
+    def _launch(self, subsystem):
+        with self._lock:
+            if subsystem.thread is not None:
+                return
+            subsystem.started_at = time.time()
+            subsystem.thread = threading.Thread(target=self._load, args=(subsystem,), name=f"riko-init-{subsystem.name}", daemon=True)
+            subsystem.thread.start()
+
+    def _load(self, subsystem):
+        try:
+            for dependency in subsystem.depends_on:
+                self.get(dependency)
+            start = time.time()
+            subsystem.value = subsystem.loader()
+            subsystem.seconds = time.time() - start
+            logger.info(f"Subsystem {subsystem.name} ready in {subsystem.seconds:.1f}s")
+        except Exception as e:
+            subsystem.error = e
+            logger.error(f"Subsystem {subsystem.name} failed to initialize: {e}")
+        finally:
+            subsystem.done.set()
+
+    def get(self, name):
+        """Returns the subsystem's value, loading it first if it is lazy and not started yet."""
+        subsystem = self._subsystems[name]
+        self._launch(subsystem)
+        subsystem.done.wait()
+        if subsystem.error is not None:
+            raise RuntimeError(f"{name} is unavailable: {subsystem.error}") from subsystem.error
+        return subsystem.value
+
+    def is_ready(self, name):
+        subsystem = self._subsystems[name]
+        return subsystem.done.is_set() and subsystem.error is None
+
+    def ready(self):
+        """True once every eager subsystem has loaded."""
+        return all(self.is_ready(s.name) for s in self._subsystems.values() if not s.lazy)
+
+    def status(self):
+        status = {}
+        for subsystem in self._subsystems.values():
+            if subsystem.done.is_set():
+                state = "failed" if subsystem.error is not None else "ready"
+            elif subsystem.thread is not None:
+                state = "loading"
+            else:
+                state = "lazy" if subsystem.lazy else "pending"
+            entry = {"state": state, "lazy": subsystem.lazy}
+            if subsystem.seconds is not None:
+                entry["seconds"] = round(subsystem.seconds, 2)
+            if subsystem.error is not None:
+                entry["error"] = str(subsystem.error)
+            status[subsystem.name] = entry
+        return status
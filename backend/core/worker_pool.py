@@ -0,0 +1,167 @@
+import time
+import asyncio
+import logging
+import threading
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+from core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+class PoolSaturatedError(Exception):
+    """Raised when a stage already has as much work queued as it is allowed to hold."""
+    def __init__(self, stage):
+        super().__init__(f"The {stage} stage is busy, try again shortly.")
+        self.stage = stage
+
+class StagePool:
+    """
+    Bounded worker pool for one pipeline stage (ASR, LLM, TTS).
+
+    Blocking calls run on the pool's threads so the event loop stays free.
+    At most `workers` jobs run at once and `max_queue` more may wait; anything
+    beyond that is rejected with PoolSaturatedError instead of piling up.
+    """
+    def __init__(self, name, workers=1, max_queue=8):
+        self.name = name
+        self.workers = workers
+        self.max_queue = max_queue
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"riko-{name}")
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def _acquire(self):
+        with self._lock:
+            if self._pending >= self.workers + self.max_queue:
+                raise PoolSaturatedError(self.name)
+            self._pending += 1
+
+    def check(self):
+        """Raises PoolSaturatedError if the stage could not take another job right now."""
+        with self._lock:
+            if self._pending >= self.workers + self.max_queue:
+                raise PoolSaturatedError(self.name)
+
+    def _release(self):
+        with self._lock:
+            self._pending -= 1
+
+    async def run(self, fn, *args, **kwargs):
+        """Runs a blocking callable on the pool and awaits its result."""
+        self._acquire()
+        queued_at = time.perf_counter()
+
+        def call():
+            metrics.observe("riko_queue_wait_seconds", time.perf_counter() - queued_at, stage=self.name)
+            return fn(*args, **kwargs)
+
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, call)
+        finally:
+            self._release()
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Queues a blocking call from synchronous code and returns its Future, with the
+        same admission limit as run(); raises PoolSaturatedError when the stage is full.
+        """
+        self._acquire()
+        queued_at = time.perf_counter()
+
+        def call():
+            metrics.observe("riko_queue_wait_seconds", time.perf_counter() - queued_at, stage=self.name)
+            return fn(*args, **kwargs)
+
+        try:
+            future = self.executor.submit(call)
+        except Exception:
+            self._release()
+            raise
+        future.add_done_callback(lambda _: self._release())
+        return future
+
+    @asynccontextmanager
+    async def admit(self):
+        """Admission control only, for stages whose work is already async."""
+        self._acquire()
+        try:
+            yield
+        finally:
+            self._release()
+
+    def stream(self, make_generator):
+        """
+        Drives a blocking generator on the pool and returns an async iterator over
+        its items. The slot is reserved immediately, so saturation surfaces before
+        a response is started. Closing the async iterator stops the producer.
+        """
+        self._acquire()
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        stop = threading.Event()
+        done = object()
+        queued_at = time.perf_counter()
+
+        def produce():
+            metrics.observe("riko_queue_wait_seconds", time.perf_counter() - queued_at, stage=self.name)
+            gen = make_generator()
+            try:
+                for item in gen:
+                    if stop.is_set():
+                        break
+                    loop.call_soon_threadsafe(queue.put_nowait, item)
+            except Exception as e:
+                logger.error(f"{self.name} stream failed: {e}")
+            finally:
+                gen.close()
+                loop.call_soon_threadsafe(queue.put_nowait, done)
+
+        def on_done(_):
+            self._release()
+
+        try:
+            self.executor.submit(produce).add_done_callback(on_done)
+        except Exception:
+            self._release()
+            raise
+
+        async def consume():
+            try:
+                while True:
+                    item = await queue.get()
+                    if item is done:
+                        return
+                    yield item
+            finally:
+                stop.set()
+
+        return consume()
+
+    def stats(self):
+        with self._lock:
+            pending = self._pending
+        return {
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "in_flight": min(pending, self.workers),
+            "queued": max(pending - self.workers, 0)
+        }
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+def create_stage_pools(config=None):
+    """Builds the ASR / LLM / TTS pools from the `api_pools` section of the character config."""
+    config = config or {}
+    defaults = {
+        "asr": {"workers": 1, "max_queue": 4},
+        "llm": {"workers": 2, "max_queue": 8},
+        "tts": {"workers": 2, "max_queue": 8}
+    }
+    pools = {}
+    for stage, settings in defaults.items():
+        settings = {**settings, **(config.get(stage) or {})}
+        pools[stage] = StagePool(stage, workers=settings["workers"], max_queue=settings["max_queue"])
+    return pools
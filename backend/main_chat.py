@@ -4,6 +4,7 @@ import yaml
 import uuid
 import logging
 import pyperclip
+import threading
 from pathlib import Path
 
 # Fix path to allow importing from backend
@@ -11,13 +12,18 @@ import sys
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from providers.asr.asr_continuous import listen_continuously
-from providers.tts.sovits_ping import sovits_gen, play_audio
+from providers.tts.sovits_ping import play_audio
+from providers.tts.tts_pipeline import TTSPipeline
 
 from core.hardware import HardwareDetector
 from managers.model_manager import ModelManager
 from providers.asr.asr_factory import ASRFactory
 from providers.llm.llm_factory import LLMFactory
 from managers.memory_manager import MemoryManager
+from managers.memory_store import create_memory_store
+from managers.embeddings import create_embedding_function
+from managers.conversation_store import ConversationStore
+from managers.summary_manager import ConversationSummarizer
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -76,7 +82,11 @@ if llm_backend == "gemini":
 
 logger.info(f"Initializing LLM: {llm_backend} with {real_llm_path}")
 try:
-    llm = LLMFactory.create_llm(llm_backend, real_llm_path, api_key=api_key, openvino_device=hw_config.get('openvino_device', 'CPU'))
+    llm_options = dict(config.get('openvino', {}) if llm_backend == "openvino" else config.get('llama_cpp', {}))
+    draft_model = llm_options.pop('draft_model', None)
+    if draft_model and llm_backend in ["openvino", "cpu_legacy", "llama_cpp"]:
+        llm_options['draft_model_path'] = mm.find_draft_model(real_llm_path, llm_backend, None if draft_model == "auto" else draft_model)
+    llm = LLMFactory.create_llm(llm_backend, real_llm_path, api_key=api_key, openvino_device=hw_config.get('openvino_device', 'CPU'), llm_options=llm_options)
 except Exception as e:
     logger.error(f"Failed to initialize LLM: {e}")
     exit(1)
@@ -84,13 +94,43 @@ except Exception as e:
 # History Management
 HISTORY_FILE = config['history_file']
 SYSTEM_PROMPT = [{"role": "system", "content": config['presets']['default']['system_prompt']}]
-memory_db = MemoryManager(db_path="chroma_db")
+
+# Long-term memory, built from the config like RikoCore does (numpy store needs no chromadb)
+memory_config = config.get('memory', {})
+memory_path = os.path.join(os.path.dirname(__file__), '..', config.get('memory_db', 'chroma_db'))
+embedding_function = create_embedding_function(
+    memory_config.get('embedding'), backend, hw_config.get('openvino_device', 'CPU'),
+    store=memory_config.get('store', 'chroma')
+)
+memory_db = MemoryManager(
+    db_path=memory_path,
+    flush_size=memory_config.get('flush_size', 16),
+    flush_interval=memory_config.get('flush_interval', 2.0),
+    embedding_function=embedding_function,
+    query_cache_size=memory_config.get('query_cache_size', 256),
+    store=create_memory_store(memory_config, memory_path, embedding_function),
+    hybrid=memory_config.get('hybrid', True),
+    retrieval=memory_config.get('retrieval')
+)
+
+# Older turns get folded into a running summary instead of being resent forever
+TERMINAL_CONVERSATION = "terminal"
+summary_config = config.get('summary', {})
+summarizer = ConversationSummarizer(
+    store=ConversationStore(db_path=config.get('conversation_db', 'conversations.db')),
+    threshold_tokens=summary_config.get('threshold_tokens', 1500),
+    keep_recent=summary_config.get('keep_recent', 6)
+)
 
 def load_history():
+    history = list(SYSTEM_PROMPT)
     if os.path.exists(HISTORY_FILE):
         with open(HISTORY_FILE, "r") as f:
-            return json.load(f)
-    return list(SYSTEM_PROMPT)
+            history = json.load(f)
+    if len(history) <= 1:
+        # Deleted or reset history: the stored summary (keyed by the fixed id) belongs to the old one
+        summarizer.reset(TERMINAL_CONVERSATION)
+    return history
 
 def save_history(history):
     with open(HISTORY_FILE, "w") as f:
@@ -121,7 +161,14 @@ while True:
     if not user_spoken_text:
         continue
 
-    messages = load_history()
+    history = load_history()
+    turns = history[1:]
+    summary, recent_turns = summarizer.apply(TERMINAL_CONVERSATION, turns)
+    messages = history[:1]
+    if summary:
+        messages.append({"role": "system", "content": f"[Conversation summary so far: {summary}]"})
+    messages.extend(recent_turns)
+
     past_context = memory_db.get_context(user_spoken_text, n_results=3)
     if past_context:
         context_msg = f"Relevant past memories:\n{past_context}\n\nUser's current message: {user_spoken_text}"
@@ -138,27 +185,44 @@ while True:
     except Exception:
         pass
 
+    # Sentences are synthesized as they stream in and played back in order,
+    # so Riko starts talking after the first sentence instead of the whole reply.
+    pipeline = TTSPipeline(prefix="output")
+
+    def play_segments():
+        for _, _, segment_path in pipeline.iter_segments():
+            if not segment_path:
+                continue
+            try:
+                play_audio(segment_path)
+            except Exception as e:
+                logger.error(f"Playback failed: {e}")
+
+    player = threading.Thread(target=play_segments, daemon=True)
+    player.start()
+
     try:
-        response = llm.generate(messages)
-        print(f"Riko: {response}")
+        response = ""
+        print("Riko: ", end="", flush=True)
+        for delta in llm.generate_stream(messages):
+            response += delta
+            print(delta, end="", flush=True)
+            pipeline.feed(delta)
+        print()
     except Exception as e:
         logger.error(f"LLM Generation failed: {e}")
+        pipeline.cancel()
         continue
+    finally:
+        pipeline.close()
 
-    messages.append({"role": "assistant", "content": response})
-    save_history(messages)
+    history.append({"role": "user", "content": user_spoken_text})
+    history.append({"role": "assistant", "content": response})
+    save_history(history)
+    summarizer.maybe_summarize(TERMINAL_CONVERSATION, history[1:], llm, llm.count_tokens)
     memory_db.add_memory(user_spoken_text, "user")
     memory_db.add_memory(response, "assistant")
 
-    uid = uuid.uuid4().hex
-    filename = f"output_{uid}.wav"
-    output_wav_path = Path("audio") / filename
-    output_wav_path.parent.mkdir(parents=True, exist_ok=True)
-
-    try:
-        gen_aud_path = sovits_gen(response, str(output_wav_path))
-        play_audio(str(output_wav_path))
-    except Exception as e:
-        logger.error(f"TTS failed: {e}")
+    player.join()
 
     [fp.unlink() for fp in Path("audio").glob("*.wav") if fp.is_file()]
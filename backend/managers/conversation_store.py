@@ -0,0 +1,135 @@
+import time
+import json
+import sqlite3
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+class ConversationStore:
+    """
+    Append-only, server-side chat history in SQLite.
+
+    Each conversation is an ordered list of messages addressed by (conversation_id, seq).
+    Turns only ever append, so callers can sync by asking for messages after the last
+    seq they already have instead of shipping the whole history around.
+    """
+    def __init__(self, db_path="conversations.db"):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS messages (
+                conversation_id TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                role TEXT NOT NULL,
+                content TEXT NOT NULL,
+                content_type TEXT NOT NULL DEFAULT 'text',
+                created_at REAL NOT NULL,
+                PRIMARY KEY (conversation_id, seq)
+            );
+            CREATE TABLE IF NOT EXISTS summaries (
+                conversation_id TEXT PRIMARY KEY,
+                covered INTEGER NOT NULL,
+                summary TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            );
+        """)
+        self._migrate()
+        self.conn.commit()
+
+    def _migrate(self):
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(messages)")]
+        if "content_type" in columns:
+            return
+        # Databases from before content_type: mark the rows that were stored as JSON lists, once
+        self.conn.execute("ALTER TABLE messages ADD COLUMN content_type TEXT NOT NULL DEFAULT 'text'")
+        rows = self.conn.execute("SELECT conversation_id, seq, content FROM messages WHERE content LIKE '[{%'").fetchall()
+        json_rows = []
+        for conversation_id, seq, content in rows:
+            try:
+                if isinstance(json.loads(content), list):
+                    json_rows.append((conversation_id, seq))
+            except ValueError:
+                pass
+        self.conn.executemany("UPDATE messages SET content_type = 'json' WHERE conversation_id = ? AND seq = ?", json_rows)
+        logger.info(f"Added content_type to the conversation store ({len(json_rows)} JSON messages).")
+
+    @staticmethod
+    def _encode(content):
+        """Returns (stored text, content_type); list-based content (llm_scr.py style) is kept as JSON."""
+        if isinstance(content, str):
+            return content, "text"
+        return json.dumps(content), "json"
+
+    @staticmethod
+    def _decode(content, content_type):
+        return json.loads(content) if content_type == "json" else content
+
+    def append(self, conversation_id, messages):
+        """Appends messages and returns the conversation's new message count."""
+        now = time.time()
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT COALESCE(MAX(seq), 0) FROM messages WHERE conversation_id = ?", (conversation_id,)
+            ).fetchone()
+            seq = row[0]
+            rows = []
+            for m in messages:
+                seq += 1
+                content, content_type = self._encode(m.get("content", ""))
+                rows.append((conversation_id, seq, m["role"], content, content_type, now))
+            self.conn.executemany(
+                "INSERT INTO messages (conversation_id, seq, role, content, content_type, created_at) VALUES (?, ?, ?, ?, ?, ?)", rows
+            )
+            self.conn.commit()
+        return seq
+
+    def get_messages(self, conversation_id, since=0, limit=None):
+        """Returns messages with seq > since, oldest first."""
+        query = "SELECT seq, role, content, content_type FROM messages WHERE conversation_id = ? AND seq > ? ORDER BY seq"
+        params = [conversation_id, since]
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+        with self._lock:
+            rows = self.conn.execute(query, params).fetchall()
+        return [{"seq": seq, "role": role, "content": self._decode(content, content_type)} for seq, role, content, content_type in rows]
+
+    def count(self, conversation_id):
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT COALESCE(MAX(seq), 0) FROM messages WHERE conversation_id = ?", (conversation_id,)
+            ).fetchone()
+        return row[0]
+
+    def exists(self, conversation_id):
+        return self.count(conversation_id) > 0
+
+    def get_summary(self, conversation_id):
+        """Returns (covered, summary): how many turns the running summary folds in, and its text."""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT covered, summary FROM summaries WHERE conversation_id = ?", (conversation_id,)
+            ).fetchone()
+        return (row[0], row[1]) if row else (0, None)
+
+    def save_summary(self, conversation_id, covered, summary):
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO summaries (conversation_id, covered, summary, updated_at) VALUES (?, ?, ?, ?)",
+                (conversation_id, covered, summary, time.time())
+            )
+            self.conn.commit()
+
+    def delete(self, conversation_id):
+        with self._lock:
+            self.conn.execute("DELETE FROM messages WHERE conversation_id = ?", (conversation_id,))
+            self.conn.execute("DELETE FROM summaries WHERE conversation_id = ?", (conversation_id,))
+            self.conn.commit()
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
@@ -0,0 +1,151 @@
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Same weights as Chroma's default ONNX model, so vectors stay compatible with existing collections
+DEFAULT_EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+# Where Chroma unpacks that model; reused when it is already there
+CHROMA_MINILM_DIR = os.path.join(os.path.expanduser("~"), ".cache", "chroma", "onnx_models", "all-MiniLM-L6-v2", "onnx")
+
+def _mean_pool(hidden, attention_mask):
+    import numpy as np
+
+    mask = attention_mask[..., None].astype(hidden.dtype)
+    pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+    pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+    return [row.astype(np.float32) for row in pooled]
+
+class _PooledEmbeddingFunction:
+    """Chroma embedding function over a feature-extraction model: mean pooling + L2 normalization."""
+    def __init__(self, model, tokenizer, max_length=256):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.max_length = max_length
+
+    def __call__(self, input):
+        import numpy as np
+
+        inputs = self.tokenizer(list(input), padding=True, truncation=True, max_length=self.max_length, return_tensors="np")
+        return _mean_pool(np.asarray(self.model(**inputs).last_hidden_state), inputs["attention_mask"])
+
+class _MiniLMEmbeddingFunction:
+    """
+    Chroma's default MiniLM ONNX model on plain onnxruntime + tokenizers, so stores
+    other than Chroma don't need chromadb installed. Produces the same vectors.
+    """
+    def __init__(self, providers=None, max_length=256):
+        try:
+            import onnxruntime
+            from tokenizers import Tokenizer
+        except ImportError as e:
+            raise ImportError(
+                f"The numpy memory store embeds with onnxruntime + tokenizers ({e}); "
+                "install them (they are in requirements/potato_requirements.txt)"
+            ) from e
+
+        model_path, tokenizer_path = self._files()
+        self.tokenizer = Tokenizer.from_file(tokenizer_path)
+        self.tokenizer.enable_truncation(max_length=max_length)
+        self.tokenizer.enable_padding()
+        available = onnxruntime.get_available_providers()
+        providers = [p for p in (providers or []) if p in available] or ["CPUExecutionProvider"]
+        logger.info(f"Loading MiniLM embedding model from {model_path} ({providers[0]})")
+        self.session = onnxruntime.InferenceSession(model_path, providers=providers)
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    @staticmethod
+    def _files():
+        """(model.onnx, tokenizer.json): Chroma's copy if present, else the Hub's ONNX export."""
+        if os.path.isfile(os.path.join(CHROMA_MINILM_DIR, "model.onnx")):
+            return os.path.join(CHROMA_MINILM_DIR, "model.onnx"), os.path.join(CHROMA_MINILM_DIR, "tokenizer.json")
+        from huggingface_hub import hf_hub_download
+
+        return (hf_hub_download(DEFAULT_EMBEDDING_MODEL, "onnx/model.onnx"),
+                hf_hub_download(DEFAULT_EMBEDDING_MODEL, "tokenizer.json"))
+
+    def __call__(self, input):
+        import numpy as np
+
+        encodings = self.tokenizer.encode_batch(list(input))
+        inputs = {
+            "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+            "attention_mask": np.array([e.attention_mask for e in encodings], dtype=np.int64),
+            "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64)
+        }
+        hidden = self.session.run(None, {k: v for k, v in inputs.items() if k in self.input_names})[0]
+        return _mean_pool(hidden, inputs["attention_mask"])
+
+def _openvino(model, device):
+    from optimum.intel import OVModelForFeatureExtraction
+    from transformers import AutoTokenizer
+
+    logger.info(f"Loading OpenVINO embedding model {model} on {device}")
+    ov_model = OVModelForFeatureExtraction.from_pretrained(
+        model,
+        # Hub IDs / plain checkpoints are converted on first load; IR folders load as-is
+        export=not _has_ir(model),
+        device=device,
+        ov_config={"PERFORMANCE_HINT": "LATENCY", "CACHE_DIR": "./model_cache"}
+    )
+    return _PooledEmbeddingFunction(ov_model, AutoTokenizer.from_pretrained(model))
+
+def _onnx(model, file_name, provider):
+    from optimum.onnxruntime import ORTModelForFeatureExtraction
+    from transformers import AutoTokenizer
+
+    logger.info(f"Loading ONNX embedding model {model} ({file_name or 'model.onnx'}, {provider})")
+    kwargs = {"provider": provider}
+    if file_name:
+        # e.g. model_quantized.onnx from `optimum-cli onnxruntime quantize`
+        kwargs["file_name"] = file_name
+    ort_model = ORTModelForFeatureExtraction.from_pretrained(model, **kwargs)
+    return _PooledEmbeddingFunction(ort_model, AutoTokenizer.from_pretrained(model))
+
+def _has_ir(model):
+    return os.path.isdir(model) and any(name.endswith(".xml") for name in os.listdir(model))
+
+def default_embedding_function(store="chroma", providers=None):
+    """The ONNX MiniLM model: Chroma's own for the Chroma store, a chromadb-free copy for the others."""
+    if store != 'numpy':
+        from chromadb.utils import embedding_functions
+
+        if providers:
+            return embedding_functions.ONNXMiniLM_L6_V2(preferred_providers=providers)
+        return embedding_functions.DefaultEmbeddingFunction()
+    return _MiniLMEmbeddingFunction(providers)
+
+def create_embedding_function(settings=None, backend=None, openvino_device="CPU", store="chroma"):
+    """
+    Picks the embedding model for memory search from the `memory.embedding` config.
+
+    provider "auto" follows the hardware backend: OpenVINO machines get an OpenVINO
+    model on the detected device, CUDA/ROCm get ONNX Runtime on the GPU, everything
+    else the ONNX MiniLM on CPU. "onnx" loads a (quantized) ONNX export from
+    `model`/`file_name`. Falls back to the default MiniLM if the runtime is missing;
+    chromadb is only imported when `store` is chroma.
+    """
+    settings = settings or {}
+    provider = settings.get('provider', 'auto')
+    model = settings.get('model', DEFAULT_EMBEDDING_MODEL)
+    if provider == 'auto':
+        if backend == 'openvino':
+            provider = 'openvino'
+        elif backend in ['cuda', 'rocm']:
+            provider = 'onnx_gpu'
+        else:
+            provider = 'default'
+
+    try:
+        if provider == 'openvino':
+            return _openvino(model, settings.get('device', openvino_device))
+        if provider == 'onnx':
+            return _onnx(model, settings.get('file_name'), settings.get('onnx_provider', "CPUExecutionProvider"))
+        if provider == 'onnx_gpu':
+            gpu = "ROCMExecutionProvider" if backend == 'rocm' else "CUDAExecutionProvider"
+            return default_embedding_function(store, [gpu, "CPUExecutionProvider"])
+    except ImportError as e:
+        logger.warning(f"Embedding provider {provider} unavailable ({e}); using the default model.")
+    except Exception as e:
+        logger.error(f"Failed to load {provider} embedding model: {e}; using the default model.")
+    return default_embedding_function(store)
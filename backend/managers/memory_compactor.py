@@ -0,0 +1,232 @@
+import os
+import json
+import time
+import logging
+import threading
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+class MemoryCompactor:
+    """
+    Background retention job for long-term memory.
+
+    Every interval it walks memories older than min_age_days in creation order
+    (memories stored before timestamps existed have no age and are left alone),
+    groups similar ones (greedy clustering on their embeddings, cosine >= similarity)
+    and replaces each group of at least min_cluster_size lines with one "summary"
+    memory: written by the summary LLM when get_llm() returns one, otherwise the
+    most central lines of the group. Then max_age_days and max_memories are enforced
+    by deleting the oldest dated memories (summaries only once no raw lines are
+    left to trim), and the store is vacuumed.
+
+    The job is resumable: a cursor (created_at, id) of the last finished batch is
+    saved to state_path, so a restart continues where it stopped. It is rate-limited:
+    it sleeps pause_seconds between batches and waits while chat queried memory in
+    the last idle_seconds.
+    """
+    def __init__(self, memory, state_path, get_llm=None, interval_minutes=60, min_age_days=14, similarity=0.75,
+                 min_cluster_size=3, batch_size=200, pause_seconds=1.0, idle_seconds=30, max_age_days=None, max_memories=None):
+        self.memory = memory
+        self.state_path = state_path
+        self.get_llm = get_llm
+        self.interval = interval_minutes * 60
+        self.min_age = min_age_days * 86400
+        self.similarity = similarity
+        self.min_cluster_size = min_cluster_size
+        self.batch_size = batch_size
+        self.pause_seconds = pause_seconds
+        self.idle_seconds = idle_seconds
+        self.max_age = max_age_days * 86400 if max_age_days else None
+        self.max_memories = max_memories
+        self.state = self._load_state()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _load_state(self):
+        try:
+            with open(self.state_path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_state(self):
+        tmp = self.state_path + ".tmp"
+        with open(tmp, 'w') as f:
+            json.dump(self.state, f)
+        os.replace(tmp, self.state_path)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="riko-memory-compactor", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+
+    def _loop(self):
+        # Pick up the schedule from the last run, so restarts don't trigger a run each time
+        delay = max(self.state.get('last_run', 0) + self.interval - time.time(), self.idle_seconds)
+        while not self._stop.wait(delay):
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"Memory compaction failed: {e}")
+            delay = self.interval
+
+    def _wait_turn(self):
+        """Pauses between steps and while chat is active; False once stop() was called."""
+        if self._stop.wait(self.pause_seconds):
+            return False
+        while time.time() - self.memory.last_query_at < self.idle_seconds:
+            if self._stop.wait(self.idle_seconds):
+                return False
+        return True
+
+    def run_once(self):
+        """One full pass: compaction, then caps, then vacuum. Returns what it did."""
+        start = time.time()
+        result = {"summarized": 0, "summaries": 0, "expired": 0, "trimmed": 0}
+        self.memory.flush()
+        self._compact(result)
+        self._enforce_caps(result)
+        if not self._stop.is_set() and (result["summarized"] or result["expired"] or result["trimmed"]):
+            self.memory.vacuum()
+
+        self.state['last_run'] = time.time()
+        self.state['last_result'] = result
+        self._save_state()
+        logger.info(f"Memory compaction done in {time.time() - start:.1f}s: {result}")
+        return result
+
+    def _entries(self):
+        """(created_at, id, role) for every stored memory, oldest first; memories without a timestamp sort first."""
+        return sorted(
+            ((metadata or {}).get('created_at', 0), doc_id, (metadata or {}).get('role'))
+            for doc_id, _, metadata in self.memory.store.documents()
+        )
+
+    def _compact(self, result):
+        cutoff = time.time() - self.min_age
+        cursor = tuple(self.state.get('cursor', (-1, "")))
+        candidates = [
+            (created_at, doc_id) for created_at, doc_id, role in self._entries()
+            if role != "summary" and (created_at, doc_id) > cursor and 0 < created_at <= cutoff
+        ]
+        for start in range(0, len(candidates), self.batch_size):
+            if not self._wait_turn():
+                return
+            batch = candidates[start:start + self.batch_size]
+            hits = self.memory.store.get([doc_id for _, doc_id in batch], include_embeddings=True)
+            for cluster in self._cluster(hits):
+                if len(cluster) >= self.min_cluster_size and self._replace(cluster):
+                    result["summarized"] += len(cluster)
+                    result["summaries"] += 1
+            # Only finished batches move the cursor; a stop mid-batch redoes what is left of it
+            self.state['cursor'] = list(batch[-1])
+            self._save_state()
+
+    def _cluster(self, hits):
+        """Greedy single pass: each memory joins the closest cluster centroid within `similarity`."""
+        clusters = []
+        centroids = []
+        for hit in hits:
+            vector = np.asarray(hit['embedding'], dtype=np.float32)
+            vector = vector / max(np.linalg.norm(vector), 1e-12)
+            hit['vector'] = vector
+            if centroids:
+                matrix = np.stack(centroids)
+                sims = matrix @ vector / np.clip(np.linalg.norm(matrix, axis=1), 1e-12, None)
+                best = int(np.argmax(sims))
+                if sims[best] >= self.similarity:
+                    clusters[best].append(hit)
+                    centroids[best] = centroids[best] + vector
+                    continue
+            clusters.append([hit])
+            centroids.append(vector)
+        return clusters
+
+    def _extractive(self, cluster, max_lines=3):
+        centroid = np.sum([hit['vector'] for hit in cluster], axis=0)
+        central = sorted(cluster, key=lambda hit: float(hit['vector'] @ centroid), reverse=True)[:max_lines]
+        # Back in chronological order
+        central.sort(key=lambda hit: hit['metadata'].get('created_at', 0))
+        lines = []
+        for hit in central:
+            text = " ".join(hit['document'].split())
+            lines.append(f"{hit['metadata'].get('role', 'user')}: {text[:200]}")
+        return " / ".join(lines)
+
+    def _summarize(self, cluster):
+        llm = self.get_llm() if self.get_llm else None
+        if llm is not None:
+            transcript = "\n".join(f"{hit['metadata'].get('role', 'user').capitalize()}: {hit['document']}" for hit in cluster)
+            try:
+                summary = llm.generate([
+                    {"role": "system", "content": "You are a precise memory summarizer."},
+                    {"role": "user", "content": (
+                        "These are related lines from old conversations between the user (senpai) and Riko.\n"
+                        "Summarize them in at most two sentences. Keep names, facts and preferences.\n\n"
+                        f"{transcript}\n\nReturn ONLY the summary."
+                    )}
+                ]).strip()
+                if summary:
+                    return summary
+            except Exception as e:
+                logger.warning(f"Summary model failed on a memory cluster, using extractive summary: {e}")
+        return self._extractive(cluster)
+
+    def _replace(self, cluster):
+        """Stores the cluster's summary, then deletes its members once the summary is confirmed written."""
+        summary_id = self.memory.add_memory(
+            self._summarize(cluster),
+            role="summary",
+            # The oldest original timestamp, so a summary never looks newer than what it replaced
+            created_at=min(hit['metadata']['created_at'] for hit in cluster),
+            metadata={"summarized": len(cluster)}
+        )
+        self.memory.flush()
+        if not summary_id or not self.memory.store.get([summary_id]):
+            logger.warning(f"Summary of {len(cluster)} memories was not stored; keeping the originals.")
+            return False
+        self.memory.delete([hit['id'] for hit in cluster if hit['id'] != summary_id])
+        return True
+
+    def _delete_in_batches(self, ids):
+        deleted = 0
+        for start in range(0, len(ids), self.batch_size):
+            if not self._wait_turn():
+                break
+            self.memory.delete(ids[start:start + self.batch_size])
+            deleted += len(ids[start:start + self.batch_size])
+        return deleted
+
+    def _enforce_caps(self, result):
+        if not self.max_age and not self.max_memories:
+            return
+        entries = self._entries()
+        expired = []
+        if self.max_age:
+            cutoff = time.time() - self.max_age
+            # Memories from before timestamps were stored have no age to judge
+            expired = [doc_id for created_at, doc_id, _ in entries if 0 < created_at < cutoff]
+            result["expired"] = self._delete_in_batches(expired)
+        if self.max_memories:
+            expired = set(expired)
+            # Undated memories have no age to judge here either; summaries go only after every raw line
+            remaining = [(role == "summary", created_at, doc_id) for created_at, doc_id, role in entries
+                         if created_at > 0 and doc_id not in expired]
+            remaining.sort()
+            excess = len(remaining) - self.max_memories
+            if excess > 0:
+                result["trimmed"] = self._delete_in_batches([doc_id for _, _, doc_id in remaining[:excess]])
+
+    def status(self):
+        return {
+            "running": self._thread is not None and self._thread.is_alive(),
+            "cursor": self.state.get('cursor'),
+            "last_run": self.state.get('last_run'),
+            "last_result": self.state.get('last_result')
+        }
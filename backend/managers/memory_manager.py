@@ -1,46 +1,206 @@
 import os
-import chromadb
+import time
+import atexit
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from .embeddings import default_embedding_function
+from .memory_store import ChromaMemoryStore, NumpyMemoryStore
+from .memory_retrieval import HybridRetriever
+
+logger = logging.getLogger(__name__)
 
 class MemoryManager:
-    def __init__(self, db_path="./chroma_db"):
-        # We use a persistent client so memories survive restarts
-        self.client = chromadb.PersistentClient(path=db_path)
-        self.collection = self.client.get_or_create_collection(name="long_term_memory")
-        
-    def add_memory(self, text, role="user"):
+    """
+    Long-term chat memory on top of a MemoryStore (a persistent Chroma collection
+    unless another store is passed in, see managers/memory_store.py).
+
+    Writes are write-behind: add_memory() only queues the line, and a background
+    thread upserts the queue in one batch once flush_size lines are waiting or
+    flush_interval seconds have passed (and on flush()/close()/exit). Embeddings
+    that get_context() already computed for a query are reused when the same text
+    is stored, so the user's line is not embedded twice. Queued lines become
+    searchable after the next flush.
+
+    Retrieval skips work where it can: query embeddings are kept in an LRU keyed by
+    normalized text, and the document count is cached and refreshed by the writer
+    instead of being asked from Chroma on every query. embedding_function swaps in
+    a faster model (see managers/embeddings.py); it must match the stored vectors.
+
+    With hybrid=True, get_context() ranks memories with HybridRetriever (vector +
+    BM25, recency decay, deduplication; see managers/memory_retrieval.py). The
+    lexical index is built from the store on a background thread at startup and
+    updated on every flush. retrieval holds the HybridRetriever options.
+
+    delete() and vacuum() exist for the retention job (managers/memory_compactor.py);
+    last_query_at tells it when chat last needed memory so it can stay out of the way.
+    """
+    def __init__(self, db_path="./chroma_db", flush_size=16, flush_interval=2.0, embedding_function=None, query_cache_size=256, store=None, hybrid=True, retrieval=None):
+        if embedding_function is None:
+            # The model Chroma uses anyway, held here so embeddings can be computed and reused
+            embedding_function = default_embedding_function("numpy" if isinstance(store, NumpyMemoryStore) else "chroma")
+        self.embedding_function = embedding_function
+        self.store = store or ChromaMemoryStore(db_path, embedding_function)
+        self._count = self.store.count()
+
+        self.retriever = None
+        if hybrid:
+            self.retriever = HybridRetriever(self.store, **(retrieval or {}))
+            threading.Thread(target=self.retriever.build, name="riko-memory-index", daemon=True).start()
+
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.query_cache_size = query_cache_size
+        self._pending = OrderedDict()
+        self._recent_embeddings = OrderedDict()
+        self._cache_hits = 0
+        self._cache_misses = 0
+        self._lock = threading.Lock()
+        # Serializes writers so flush() returns only once earlier queued lines are stored
+        self._flush_lock = threading.Lock()
+        self.last_query_at = 0.0
+        self._wake = threading.Event()
+        self._closed = False
+        self._flusher = threading.Thread(target=self._flush_loop, name="riko-memory-writer", daemon=True)
+        self._flusher.start()
+        atexit.register(self.close)
+
+    @staticmethod
+    def _normalize(text):
+        return " ".join(text.split()).lower()
+
+    def _embed_query(self, query):
+        """Returns the query's embedding, from the LRU cache when the same text was seen recently."""
+        key = self._normalize(query)
+        with self._lock:
+            embedding = self._recent_embeddings.get(key)
+            if embedding is not None:
+                self._recent_embeddings.move_to_end(key)
+                self._cache_hits += 1
+                return embedding
+            self._cache_misses += 1
+
+        embedding = self.embedding_function([query])[0]
+        with self._lock:
+            self._recent_embeddings[key] = embedding
+            while len(self._recent_embeddings) > self.query_cache_size:
+                self._recent_embeddings.popitem(last=False)
+        return embedding
+
+    def add_memory(self, text, role="user", created_at=None, metadata=None):
+        """Queues a line for the next batched write and returns its id; returns immediately."""
         if not text or not text.strip():
-            return
+            return None
         # Use a simple hash for doc_id
-        import hashlib
         doc_id = hashlib.md5((text + role).encode('utf-8')).hexdigest()
-        
-        # Check if it already exists
-        existing = self.collection.get(ids=[doc_id])
-        if not existing['ids']:
-            self.collection.add(
-                documents=[text],
-                metadatas=[{"role": role}],
-                ids=[doc_id]
-            )
-        
+        metadata = {**(metadata or {}), "role": role, "created_at": created_at or time.time()}
+
+        with self._lock:
+            embedding = self._recent_embeddings.get(self._normalize(text))
+            self._pending[doc_id] = (text, metadata, embedding)
+            full = len(self._pending) >= self.flush_size
+        if full:
+            self._wake.set()
+        return doc_id
+
+    def _flush_loop(self):
+        while not self._closed:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self):
+        """Writes all queued lines with a single upsert."""
+        with self._flush_lock:
+            self._flush()
+
+    def _flush(self):
+        with self._lock:
+            if not self._pending:
+                return
+            batch = list(self._pending.items())
+            self._pending.clear()
+
+        ids = [doc_id for doc_id, _ in batch]
+        documents = [text for _, (text, _, _) in batch]
+        metadatas = [metadata for _, (_, metadata, _) in batch]
+        embeddings = [embedding for _, (_, _, embedding) in batch]
+        try:
+            # Embed whatever wasn't seen as a query, in one call
+            missing = [i for i, e in enumerate(embeddings) if e is None]
+            if missing:
+                for i, embedding in zip(missing, self.embedding_function([documents[i] for i in missing])):
+                    embeddings[i] = embedding
+            self.store.upsert(ids, documents, metadatas, embeddings)
+            # Upserts may replace existing lines, so re-read the count here rather than on every query
+            self._count = self.store.count()
+            if self.retriever is not None:
+                self.retriever.add(ids, documents)
+        except Exception as e:
+            logger.error(f"Failed to write {len(batch)} memories: {e}")
+            with self._lock:
+                # Keep them for the next attempt, without overwriting newer copies
+                for doc_id, item in batch:
+                    self._pending.setdefault(doc_id, item)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._wake.set()
+        self._flusher.join(timeout=5)
+        self.flush()
+        self.store.close()
+
+    def delete(self, ids):
+        """Removes memories from the store (and from the write queue, if still pending)."""
+        with self._flush_lock:
+            with self._lock:
+                for doc_id in ids:
+                    self._pending.pop(doc_id, None)
+            self.store.delete(ids)
+            if self.retriever is not None:
+                self.retriever.remove(ids)
+            self._count = self.store.count()
+
+    def vacuum(self):
+        with self._flush_lock:
+            self.store.vacuum()
+
+    def count(self):
+        return self._count
+
+    def stats(self):
+        with self._lock:
+            return {
+                "memories": self._count,
+                "pending_writes": len(self._pending),
+                "query_cache_size": len(self._recent_embeddings),
+                "query_cache_hits": self._cache_hits,
+                "query_cache_misses": self._cache_misses,
+                "lexical_index_ready": self.retriever is not None and self.retriever.lexical_ready.is_set()
+            }
+
     def get_context(self, query, n_results=5):
         if not query or not query.strip():
             return ""
-        if self.collection.count() == 0:
+        self.last_query_at = time.time()
+        count = self._count
+        if count == 0:
             return ""
-            
-        # Query the vector database for relevant past memories
-        results = self.collection.query(
-            query_texts=[query],
-            n_results=min(n_results, self.collection.count())
-        )
-        
-        if not results['documents'] or not results['documents'][0]:
+
+        # Query the vector database (and the lexical index) for relevant past memories
+        if self.retriever is not None:
+            hits = self.retriever.search(query, self._embed_query(query), min(n_results, count))
+        else:
+            hits = self.store.query(self._embed_query(query), min(n_results, count))
+        if not hits:
             return ""
-            
+
         context_parts = []
-        for i, doc in enumerate(results['documents'][0]):
-            role = results['metadatas'][0][i]['role']
-            context_parts.append(f"[{role.capitalize()}]: {doc}")
-            
+        for hit in hits:
+            role = hit['metadata']['role']
+            context_parts.append(f"[{role.capitalize()}]: {hit['document']}")
+
         return "\n".join(context_parts)
@@ -0,0 +1,189 @@
+import re
+import math
+import time
+import logging
+import threading
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+# Kept small on purpose: names and short words like "cat" must stay searchable
+STOPWORDS = frozenset(
+    "a an and are as at be but by do does did for from had has have he her him his how i if in is it its "
+    "me my no not of on or our she so that the their them then there they this to us was we were what "
+    "when where which who why will with you your".split()
+)
+
+def tokenize(text):
+    return [t for t in TOKEN_PATTERN.findall(text.lower()) if t not in STOPWORDS]
+
+class BM25Index:
+    """
+    In-memory inverted index over memory lines, updated on every insert.
+
+    Postings map term -> {doc key: term frequency}; documents are keyed by small ints
+    so the postings stay compact. Terms found in more than half of all documents are
+    skipped at query time since their IDF contributes almost nothing, and terms with
+    more than common_df postings only add to documents a rarer query term matched.
+    """
+    def __init__(self, k1=1.2, b=0.75, common_df=2000):
+        self.k1 = k1
+        self.b = b
+        self.common_df = common_df
+        self._lock = threading.Lock()
+        self._postings = {}
+        self._keys = {}       # doc id -> key
+        self._ids = {}        # key -> doc id
+        self._lengths = {}    # key -> token count
+        self._terms = {}      # key -> distinct terms, for removal
+        self._next_key = 0
+        self._total_length = 0
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, doc_id):
+        return doc_id in self._keys
+
+    def add(self, doc_id, text):
+        tokens = tokenize(text)
+        counts = Counter(tokens)
+        with self._lock:
+            self._remove(doc_id)
+            key = self._next_key
+            self._next_key += 1
+            self._keys[doc_id] = key
+            self._ids[key] = doc_id
+            self._lengths[key] = len(tokens)
+            self._terms[key] = tuple(counts)
+            self._total_length += len(tokens)
+            for term, tf in counts.items():
+                self._postings.setdefault(term, {})[key] = tf
+
+    def remove(self, doc_id):
+        with self._lock:
+            self._remove(doc_id)
+
+    def _remove(self, doc_id):
+        key = self._keys.pop(doc_id, None)
+        if key is None:
+            return
+        del self._ids[key]
+        self._total_length -= self._lengths.pop(key)
+        for term in self._terms.pop(key):
+            postings = self._postings[term]
+            del postings[key]
+            if not postings:
+                del self._postings[term]
+
+    def search(self, query, k=10):
+        """Returns up to k (doc id, score) pairs, best first."""
+        terms = set(tokenize(query))
+        with self._lock:
+            n = len(self._keys)
+            if not n or not terms:
+                return []
+            avg_length = self._total_length / n or 1.0
+            scores = {}
+            # Rarest terms first: once they found candidates, common terms only re-score those
+            for postings in sorted(filter(None, (self._postings.get(term) for term in terms)), key=len):
+                df = len(postings)
+                if n > 10 and df > n / 2:
+                    continue
+                idf = math.log((n - df + 0.5) / (df + 0.5) + 1)
+                if scores and df > self.common_df:
+                    matches = [(key, postings[key]) for key in scores if key in postings]
+                else:
+                    matches = postings.items()
+                for key, tf in matches:
+                    norm = tf + self.k1 * (1 - self.b + self.b * self._lengths[key] / avg_length)
+                    scores[key] = scores.get(key, 0.0) + idf * tf * (self.k1 + 1) / norm
+            best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+            return [(self._ids[key], score) for key, score in best]
+
+class HybridRetriever:
+    """
+    Memory search that fuses vector and BM25 results.
+
+    Both lists are over-fetched (candidates x n_results), merged with reciprocal rank
+    fusion (1 / (rrf_k + rank) per list), then scaled by recency: a memory's score is
+    multiplied by (1 - recency_weight) + recency_weight * 0.5 ** (age / half-life),
+    using the created_at timestamp in its metadata (memories without one count as
+    old). Near-duplicates (token Jaccard >= dedup_threshold with a better hit) are
+    dropped. Until the lexical index has been built, search is vector-only.
+    """
+    def __init__(self, store, candidates=4, rrf_k=60, recency_half_life_days=30, recency_weight=0.3, dedup_threshold=0.8):
+        self.store = store
+        self.candidates = candidates
+        self.rrf_k = rrf_k
+        self.half_life = recency_half_life_days * 86400
+        self.recency_weight = recency_weight
+        self.dedup_threshold = dedup_threshold
+        self.lexical = BM25Index()
+        self.lexical_ready = threading.Event()
+
+    def build(self):
+        """Indexes everything already in the store; run once, off the request path."""
+        start = time.time()
+        try:
+            for doc_id, document, _ in self.store.documents():
+                if doc_id not in self.lexical:
+                    self.lexical.add(doc_id, document)
+        except Exception as e:
+            logger.error(f"Failed to build the lexical memory index: {e}")
+            return
+        self.lexical_ready.set()
+        logger.info(f"Lexical memory index ready: {len(self.lexical)} memories in {time.time() - start:.1f}s")
+
+    def add(self, ids, documents):
+        for doc_id, document in zip(ids, documents):
+            self.lexical.add(doc_id, document)
+
+    def remove(self, ids):
+        for doc_id in ids:
+            self.lexical.remove(doc_id)
+
+    def _recency(self, metadata, now):
+        created_at = (metadata or {}).get('created_at')
+        decay = 0.5 ** (max(now - created_at, 0) / self.half_life) if created_at and self.half_life else 0.0
+        return (1 - self.recency_weight) + self.recency_weight * decay
+
+    def _is_duplicate(self, tokens, kept):
+        return any(len(tokens & other) / len(tokens | other) >= self.dedup_threshold for other in kept)
+
+    def search(self, query, embedding, n_results):
+        """Returns up to n_results hits (id, document, metadata, score), best first."""
+        k = n_results * self.candidates
+        vector_hits = self.store.query(embedding, k)
+        lexical_hits = self.lexical.search(query, k) if self.lexical_ready.is_set() else []
+
+        hits = {hit['id']: hit for hit in vector_hits}
+        scores = {}
+        for ranking in ([hit['id'] for hit in vector_hits], [doc_id for doc_id, _ in lexical_hits]):
+            for rank, doc_id in enumerate(ranking):
+                scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (self.rrf_k + rank + 1)
+        missing = [doc_id for doc_id in scores if doc_id not in hits]
+        for hit in self.store.get(missing):
+            hits[hit['id']] = hit
+
+        now = time.time()
+        ranked = sorted(
+            ((scores[doc_id] * self._recency(hit['metadata'], now), hit) for doc_id, hit in hits.items() if doc_id in scores),
+            key=lambda item: item[0],
+            reverse=True
+        )
+
+        results = []
+        kept = []
+        for score, hit in ranked:
+            # Lines made only of stopwords are compared as whole text
+            tokens = set(tokenize(hit['document'])) or {" ".join(hit['document'].lower().split())}
+            if self._is_duplicate(tokens, kept):
+                continue
+            kept.append(tokens)
+            results.append({**hit, "score": score})
+            if len(results) >= n_results:
+                break
+        return results
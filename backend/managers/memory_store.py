@@ -0,0 +1,479 @@
+import os
+import json
+import shutil
+import sqlite3
+import logging
+import threading
+from contextlib import closing
+import numpy as np
+from abc import ABC, abstractmethod
+
+logger = logging.getLogger(__name__)
+
+COLLECTION_NAME = "long_term_memory"
+
+class MemoryStore(ABC):
+    """
+    Storage behind MemoryManager: documents with metadata and precomputed embeddings.
+
+    query() returns hits as dicts with id, document, metadata and distance (lower is
+    closer), best first.
+    """
+    @abstractmethod
+    def upsert(self, ids: list, documents: list, metadatas: list, embeddings: list):
+        pass
+
+    @abstractmethod
+    def query(self, embedding, n_results: int) -> list:
+        pass
+
+    @abstractmethod
+    def count(self) -> int:
+        pass
+
+    @abstractmethod
+    def get(self, ids: list, include_embeddings: bool = False) -> list:
+        """Hits (without distance) for the ids that exist, in the given order."""
+        pass
+
+    @abstractmethod
+    def delete(self, ids: list):
+        pass
+
+    def vacuum(self):
+        """Reclaims space left by deleted memories."""
+        pass
+
+    @abstractmethod
+    def documents(self, batch_size: int = 1000):
+        """Yields (id, document, metadata) for every stored memory."""
+        pass
+
+    def close(self):
+        pass
+
+class ChromaMemoryStore(MemoryStore):
+    """The original store: a persistent Chroma collection."""
+    def __init__(self, db_path, embedding_function=None):
+        import chromadb
+
+        self.db_path = db_path
+        # We use a persistent client so memories survive restarts
+        self.client = chromadb.PersistentClient(path=db_path)
+        self.collection = self.client.get_or_create_collection(name=COLLECTION_NAME, embedding_function=embedding_function)
+
+    def upsert(self, ids, documents, metadatas, embeddings):
+        self.collection.upsert(ids=ids, documents=documents, metadatas=metadatas, embeddings=embeddings)
+
+    def query(self, embedding, n_results):
+        results = self.collection.query(query_embeddings=[embedding], n_results=n_results)
+        if not results['documents'] or not results['documents'][0]:
+            return []
+        return [
+            {"id": doc_id, "document": document, "metadata": metadata, "distance": distance}
+            for doc_id, document, metadata, distance in zip(
+                results['ids'][0], results['documents'][0], results['metadatas'][0], results['distances'][0]
+            )
+        ]
+
+    def count(self):
+        return self.collection.count()
+
+    def get(self, ids, include_embeddings=False):
+        if not ids:
+            return []
+        include = ["documents", "metadatas"] + (["embeddings"] if include_embeddings else [])
+        results = self.collection.get(ids=list(ids), include=include)
+        found = {}
+        for i, doc_id in enumerate(results['ids']):
+            found[doc_id] = {"id": doc_id, "document": results['documents'][i], "metadata": results['metadatas'][i]}
+            if include_embeddings:
+                found[doc_id]["embedding"] = results['embeddings'][i]
+        return [found[doc_id] for doc_id in ids if doc_id in found]
+
+    def delete(self, ids):
+        if ids:
+            self.collection.delete(ids=list(ids))
+
+    def vacuum(self):
+        # Chroma keeps documents and metadata in SQLite, which only shrinks on VACUUM
+        path = os.path.join(self.db_path, "chroma.sqlite3")
+        if not os.path.exists(path):
+            return
+        try:
+            with closing(sqlite3.connect(path, timeout=30)) as conn:
+                conn.execute("VACUUM")
+        except sqlite3.Error as e:
+            logger.warning(f"Could not vacuum {path}: {e}")
+
+    def documents(self, batch_size=1000):
+        for offset in range(0, self.collection.count(), batch_size):
+            batch = self.collection.get(offset=offset, limit=batch_size, include=["documents", "metadatas"])
+            yield from zip(batch['ids'], batch['documents'], batch['metadatas'])
+
+class NumpyMemoryStore(MemoryStore):
+    """
+    Lightweight store for potato mode: no database, just files in one directory.
+
+    vectors.<dtype>  raw embedding matrix, appended on write and memory-mapped for search
+    scales.f32       per-row scale factors (int8 only)
+    metadata.jsonl   append-only log of {"op": "add"/"delete", ...}, replayed on open
+    store.json       dimension and dtype
+    hnsw.bin         saved HNSW graph (if enabled)
+
+    Embeddings are L2-normalized and stored as float32, float16 or int8 (per-row
+    scaled); search is a brute-force dot product over the mmap in chunks, or hnswlib
+    (if installed and hnsw=True) once the store has hnsw_threshold live rows.
+    Distances are cosine distances. Replaced or deleted rows stay in the files and
+    are masked out until vacuum() rewrites the folder with live rows only.
+    """
+    DTYPES = ("float32", "float16", "int8")
+    CHUNK_ROWS = 65536
+
+    def __init__(self, path, dtype="float16", hnsw=False, hnsw_threshold=20000, hnsw_m=16, hnsw_ef=64):
+        self.path = os.path.normpath(path)
+        self._recover_vacuum()
+        os.makedirs(self.path, exist_ok=True)
+        self._header_path = os.path.join(path, "store.json")
+        self._log_path = os.path.join(path, "metadata.jsonl")
+        self._scales_path = os.path.join(path, "scales.f32")
+        self._hnsw_path = os.path.join(path, "hnsw.bin")
+
+        header = self._read_header()
+        if header.get('dtype') and header['dtype'] != dtype:
+            logger.warning(f"Memory store at {path} uses {header['dtype']}; ignoring configured dtype {dtype}.")
+            dtype = header['dtype']
+        if dtype not in self.DTYPES:
+            raise ValueError(f"Unsupported memory store dtype: {dtype} (use one of {', '.join(self.DTYPES)})")
+        self.dtype = dtype
+        self.dim = header.get('dim')
+        self._vectors_path = os.path.join(path, f"vectors.{dtype}")
+
+        self.use_hnsw = hnsw
+        self.hnsw_threshold = hnsw_threshold
+        self.hnsw_m = hnsw_m
+        self.hnsw_ef = hnsw_ef
+        self._hnsw = None
+
+        self._lock = threading.RLock()
+        self._rows = []   # row -> (id, document, metadata), None once replaced/deleted
+        self._index = {}  # id -> row
+        self._alive = np.zeros(0, dtype=bool)
+        self._live = 0
+        self._matrix = None
+        self._scales = None
+        self._load()
+
+    def _recover_vacuum(self):
+        """Finishes or rolls back a vacuum() that was interrupted between its two renames."""
+        old, tmp = self.path + ".old", self.path + ".vacuum"
+        if os.path.isdir(old):
+            if os.path.isdir(self.path):
+                shutil.rmtree(old, ignore_errors=True)
+            else:
+                logger.warning(f"Restoring {self.path} from an interrupted vacuum")
+                os.rename(old, self.path)
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    def _read_header(self):
+        try:
+            with open(self._header_path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_header(self, **extra):
+        header = {"dim": self.dim, "dtype": self.dtype, **extra}
+        tmp = self._header_path + ".tmp"
+        with open(tmp, 'w') as f:
+            json.dump(header, f)
+        os.replace(tmp, self._header_path)
+
+    @property
+    def _itemsize(self):
+        return np.dtype(self.dtype).itemsize
+
+    def _load(self):
+        rows = []
+        if os.path.exists(self._log_path):
+            with open(self._log_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A torn last line from a crash mid-write
+                        continue
+                    if entry['op'] == 'add' and entry['row'] == len(rows):
+                        old = self._index.get(entry['id'])
+                        if old is not None:
+                            rows[old] = None
+                        self._index[entry['id']] = len(rows)
+                        rows.append((entry['id'], entry['document'], entry['metadata']))
+                    elif entry['op'] == 'delete':
+                        row = self._index.pop(entry['id'], None)
+                        if row is not None:
+                            rows[row] = None
+
+        # Vectors are written before their log entry, so vectors the log lacks are cut off
+        # (and log rows whose vector write was torn are dropped)
+        if self.dim and os.path.exists(self._vectors_path):
+            stored = os.path.getsize(self._vectors_path) // (self.dim * self._itemsize)
+            if self.dtype == "int8":
+                stored = min(stored, os.path.getsize(self._scales_path) // 4 if os.path.exists(self._scales_path) else 0)
+            if len(rows) > stored:
+                logger.warning(f"Memory store log has {len(rows) - stored} rows without vectors; dropping them.")
+                for doc_id, row in list(self._index.items()):
+                    if row >= stored:
+                        del self._index[doc_id]
+                rows = rows[:stored]
+            self._truncate(len(rows))
+        else:
+            rows = []
+            self._index.clear()
+
+        self._rows = rows
+        self._alive = np.array([row is not None for row in rows], dtype=bool)
+        self._live = int(self._alive.sum())
+        self._remap()
+        if self.use_hnsw and self._live and self._live >= self.hnsw_threshold:
+            self._build_hnsw()
+        logger.info(f"Opened memory store at {self.path}: {self._live} memories ({self.dtype})")
+
+    def _truncate(self, rows):
+        for path, size in ((self._vectors_path, rows * self.dim * self._itemsize), (self._scales_path, rows * 4)):
+            if path == self._scales_path and self.dtype != "int8":
+                continue
+            if os.path.exists(path) and os.path.getsize(path) > size:
+                with open(path, 'r+b') as f:
+                    f.truncate(size)
+
+    def _remap(self):
+        """Re-opens the memory maps after the files grew."""
+        n = len(self._rows)
+        if n == 0:
+            self._matrix = self._scales = None
+            return
+        self._matrix = np.memmap(self._vectors_path, dtype=self.dtype, mode='r', shape=(n, self.dim))
+        if self.dtype == "int8":
+            self._scales = np.memmap(self._scales_path, dtype=np.float32, mode='r', shape=(n,))
+
+    def _normalize(self, embeddings):
+        vectors = np.asarray(embeddings, dtype=np.float32).reshape(len(embeddings), -1)
+        vectors /= np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+        return vectors
+
+    def _encode(self, vectors):
+        if self.dtype == "int8":
+            scales = np.clip(np.abs(vectors).max(axis=1), 1e-12, None) / 127.0
+            codes = np.round(vectors / scales[:, None]).astype(np.int8)
+            return codes, scales.astype(np.float32)
+        return vectors.astype(self.dtype), None
+
+    def _decode(self, start, stop):
+        block = np.asarray(self._matrix[start:stop], dtype=np.float32)
+        if self._scales is not None:
+            block *= self._scales[start:stop, None]
+        return block
+
+    def upsert(self, ids, documents, metadatas, embeddings):
+        if not ids:
+            return
+        vectors = self._normalize(embeddings)
+        with self._lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                self._write_header()
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match the store ({self.dim})")
+
+            codes, scales = self._encode(vectors)
+            with open(self._vectors_path, 'ab') as f:
+                f.write(codes.tobytes())
+            if scales is not None:
+                with open(self._scales_path, 'ab') as f:
+                    f.write(scales.tobytes())
+
+            first = len(self._rows)
+            replaced = []
+            lines = []
+            for i, (doc_id, document, metadata) in enumerate(zip(ids, documents, metadatas)):
+                row = first + i
+                old = self._index.get(doc_id)
+                if old is not None:
+                    self._rows[old] = None
+                    replaced.append(old)
+                self._rows.append((doc_id, document, metadata))
+                self._index[doc_id] = row
+                lines.append(json.dumps({"op": "add", "row": row, "id": doc_id, "document": document, "metadata": metadata}))
+            with open(self._log_path, 'a', encoding='utf-8') as f:
+                f.write("\n".join(lines) + "\n")
+
+            alive = np.ones(len(ids), dtype=bool)
+            self._alive = np.concatenate([self._alive, alive])
+            self._alive[replaced] = False
+            self._live += len(ids) - len(replaced)
+            self._remap()
+
+            if self._hnsw is not None:
+                self._hnsw_add(vectors, np.arange(first, first + len(ids)))
+                for row in replaced:
+                    self._hnsw.mark_deleted(row)
+            elif self.use_hnsw and self._live >= self.hnsw_threshold:
+                self._build_hnsw()
+
+    def _build_hnsw(self):
+        try:
+            import hnswlib
+        except ImportError:
+            logger.warning("hnswlib not installed; memory search stays brute-force.")
+            self.use_hnsw = False
+            return
+
+        n = len(self._rows)
+        index = hnswlib.Index(space='cosine', dim=self.dim)
+        header = self._read_header()
+        if os.path.exists(self._hnsw_path) and header.get('hnsw_rows') == n:
+            index.load_index(self._hnsw_path, max_elements=max(n * 2, 1024))
+            logger.info(f"Loaded HNSW index for {n} memory rows")
+        else:
+            logger.info(f"Building HNSW index over {self._live} memories...")
+            index.init_index(max_elements=max(n * 2, 1024), ef_construction=200, M=self.hnsw_m)
+            for start in range(0, n, self.CHUNK_ROWS):
+                stop = min(start + self.CHUNK_ROWS, n)
+                index.add_items(self._decode(start, stop), np.arange(start, stop))
+            for row in np.flatnonzero(~self._alive):
+                index.mark_deleted(int(row))
+        index.set_ef(self.hnsw_ef)
+        self._hnsw = index
+
+    def _hnsw_add(self, vectors, labels):
+        needed = self._hnsw.get_current_count() + len(labels)
+        if needed > self._hnsw.get_max_elements():
+            self._hnsw.resize_index(needed * 2)
+        self._hnsw.add_items(vectors, labels)
+
+    def query(self, embedding, n_results):
+        with self._lock:
+            if self._live == 0 or n_results <= 0:
+                return []
+            k = min(n_results, self._live)
+            if self._hnsw is not None:
+                labels, distances = self._hnsw.knn_query(self._normalize([embedding]), k=k)
+                hits = zip(labels[0].tolist(), distances[0].tolist())
+            else:
+                hits = self._brute_force(self._normalize([embedding])[0], k)
+            return [
+                {"id": self._rows[row][0], "document": self._rows[row][1], "metadata": self._rows[row][2], "distance": float(distance)}
+                for row, distance in hits
+            ]
+
+    def _brute_force(self, query, k):
+        n = len(self._rows)
+        best_rows = np.empty(0, dtype=np.int64)
+        best_scores = np.empty(0, dtype=np.float32)
+        for start in range(0, n, self.CHUNK_ROWS):
+            stop = min(start + self.CHUNK_ROWS, n)
+            scores = self._decode(start, stop) @ query
+            scores[~self._alive[start:stop]] = -np.inf
+            top = np.argpartition(-scores, min(k, len(scores) - 1))[:k]
+            best_rows = np.concatenate([best_rows, top + start])
+            best_scores = np.concatenate([best_scores, scores[top]])
+        order = np.argsort(-best_scores)[:k]
+        return [(int(best_rows[i]), 1.0 - best_scores[i]) for i in order if np.isfinite(best_scores[i])]
+
+    def count(self):
+        return self._live
+
+    def get(self, ids, include_embeddings=False):
+        hits = []
+        with self._lock:
+            for doc_id in ids:
+                row = self._index.get(doc_id)
+                if row is None:
+                    continue
+                _, document, metadata = self._rows[row]
+                hit = {"id": doc_id, "document": document, "metadata": metadata}
+                if include_embeddings:
+                    hit["embedding"] = self._decode(row, row + 1)[0]
+                hits.append(hit)
+        return hits
+
+    def delete(self, ids):
+        with self._lock:
+            deleted = [(doc_id, self._index.pop(doc_id)) for doc_id in ids if doc_id in self._index]
+            if not deleted:
+                return
+            with open(self._log_path, 'a', encoding='utf-8') as f:
+                f.write("".join(json.dumps({"op": "delete", "id": doc_id}) + "\n" for doc_id, _ in deleted))
+            for _, row in deleted:
+                self._rows[row] = None
+                self._alive[row] = False
+                if self._hnsw is not None:
+                    self._hnsw.mark_deleted(row)
+            self._live -= len(deleted)
+
+    def vacuum(self):
+        """Rewrites the store with live rows only; the folder is swapped in with two renames."""
+        with self._lock:
+            keep = np.flatnonzero(self._alive)
+            if len(keep) == len(self._rows):
+                return
+            tmp = self.path + ".vacuum"
+            shutil.rmtree(tmp, ignore_errors=True)
+            os.makedirs(tmp)
+            with open(os.path.join(tmp, os.path.basename(self._vectors_path)), 'wb') as f:
+                for start in range(0, len(keep), self.CHUNK_ROWS):
+                    f.write(np.ascontiguousarray(self._matrix[keep[start:start + self.CHUNK_ROWS]]).tobytes())
+            if self._scales is not None:
+                with open(os.path.join(tmp, os.path.basename(self._scales_path)), 'wb') as f:
+                    f.write(np.ascontiguousarray(self._scales[keep]).tobytes())
+            rows = [self._rows[row] for row in keep]
+            with open(os.path.join(tmp, os.path.basename(self._log_path)), 'w', encoding='utf-8') as f:
+                for row, (doc_id, document, metadata) in enumerate(rows):
+                    f.write(json.dumps({"op": "add", "row": row, "id": doc_id, "document": document, "metadata": metadata}) + "\n")
+            with open(os.path.join(tmp, os.path.basename(self._header_path)), 'w') as f:
+                json.dump({"dim": self.dim, "dtype": self.dtype}, f)
+
+            # Release the memory maps before the old files go away
+            self._matrix = self._scales = None
+            old = self.path + ".old"
+            os.rename(self.path, old)
+            os.rename(tmp, self.path)
+            shutil.rmtree(old, ignore_errors=True)
+
+            removed = len(self._rows) - len(rows)
+            self._rows = rows
+            self._index = {doc_id: row for row, (doc_id, _, _) in enumerate(rows)}
+            self._alive = np.ones(len(rows), dtype=bool)
+            self._remap()
+            if self._hnsw is not None:
+                self._hnsw = None
+                self._build_hnsw()
+            logger.info(f"Vacuumed memory store at {self.path}: dropped {removed} dead rows, {len(rows)} left")
+
+    def documents(self, batch_size=1000):
+        with self._lock:
+            rows = [row for row in self._rows if row is not None]
+        yield from rows
+
+    def close(self):
+        with self._lock:
+            if self._hnsw is not None:
+                self._hnsw.save_index(self._hnsw_path)
+                self._write_header(hnsw_rows=len(self._rows))
+
+def create_memory_store(settings=None, db_path="./chroma_db", embedding_function=None):
+    """Builds the store named by `memory.store` in the config: "chroma" (default) or "numpy"."""
+    settings = settings or {}
+    store = settings.get('store', 'chroma')
+    if store == 'numpy':
+        options = settings.get('numpy', {})
+        return NumpyMemoryStore(
+            db_path,
+            dtype=options.get('dtype', 'float16'),
+            hnsw=options.get('hnsw', False),
+            hnsw_threshold=options.get('hnsw_threshold', 20000)
+        )
+    if store != 'chroma':
+        logger.warning(f"Unknown memory store '{store}'; using chroma.")
+    return ChromaMemoryStore(db_path, embedding_function)
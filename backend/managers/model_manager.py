@@ -1,9 +1,13 @@
 import os
+import re
 from pathlib import Path
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Quantization / precision suffixes find_model() knows about, e.g. riko-llm.q4_k_m.gguf or riko-llm_int4.xml
+QUANT_SUFFIX = re.compile(r"(\.(q\d\w*|f16|f32)|_(int4|int8|fp16))$", re.IGNORECASE)
+
 class ModelManager:
     def __init__(self, base_model_dir="models"):
         self.base_model_dir = Path(base_model_dir)
@@ -25,6 +29,10 @@ class ModelManager:
         if path.exists():
             search_dir = path.parent
             base_name = path.stem
+        elif path.parent != Path(".") and path.parent.exists():
+            # A bare name inside a given directory, e.g. models/riko-llm
+            search_dir = path.parent
+            base_name = path.name
         else:
             # Check in local models dir
             search_dir = self.base_model_dir
@@ -81,6 +89,33 @@ class ModelManager:
         # Default: return original path
         return str(path)
 
+    def find_draft_model(self, model_path, backend_type, draft_name=None):
+        """
+        Finds a small draft model for speculative decoding.
+
+        draft_name picks one explicitly (resolved like any model); otherwise
+        "<base>-draft" or "<base>_draft" is looked up next to the main model, with the
+        same quantization variants, e.g. riko-llm-draft.q4_k_m.gguf for riko-llm.q4_k_m.gguf.
+        Returns None if there is no draft model.
+        """
+        path = Path(model_path)
+        if draft_name:
+            candidates = [draft_name]
+        else:
+            name = path.stem if path.suffix in (".gguf", ".xml") else path.name
+            base_name = QUANT_SUFFIX.sub("", name)
+            search_dir = path.parent if path.parent.exists() else self.base_model_dir
+            candidates = [str(search_dir / f"{base_name}{sep}draft") for sep in ("-", "_")]
+
+        for candidate in candidates:
+            found = self.find_model(candidate, backend_type)
+            if Path(found).exists() and Path(found) != path:
+                logger.info(f"Found draft model: {found}")
+                return found
+
+        logger.warning(f"No draft model found for {model_path}; speculative decoding stays off.")
+        return None
+
 if __name__ == "__main__":
     mm = ModelManager()
     print("Model Manager initialized.")
@@ -0,0 +1,115 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+class ConversationSummarizer:
+    """
+    Folds older turns of a conversation into a running summary.
+
+    Once the turns not yet covered by the summary pass threshold_tokens, a background
+    job merges the oldest of them (all but the last keep_recent) into the summary.
+    Summaries are incremental: each job only reads the previous summary plus the newly
+    covered turns. Results are cached in memory and, with a store, persisted per conversation.
+    """
+    def __init__(self, store=None, llm=None, threshold_tokens=None, keep_recent=6):
+        self.store = store
+        # Optional dedicated (small) model; otherwise the caller's active LLM is used
+        self.llm = llm
+        self.threshold_tokens = threshold_tokens
+        self.keep_recent = keep_recent
+        self._cache = {}
+        self._running = set()
+        # Bumped by reset() so a job started before it cannot bring the old summary back
+        self._generations = {}
+        self._lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="riko-summary")
+
+    @staticmethod
+    def _text(message):
+        content = message.get("content", "")
+        if isinstance(content, list):
+            return " ".join(item.get("text", "") for item in content)
+        return content
+
+    def get(self, conversation_id):
+        """Returns (covered, summary) for the conversation."""
+        with self._lock:
+            if conversation_id not in self._cache:
+                self._cache[conversation_id] = self.store.get_summary(conversation_id) if self.store else (0, None)
+            return self._cache[conversation_id]
+
+    def apply(self, conversation_id, turns):
+        """Returns (summary, turns the summary does not cover yet)."""
+        covered, summary = self.get(conversation_id)
+        if not summary or covered > len(turns):
+            # No summary yet, or the history was reset underneath it
+            return None, turns
+        return summary, turns[covered:]
+
+    def maybe_summarize(self, conversation_id, turns, llm, count_tokens, threshold_tokens=None):
+        """Schedules a summary update in the background if the uncovered turns are over the threshold."""
+        threshold = self.threshold_tokens or threshold_tokens
+        if not threshold:
+            return
+        covered, summary = self.get(conversation_id)
+        if covered > len(turns):
+            covered, summary = 0, None
+        pending = turns[covered:]
+        if len(pending) <= self.keep_recent:
+            return
+        if sum(count_tokens(self._text(m)) for m in pending) < threshold:
+            return
+
+        with self._lock:
+            if conversation_id in self._running:
+                return
+            self._running.add(conversation_id)
+            generation = self._generations.get(conversation_id, 0)
+        fold = pending[:len(pending) - self.keep_recent]
+        self.executor.submit(self._summarize, conversation_id, covered, summary, fold, self.llm or llm, generation)
+
+    def _summarize(self, conversation_id, covered, summary, fold, llm, generation=0):
+        try:
+            transcript = "\n".join(f"{m['role'].capitalize()}: {self._text(m)}" for m in fold)
+            prompt = f"""
+            Update the running summary of a conversation between the user (senpai) and Riko.
+            Keep names, facts, decisions, promises and open questions; drop small talk.
+            Write at most 150 words in the third person.
+
+            Current summary: {summary or "(none yet)"}
+
+            New messages:
+            {transcript}
+
+            Return ONLY the updated summary.
+            """
+            new_summary = llm.generate([
+                {"role": "system", "content": "You are a precise conversation summarizer."},
+                {"role": "user", "content": prompt}
+            ]).strip()
+            if not new_summary:
+                return
+
+            covered += len(fold)
+            with self._lock:
+                if self._generations.get(conversation_id, 0) != generation:
+                    logger.info(f"Conversation {conversation_id} was reset while summarizing; dropping the summary.")
+                    return
+                self._cache[conversation_id] = (covered, new_summary)
+                if self.store:
+                    self.store.save_summary(conversation_id, covered, new_summary)
+            logger.info(f"Summarized {len(fold)} turns of conversation {conversation_id} ({covered} covered).")
+        except Exception as e:
+            logger.error(f"Failed to summarize conversation {conversation_id}: {e}")
+        finally:
+            with self._lock:
+                self._running.discard(conversation_id)
+
+    def reset(self, conversation_id):
+        with self._lock:
+            self._cache.pop(conversation_id, None)
+            self._generations[conversation_id] = self._generations.get(conversation_id, 0) + 1
+            if self.store:
+                self.store.save_summary(conversation_id, 0, "")
@@ -0,0 +1,118 @@
+from .llm_provider import LLMProvider
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Marks the end of a streamed reply / asks the worker to exit
+_DONE = object()
+_STOP = object()
+
+class _Request:
+    def __init__(self, messages, stream):
+        self.messages = messages
+        self.chunks = queue.Queue() if stream else None
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class BatchingLLM(LLMProvider):
+    """
+    Micro-batching front for a local provider that implements generate_batch().
+
+    Requests that arrive within max_wait_ms of the first queued one (up to max_batch_size)
+    run as one batch on a single worker thread, and each caller gets its own reply or
+    stream back. max_wait_ms is the most latency batching adds to a request.
+    Calls with a session_id bypass the queue, since per-session KV state is per request.
+    """
+    def __init__(self, llm, max_batch_size=4, max_wait_ms=20):
+        self.llm = llm
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.context_window = llm.context_window
+        self.reply_reserve = llm.reply_reserve
+        self.supports_sessions = llm.supports_sessions
+        self._queue = queue.Queue()
+        self._closed = False
+        self._worker = threading.Thread(target=self._run, name="riko-llm-batcher", daemon=True)
+        self._worker.start()
+        logger.info(f"LLM batching enabled (max {max_batch_size} requests, {max_wait_ms} ms window)")
+
+    def __getattr__(self, name):
+        # Backend extras (reset_session, warmup, ...) go to the wrapped model
+        if name == "llm":
+            raise AttributeError(name)
+        return getattr(self.llm, name)
+
+    def count_tokens(self, text: str) -> int:
+        return self.llm.count_tokens(text)
+
+    def generate(self, messages: list, **kwargs) -> str:
+        if kwargs or self._closed:
+            return self.llm.generate(messages, **kwargs)
+        request = _Request(messages, stream=False)
+        self._queue.put(request)
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def generate_stream(self, messages: list, **kwargs):
+        if kwargs or self._closed:
+            yield from self.llm.generate_stream(messages, **kwargs)
+            return
+        request = _Request(messages, stream=True)
+        self._queue.put(request)
+        while True:
+            delta = request.chunks.get()
+            if delta is _DONE:
+                break
+            yield delta
+        if request.error is not None:
+            raise request.error
+
+    def _collect(self, first):
+        """Gathers requests behind `first` until the batch is full or the wait window closes."""
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if request is _STOP:
+                # Serve what we have, then let the loop see the stop marker
+                self._queue.put(_STOP)
+                break
+            batch.append(request)
+        return batch
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is _STOP:
+                return
+            batch = self._collect(first)
+            callbacks = [r.chunks.put if r.chunks is not None else None for r in batch]
+            try:
+                results = self.llm.generate_batch([r.messages for r in batch], callbacks)
+                for request, result in zip(batch, results):
+                    request.result = result
+            except Exception as e:
+                logger.error(f"Batched generation of {len(batch)} requests failed: {e}")
+                for request in batch:
+                    request.error = e
+            for request in batch:
+                if request.chunks is not None:
+                    request.chunks.put(_DONE)
+                request.done.set()
+
+    def close(self):
+        """Stops the worker once the requests already queued are served; later calls run unbatched."""
+        self._closed = True
+        self._queue.put(_STOP)
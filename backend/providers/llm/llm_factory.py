@@ -13,7 +13,17 @@ logger = logging.getLogger(__name__)
 
 class LLMFactory:
     @staticmethod
-    def create_llm(backend, model_path, api_key=None, system_prompt=None, openvino_device="CPU") -> LLMProvider:
+    def create_llm(backend, model_path, api_key=None, system_prompt=None, openvino_device="CPU", llm_options=None, batching=None) -> LLMProvider:
+        # llm_options: extra keyword arguments for the local backends (llama_cpp / openvino config sections)
+        # batching: `llm_batching` config section; wraps backends that can batch in a BatchingLLM
+        llm = LLMFactory._create(backend, model_path, api_key, openvino_device, llm_options or {})
+        if batching and batching.get('enabled') and llm.supports_batching:
+            from .llm_batcher import BatchingLLM
+            return BatchingLLM(llm, max_batch_size=batching.get('max_batch_size', 4), max_wait_ms=batching.get('max_wait_ms', 20))
+        return llm
+
+    @staticmethod
+    def _create(backend, model_path, api_key, openvino_device, llm_options) -> LLMProvider:
         logger.info(f"Creating LLM with backend: {backend}")
 
         if backend == "openai":
@@ -30,8 +40,8 @@ class LLMFactory:
 
         elif backend in ["cpu_legacy", "llama_cpp", "mps", "rocm", "cpu_modern"]:
             from .llm_local_gguf import LlamaCppLLM
-            return LlamaCppLLM(model_path, backend=backend)
+            return LlamaCppLLM(model_path, backend=backend, **llm_options)
 
         elif backend == "openvino":
             from .llm_local_openvino import OpenVINOLLM
-            return OpenVINOLLM(model_path, device=openvino_device)
+            return OpenVINOLLM(model_path, device=openvino_device, **llm_options)
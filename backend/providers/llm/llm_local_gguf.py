@@ -1,10 +1,25 @@
 from .llm_provider import LLMProvider
 import logging
+import threading
 
 logger = logging.getLogger(__name__)
 
 class LlamaCppLLM(LLMProvider):
-    def __init__(self, model_path, n_ctx=2048, backend='cpu_legacy'):
+    """
+    llama.cpp backend.
+
+    Prompt evaluation is the expensive part on CPU, so the KV state is reused across turns:
+    llama.cpp already skips the prefix shared with the last evaluated prompt, and the
+    state cache (kv_cache="ram" or "disk") keeps snapshots keyed by token prefix, so a
+    session picks its persona + history back up even after other sessions ran in between.
+    Snapshots are evicted least-recently-used once kv_cache_capacity_mb is exceeded.
+
+    With draft_model_path, a small GGUF model with the same vocabulary proposes
+    draft_tokens tokens at a time and the main model verifies them in one pass
+    (speculative decoding), which speeds up decoding on CPU.
+    """
+    def __init__(self, model_path, n_ctx=2048, backend='cpu_legacy', kv_cache="ram", kv_cache_capacity_mb=1024, kv_cache_dir="./model_cache/llama_state",
+                 draft_model_path=None, draft_tokens=8):
         try:
             from llama_cpp import Llama
             
@@ -12,37 +27,119 @@ class LlamaCppLLM(LLMProvider):
             if backend in ['mps', 'rocm', 'cuda', 'llama_cpp']:
                 n_gpu_layers = -1 # Offload all layers to hardware accelerator
                 
+            self.context_window = n_ctx
+            self.reply_reserve = min(512, n_ctx // 4)
+
+            draft_model = None
+            if draft_model_path:
+                logger.info(f"Loading GGUF draft model from {draft_model_path} ({draft_tokens} tokens per step)")
+                draft_model = GGUFDraftModel(draft_model_path, draft_tokens, n_ctx=n_ctx, n_gpu_layers=n_gpu_layers)
+
             logger.info(f"Loading GGUF model from {model_path} with n_gpu_layers={n_gpu_layers} ({backend})")
             self.llm = Llama(
                 model_path=model_path,
                 n_ctx=n_ctx,
                 n_gpu_layers=n_gpu_layers, 
                 verbose=True,
-                use_mmap=True
+                use_mmap=True,
+                draft_model=draft_model
             )
+            self._setup_kv_cache(kv_cache, kv_cache_capacity_mb, kv_cache_dir)
         except ImportError:
             logger.error("llama-cpp-python not installed.")
             raise
 
+        # A Llama instance holds a single KV state and isn't thread-safe
+        self._lock = threading.Lock()
+
+    def _setup_kv_cache(self, kv_cache, capacity_mb, cache_dir):
+        self._kv_cache_settings = (kv_cache, capacity_mb, cache_dir)
+        if not kv_cache:
+            return
+        from llama_cpp import LlamaRAMCache, LlamaDiskCache
+
+        capacity_bytes = int(capacity_mb) << 20
+        if kv_cache == "disk":
+            logger.info(f"Using on-disk llama.cpp state cache at {cache_dir} ({capacity_mb} MB)")
+            self.llm.set_cache(LlamaDiskCache(cache_dir=cache_dir, capacity_bytes=capacity_bytes))
+        else:
+            logger.info(f"Using in-memory llama.cpp state cache ({capacity_mb} MB)")
+            self.llm.set_cache(LlamaRAMCache(capacity_bytes=capacity_bytes))
+
+    def reset_cache(self):
+        """Drops all saved KV states (e.g. after changing the persona)."""
+        with self._lock:
+            self.llm.reset()
+            self.llm.set_cache(None)
+            self._setup_kv_cache(*self._kv_cache_settings)
+
+    def count_tokens(self, text: str) -> int:
+        return len(self.llm.tokenize(text.encode("utf-8"), add_bos=False, special=True))
+
     def generate(self, messages: list) -> str:
-        clean_messages = []
-        for m in messages:
-            content = m.get("content", "")
-            if isinstance(content, list):
-                text_parts = [item.get("text", "") for item in content if item.get("type") in ["input_text", "output_text", "text"]]
-                clean_content = " ".join(text_parts)
-            else:
-                clean_content = content
-
-            clean_messages.append({
-                "role": m["role"],
-                "content": clean_content
-            })
-
-        response = self.llm.create_chat_completion(
-            messages=clean_messages,
-            max_tokens=2048,
-            temperature=0.7
-        )
+        clean_messages = self._clean_messages(messages)
+
+        with self._lock:
+            response = self.llm.create_chat_completion(
+                messages=clean_messages,
+                max_tokens=2048,
+                temperature=0.7
+            )
 
         return response['choices'][0]['message']['content']
+
+    def generate_stream(self, messages: list):
+        with self._lock:
+            stream = self.llm.create_chat_completion(
+                messages=self._clean_messages(messages),
+                max_tokens=2048,
+                temperature=0.7,
+                stream=True
+            )
+            try:
+                for chunk in stream:
+                    delta = chunk['choices'][0]['delta'].get('content')
+                    if delta:
+                        yield delta
+            finally:
+                # Closing early still lets llama.cpp finish its bookkeeping (and state cache save)
+                stream.close()
+
+
+class GGUFDraftModel:
+    """
+    Draft model for llama-cpp-python's speculative decoding (the LlamaDraftModel protocol):
+    called with the tokens so far, it greedily proposes the next few tokens.
+    """
+    def __init__(self, model_path, num_pred_tokens=8, n_ctx=2048, n_gpu_layers=0):
+        from llama_cpp import Llama
+
+        self.llm = Llama(model_path=model_path, n_ctx=n_ctx, n_gpu_layers=n_gpu_layers, verbose=False, use_mmap=True)
+        self.num_pred_tokens = num_pred_tokens
+
+    def __call__(self, input_ids, **kwargs):
+        import numpy as np
+
+        ids = input_ids.tolist()
+        budget = min(self.num_pred_tokens, self.llm.n_ctx() - len(ids))
+        if budget <= 0:
+            return np.array([], dtype=np.intc)
+
+        # Only evaluate what the draft hasn't seen yet (always at least the last token)
+        seen = self.llm.input_ids[:self.llm.n_tokens].tolist()
+        prefix = 0
+        for a, b in zip(seen, ids[:-1]):
+            if a != b:
+                break
+            prefix += 1
+        self.llm.n_tokens = prefix
+        self.llm.eval(ids[prefix:])
+
+        draft = []
+        for _ in range(budget):
+            token = self.llm.sample(temp=0.0)
+            if token == self.llm.token_eos():
+                break
+            draft.append(token)
+            self.llm.eval([token])
+        return np.array(draft, dtype=np.intc)
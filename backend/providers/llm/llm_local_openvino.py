@@ -1,10 +1,44 @@
 from .llm_provider import LLMProvider
+import queue
 import logging
+import threading
+from collections import OrderedDict
 
 logger = logging.getLogger(__name__)
 
+# How often a waiting stream checks that the generate() worker is still alive
+STREAM_POLL_SECONDS = 1.0
+
 class OpenVINOLLM(LLMProvider):
-    def __init__(self, model_path, device="GPU"):
+    """
+    OpenVINO backend via optimum-intel.
+
+    Legacy iGPUs are only stable with a small set of input shapes, so prompts are padded
+    to the smallest of a few fixed bucket lengths instead of always to the maximum. Each
+    bucket shape is compiled once and kept in the OpenVINO model cache (CACHE_DIR), and
+    warmup_buckets compiles them all at load time. Prompts longer than the largest bucket
+    lose their oldest turns first; the system prompt and the latest message are kept.
+
+    With session_kv_cache enabled and a stateful model, calls that pass a session_id keep
+    that session's KV state between turns: the state is snapshotted after each reply,
+    restored (trimmed to the prefix the new prompt shares with it) on the next turn, and
+    only the new tokens are prefilled. Snapshots are LRU-evicted beyond max_kv_sessions.
+    Session prompts are fitted to the largest bucket like any other, but the new-token
+    prefill is not padded, so this path suits devices that handle dynamic shapes (CPU,
+    recent GPUs). It relies on optimum-intel internals and turns itself off, falling
+    back to full prefill, if they are missing.
+
+    generate_batch() runs several prompts as one left-padded batch (see BatchingLLM).
+
+    With draft_model_path, a small OpenVINO model with the same tokenizer drafts
+    draft_tokens tokens per step for assisted (speculative) generation. It applies to
+    single prompts; batches and the session KV path decode with the main model only.
+    """
+    supports_batching = True
+
+    def __init__(self, model_path, device="GPU", buckets=(128, 256, 512, 1024), max_new_tokens=128, warmup_buckets=False, cache_dir="./model_cache",
+                 session_kv_cache=False, max_kv_sessions=4, min_kv_reuse=32, temperature=0.7, top_k=50,
+                 draft_model_path=None, draft_tokens=5):
         try:
             from optimum.intel import OVModelForCausalLM
             from transformers import AutoTokenizer
@@ -17,11 +51,13 @@ class OpenVINOLLM(LLMProvider):
 
             # Ensure left padding for generation
             self.tokenizer.padding_side = "left"
+            # If a prompt still doesn't fit, cut from the start rather than the end
+            self.tokenizer.truncation_side = "left"
 
             # Configuration for Ivy Bridge / Legacy
             ov_config = {
                 "PERFORMANCE_HINT": "LATENCY",
-                "CACHE_DIR": "./model_cache"
+                "CACHE_DIR": cache_dir
             }
 
             self.model = OVModelForCausalLM.from_pretrained(
@@ -30,6 +66,16 @@ class OpenVINOLLM(LLMProvider):
                 ov_config=ov_config
             )
 
+            self.draft_model = None
+            if draft_model_path:
+                logger.info(f"Loading OpenVINO draft model from {draft_model_path} ({draft_tokens} tokens per step)")
+                self.draft_model = OVModelForCausalLM.from_pretrained(
+                    draft_model_path,
+                    device=device,
+                    ov_config=ov_config
+                )
+                self.draft_model.generation_config.num_assistant_tokens = draft_tokens
+
         except ImportError:
             logger.error("optimum-intel or openvino not installed.")
             raise
@@ -37,55 +83,326 @@ class OpenVINOLLM(LLMProvider):
             logger.error(f"Failed to load OpenVINO model: {e}")
             raise
 
-    def generate(self, messages: list) -> str:
-        clean_messages = []
-        for m in messages:
-            content = m.get("content", "")
-            if isinstance(content, list):
-                text_parts = [item.get("text", "") for item in content if item.get("type") in ["input_text", "output_text", "text"]]
-                clean_content = " ".join(text_parts)
-            else:
-                clean_content = content
-            clean_messages.append({"role": m["role"], "content": clean_content})
+        self.buckets = sorted(buckets)
+        self.max_new_tokens = max_new_tokens
+        self.context_window = self.buckets[-1] + max_new_tokens
+        self.reply_reserve = max_new_tokens
+        self.temperature = temperature
+        self.top_k = top_k
+        # One compiled model / infer request: calls must not overlap
+        self._lock = threading.Lock()
 
+        # session_id -> {"tokens": [...], "states": {name: ndarray}}, most recently used last
+        self.session_kv_cache = session_kv_cache and getattr(self.model, "stateful", False) and self._kv_internals_present()
+        if session_kv_cache and not self.session_kv_cache:
+            logger.warning("session_kv_cache needs a stateful OpenVINO export and a supported optimum-intel version; falling back to full prefill.")
+        self.max_kv_sessions = max_kv_sessions
+        self.min_kv_reuse = min_kv_reuse
+        self._kv_sessions = OrderedDict()
+        self.supports_sessions = self.session_kv_cache
+
+        if warmup_buckets:
+            self.warmup()
+
+    def warmup(self):
+        """Runs one tiny generation per bucket so every static shape is compiled (and cached) up front."""
+        for bucket in self.buckets:
+            logger.info(f"Compiling OpenVINO prompt bucket {bucket}")
+            inputs = self.tokenizer("Hi", return_tensors="pt", padding="max_length", max_length=bucket, truncation=True)
+            with self._lock:
+                self.model.generate(**inputs, max_new_tokens=1, pad_token_id=self.tokenizer.pad_token_id)
+
+    def count_tokens(self, text: str) -> int:
+        return len(self.tokenizer(text, add_special_tokens=False).input_ids)
+
+    def _render_prompt(self, clean_messages: list) -> str:
         # Use chat template if available
         if hasattr(self.tokenizer, "apply_chat_template"):
             try:
-                prompt = self.tokenizer.apply_chat_template(clean_messages, tokenize=False, add_generation_prompt=True)
+                return self.tokenizer.apply_chat_template(clean_messages, tokenize=False, add_generation_prompt=True)
             except Exception:
                 # Fallback manual template
                 prompt = ""
                 for m in clean_messages:
                     prompt += f"<|{m['role']}|>\n{m['content']}</s>\n"
                 prompt += "<|assistant|>\n"
-        else:
-            prompt = ""
-            for m in clean_messages:
-                prompt += f"{m['role']}: {m['content']}\n"
-            prompt += "assistant: "
-
-        # Disable dynamic shapes by padding to fixed length (Prompt 2 instruction)
-        # We choose a safe max_length. 1024 or 512.
-        # For legacy hardware, 512 might be safer for memory.
-        inputs = self.tokenizer(
+                return prompt
+
+        prompt = ""
+        for m in clean_messages:
+            prompt += f"{m['role']}: {m['content']}\n"
+        prompt += "assistant: "
+        return prompt
+
+    def _bucket_for(self, length: int) -> int:
+        for bucket in self.buckets:
+            if length <= bucket:
+                return bucket
+        return self.buckets[-1]
+
+    def _fit_prompt(self, messages: list):
+        """Renders the prompt, dropping old turns until it fits the largest bucket. Returns (prompt, length)."""
+        clean_messages = self._clean_messages(messages)
+        prompt = self._render_prompt(clean_messages)
+        length = len(self.tokenizer(prompt).input_ids)
+
+        # Over the largest bucket: drop the oldest turns, keeping system messages and the latest message
+        while length > self.buckets[-1]:
+            droppable = [i for i, m in enumerate(clean_messages[:-1]) if m["role"] != "system"]
+            if not droppable:
+                logger.warning(f"Prompt of {length} tokens exceeds the largest bucket ({self.buckets[-1]}); truncating its start.")
+                break
+            del clean_messages[droppable[0]]
+            prompt = self._render_prompt(clean_messages)
+            length = len(self.tokenizer(prompt).input_ids)
+        return prompt, length
+
+    def _prepare_inputs(self, messages: list):
+        prompt, length = self._fit_prompt(messages)
+
+        # Pad to a fixed bucket length so only a handful of static shapes ever reach the device
+        return self.tokenizer(
             prompt,
             return_tensors="pt",
             padding="max_length",
-            max_length=512,
+            max_length=self._bucket_for(length),
             truncation=True
         )
 
+    def _generation_kwargs(self, assisted=False):
+        kwargs = {
+            "max_new_tokens": self.max_new_tokens, # Keep generation short for stability
+            "pad_token_id": self.tokenizer.pad_token_id,
+            "do_sample": True,
+            "temperature": self.temperature
+        }
+        # Assisted generation only handles one sequence at a time
+        if assisted and self.draft_model is not None:
+            kwargs["assistant_model"] = self.draft_model
+        return kwargs
+
+    def _kv_internals_present(self):
+        # The session path drives optimum-intel's stateful model directly through these (private) attributes
+        return all(hasattr(self.model, name) for name in ("request", "_past_length", "next_beam_idx"))
+
+    def _disable_session_cache(self, error):
+        logger.warning(f"OpenVINO session KV path failed ({error}); using full prefill from now on.")
+        with self._lock:
+            self.session_kv_cache = False
+            self.supports_sessions = False
+            self._kv_sessions.clear()
+
+    def reset_session(self, session_id):
+        """Forgets a session's KV state; its next turn is prefilled from scratch."""
+        with self._lock:
+            self._kv_sessions.pop(session_id, None)
+
+    def evict_sessions(self, keep=0):
+        """Drops the least recently used KV snapshots until at most `keep` remain."""
+        with self._lock:
+            while len(self._kv_sessions) > keep:
+                evicted_id, _ = self._kv_sessions.popitem(last=False)
+                logger.info(f"Evicted OpenVINO KV state for session {evicted_id}")
+
+    @staticmethod
+    def _common_prefix(a, b):
+        n = 0
+        for x, y in zip(a, b):
+            if x != y:
+                break
+            n += 1
+        return n
+
+    def _restore_state(self, entry, length):
+        """Loads a saved KV snapshot into the infer request, trimmed to the first `length` positions."""
+        import numpy as np
+        import openvino as ov
+
+        stored = len(entry["tokens"])
+        for state in self.model.request.query_state():
+            data = entry["states"][state.name]
+            # The sequence axis is the one sized like the stored token count (axis 2 for [batch, heads, seq, dim])
+            axes = [i for i, dim in enumerate(data.shape) if dim == stored]
+            axis = 2 if 2 in axes else axes[-1]
+            state.state = ov.Tensor(np.ascontiguousarray(np.take(data, range(length), axis=axis)))
+        self.model._past_length = length
+        self.model.next_beam_idx = np.arange(1, dtype=int)
+
+    def _sample(self, logits):
+        import numpy as np
+
+        logits = np.asarray(logits, dtype=np.float64) / max(self.temperature, 1e-5)
+        top = np.argpartition(logits, -self.top_k)[-self.top_k:]
+        probs = np.exp(logits[top] - logits[top].max())
+        probs /= probs.sum()
+        return int(np.random.choice(top, p=probs))
+
+    def _session_stream(self, messages, session_id):
+        """Token loop over the stateful model that reuses (and then saves) the session's KV state."""
+        import numpy as np
+
+        # Same bound as the stateless path: old turns dropped first, then the start cut to the largest bucket
+        prompt, _ = self._fit_prompt(messages)
+        prompt_ids = self.tokenizer(prompt).input_ids[-self.buckets[-1]:]
+        eos_ids = self.model.generation_config.eos_token_id
+        eos_ids = set(eos_ids if isinstance(eos_ids, list) else [eos_ids, self.tokenizer.eos_token_id])
+
+        with self._lock:
+            self.model.compile()
+            entry = self._kv_sessions.pop(session_id, None)
+            reuse = self._common_prefix(entry["tokens"], prompt_ids) if entry else 0
+            # Always feed at least one new token so there are logits to sample from
+            reuse = min(reuse, len(prompt_ids) - 1)
+            if reuse >= self.min_kv_reuse:
+                self._restore_state(entry, reuse)
+                past_key_values = ((),)
+            else:
+                reuse = 0
+                past_key_values = None
+            logger.info(f"OpenVINO session {session_id}: reusing {reuse} of {len(prompt_ids)} prompt tokens")
+
+            fed = list(prompt_ids[:reuse])
+            new_ids = prompt_ids[reuse:]
+            generated = []
+            text = ""
+            try:
+                while len(generated) < self.max_new_tokens:
+                    fed.extend(new_ids)
+                    out = self.model(
+                        input_ids=np.array([new_ids], dtype=np.int64),
+                        attention_mask=np.ones((1, len(fed)), dtype=np.int64),
+                        past_key_values=past_key_values
+                    )
+                    past_key_values = out.past_key_values
+                    next_id = self._sample(out.logits[0, -1])
+                    if next_id in eos_ids:
+                        break
+                    generated.append(next_id)
+                    new_text = self.tokenizer.decode(generated, skip_special_tokens=True)
+                    if len(new_text) > len(text) and not new_text.endswith("\ufffd"):
+                        yield new_text[len(text):]
+                        text = new_text
+                    new_ids = [next_id]
+            finally:
+                # Snapshot what the request has actually processed, for the next turn
+                self._kv_sessions[session_id] = {
+                    "tokens": fed,
+                    "states": {state.name: state.state.data.copy() for state in self.model.request.query_state()}
+                }
+                while len(self._kv_sessions) > self.max_kv_sessions:
+                    evicted_id, _ = self._kv_sessions.popitem(last=False)
+                    logger.info(f"Evicted OpenVINO KV state for session {evicted_id}")
+
+    def generate(self, messages: list, session_id=None) -> str:
+        if session_id is not None and self.session_kv_cache:
+            return "".join(self.generate_stream(messages, session_id))
+
+        inputs = self._prepare_inputs(messages)
+
         # Generate
-        gen_out = self.model.generate(
-            **inputs,
-            max_new_tokens=128, # Keep generation short for stability
-            pad_token_id=self.tokenizer.pad_token_id,
-            do_sample=True,
-            temperature=0.7
-        )
+        with self._lock:
+            gen_out = self.model.generate(**inputs, **self._generation_kwargs(assisted=True))
 
         # Decode
         prompt_len = inputs.input_ids.shape[1]
         out_ids = gen_out[0][prompt_len:]
         text = self.tokenizer.decode(out_ids, skip_special_tokens=True)
         return text
+
+    def generate_batch(self, batch: list, callbacks=None) -> list:
+        """Generates replies for several conversations in one padded batch; callbacks[i] receives row i's text deltas."""
+        fitted = [self._fit_prompt(messages) for messages in batch]
+        inputs = self.tokenizer(
+            [prompt for prompt, _ in fitted],
+            return_tensors="pt",
+            padding="max_length",
+            max_length=self._bucket_for(max(length for _, length in fitted)),
+            truncation=True
+        )
+        kwargs = self._generation_kwargs()
+        if callbacks and any(callbacks):
+            kwargs["streamer"] = _BatchStreamer(self.tokenizer, callbacks)
+
+        with self._lock:
+            gen_out = self.model.generate(**inputs, **kwargs)
+
+        prompt_len = inputs.input_ids.shape[1]
+        return [self.tokenizer.decode(row[prompt_len:], skip_special_tokens=True) for row in gen_out]
+
+    def generate_stream(self, messages: list, session_id=None):
+        if session_id is not None and self.session_kv_cache:
+            yielded = False
+            try:
+                for delta in self._session_stream(messages, session_id):
+                    yielded = True
+                    yield delta
+                return
+            except (AttributeError, TypeError, KeyError) as e:
+                # optimum-intel internals changed underneath us; nothing was sent yet, so redo it stateless
+                if yielded:
+                    raise
+                self._disable_session_cache(e)
+
+        from threading import Thread
+        from transformers import TextIteratorStreamer
+
+        inputs = self._prepare_inputs(messages)
+        streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True, timeout=STREAM_POLL_SECONDS)
+        errors = []
+
+        def run():
+            try:
+                self.model.generate(**inputs, **self._generation_kwargs(assisted=True), streamer=streamer)
+            except Exception as e:
+                errors.append(e)
+                # Unblocks the consumer below
+                streamer.end()
+
+        # model.generate blocks until done, so it runs in a worker while we drain the streamer
+        with self._lock:
+            worker = Thread(target=run, daemon=True)
+            worker.start()
+            try:
+                while True:
+                    try:
+                        delta = next(streamer)
+                    except StopIteration:
+                        break
+                    except queue.Empty:
+                        # Slow prefill keeps the worker alive; a dead worker means no more tokens
+                        if worker.is_alive():
+                            continue
+                        break
+                    if delta:
+                        yield delta
+            finally:
+                worker.join()
+        if errors:
+            raise errors[0]
+
+
+class _BatchStreamer:
+    """transformers streamer that decodes each row of a batched generate() and hands the deltas to that row's callback."""
+    def __init__(self, tokenizer, callbacks):
+        self.tokenizer = tokenizer
+        self.callbacks = callbacks
+        self.tokens = [[] for _ in callbacks]
+        self.texts = [""] * len(callbacks)
+        self.prompt_seen = False
+
+    def put(self, value):
+        # The first call carries the prompt ids
+        if not self.prompt_seen:
+            self.prompt_seen = True
+            return
+        for i, token in enumerate(value.reshape(-1).tolist()):
+            if self.callbacks[i] is None:
+                continue
+            self.tokens[i].append(token)
+            text = self.tokenizer.decode(self.tokens[i], skip_special_tokens=True)
+            if len(text) > len(self.texts[i]) and not text.endswith("\ufffd"):
+                self.callbacks[i](text[len(self.texts[i]):])
+                self.texts[i] = text
+
+    def end(self):
+        pass
@@ -11,24 +11,21 @@ class OllamaLLM(LLMProvider):
     def generate(self, messages: list) -> str:
         try:
             # Ollama messages format matches OpenAI closely
-            clean_messages = []
-            for m in messages:
-                content = m.get("content", "")
-                if isinstance(content, list):
-                    text_parts = [item.get("text", "") for item in content if item.get("type") in ["input_text", "output_text", "text"]]
-                    clean_content = " ".join(text_parts)
-                else:
-                    clean_content = content
-                
-                role = m["role"]
-                # Convert "assistant" to "assistant" (ollama supports this)
-                clean_messages.append({
-                    "role": role,
-                    "content": clean_content
-                })
+            clean_messages = self._clean_messages(messages)
 
             response = ollama.chat(model=self.model_name, messages=clean_messages)
             return response['message']['content']
         except Exception as e:
             logger.error(f"Ollama generation error: {e}")
             return f"Error communicating with local Ollama: {e}"
+
+    def generate_stream(self, messages: list):
+        try:
+            stream = ollama.chat(model=self.model_name, messages=self._clean_messages(messages), stream=True)
+            for chunk in stream:
+                delta = chunk['message']['content']
+                if delta:
+                    yield delta
+        except Exception as e:
+            logger.error(f"Ollama streaming error: {e}")
+            yield f"Error communicating with local Ollama: {e}"
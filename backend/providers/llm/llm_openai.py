@@ -9,27 +9,28 @@ class OpenAILLM(LLMProvider):
         self.client = OpenAI(api_key=api_key)
         self.model_name = model_name
 
+        # Exact token counts for budgeting if tiktoken is around, otherwise the base estimate
+        try:
+            import tiktoken
+            try:
+                self.encoding = tiktoken.encoding_for_model(model_name)
+            except KeyError:
+                self.encoding = tiktoken.get_encoding("o200k_base")
+        except ImportError:
+            self.encoding = None
+
+    def count_tokens(self, text: str) -> int:
+        if self.encoding is None:
+            return super().count_tokens(text)
+        return len(self.encoding.encode(text))
+
     def generate(self, messages: list) -> str:
         try:
             # Filter messages to ensure they match OpenAI format if needed
             # (removing 'type' wrapping if it exists in the dicts from llm_scr.py)
             # llm_scr.py uses specific structure: content: [{"type": "input_text", "text": ...}]
             # OpenAI expects content to be string or list of blocks.
-
-            clean_messages = []
-            for m in messages:
-                content = m.get("content", "")
-                if isinstance(content, list):
-                    # extract text from list if it matches the structure
-                    text_parts = [item.get("text", "") for item in content if item.get("type") in ["input_text", "output_text", "text"]]
-                    clean_content = " ".join(text_parts)
-                else:
-                    clean_content = content
-
-                clean_messages.append({
-                    "role": m["role"],
-                    "content": clean_content
-                })
+            clean_messages = self._clean_messages(messages)
 
             response = self.client.chat.completions.create(
                 model=self.model_name,
@@ -42,3 +43,23 @@ class OpenAILLM(LLMProvider):
         except Exception as e:
             logger.error(f"OpenAI generation error: {e}")
             return "Sorry, I encountered an error communicating with the AI service."
+
+    def generate_stream(self, messages: list):
+        try:
+            stream = self.client.chat.completions.create(
+                model=self.model_name,
+                messages=self._clean_messages(messages),
+                temperature=1,
+                top_p=1,
+                max_tokens=2048,
+                stream=True
+            )
+            for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    yield delta
+        except Exception as e:
+            logger.error(f"OpenAI streaming error: {e}")
+            yield "Sorry, I encountered an error communicating with the AI service."
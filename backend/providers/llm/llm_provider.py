@@ -1,6 +1,15 @@
 from abc import ABC, abstractmethod
 
 class LLMProvider(ABC):
+    # Prompt + reply tokens the model can attend to; None means large or unknown (remote APIs)
+    context_window = None
+    # Tokens kept free for the reply when the prompt is fitted to the context window
+    reply_reserve = 1024
+    # True if generate()/generate_stream() accept a session_id to keep per-session state
+    supports_sessions = False
+    # True if generate_batch() runs several prompts at once (used by BatchingLLM)
+    supports_batching = False
+
     @abstractmethod
     def generate(self, messages: list) -> str:
         """
@@ -8,3 +17,47 @@ class LLMProvider(ABC):
         messages: list of dicts with 'role' and 'content'.
         """
         pass
+
+    def generate_stream(self, messages: list):
+        """
+        Yields the response as text deltas while it is being generated.
+        Backends without native streaming fall back to a single chunk.
+        """
+        yield self.generate(messages)
+
+    def generate_batch(self, batch: list, callbacks=None) -> list:
+        """
+        Generates one reply per conversation in batch. callbacks, if given, holds one
+        optional function per conversation that is called with its text deltas.
+        The default runs the conversations one after another.
+        """
+        results = []
+        for i, messages in enumerate(batch):
+            callback = callbacks[i] if callbacks else None
+            if callback is None:
+                results.append(self.generate(messages))
+                continue
+            parts = []
+            for delta in self.generate_stream(messages):
+                callback(delta)
+                parts.append(delta)
+            results.append("".join(parts))
+        return results
+
+    def count_tokens(self, text: str) -> int:
+        """Token count used for prompt budgeting. Backends with a local tokenizer override this."""
+        return len(text) // 4 + 1
+
+    @staticmethod
+    def _clean_messages(messages: list) -> list:
+        """Flattens list-based content (llm_scr.py style) into plain strings."""
+        clean_messages = []
+        for m in messages:
+            content = m.get("content", "")
+            if isinstance(content, list):
+                text_parts = [item.get("text", "") for item in content if item.get("type") in ["input_text", "output_text", "text"]]
+                clean_content = " ".join(text_parts)
+            else:
+                clean_content = content
+            clean_messages.append({"role": m["role"], "content": clean_content})
+        return clean_messages
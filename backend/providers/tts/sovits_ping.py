@@ -1,12 +1,21 @@
-import requests
+import os
+import httpx
 ### MUST START SERVERS FIRST USING START ALL SERVER SCRIPT
 import time
-import soundfile as sf 
+import asyncio
+import logging
+import threading
+import soundfile as sf
 import sounddevice as sd
 import yaml
 
-# Load YAML config
-with open('character_config.yaml', 'r') as f:
+logger = logging.getLogger(__name__)
+
+# Load YAML config (current directory first, like before, then the repo's configs/)
+CONFIG_PATH = 'character_config.yaml'
+if not os.path.exists(CONFIG_PATH):
+    CONFIG_PATH = os.path.join(os.path.dirname(__file__), '..', '..', '..', 'configs', 'character_config.yaml')
+with open(CONFIG_PATH, 'r') as f:
     char_config = yaml.safe_load(f)
 
 
@@ -15,33 +24,110 @@ def play_audio(path):
     sd.play(data, samplerate)
     sd.wait()  # Wait until playback is finished
 
-def sovits_gen(in_text, output_wav_pth = "output.wav"):
-    url = "http://127.0.0.1:9880/tts"
-
-    payload = {
-        "text": in_text,
-        "text_lang": char_config['sovits_ping_config']['text_lang'],
-        "ref_audio_path": char_config['sovits_ping_config']['ref_audio_path'],  # Make sure this path is valid
-        "prompt_text": char_config['sovits_ping_config']['prompt_text'],
-        "prompt_lang": char_config['sovits_ping_config']['prompt_lang']
-    }
-
-    try:
-        response = requests.post(url, json=payload)
-        response.raise_for_status()  # throws if not 200
-
-        print(response)
-
+class SoVITSClient:
+    """
+    Pooled client for the GPT-SoVITS /tts server.
+
+    Keeps keep-alive connections open between utterances, applies timeouts, caps the
+    number of in-flight syntheses and retries connection errors / 5xx with exponential
+    backoff. `synthesize` is the async entry point for the API; `synthesize_sync` does
+    the same from plain threads (terminal loop, TTS pipeline workers).
+    """
+    def __init__(self, url="http://127.0.0.1:9880/tts", max_concurrency=2, timeout=60.0, connect_timeout=5.0, retries=2, backoff=0.5):
+        self.url = url
+        self.max_concurrency = max_concurrency
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self.limits = httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency)
+        self.retries = retries
+        self.backoff = backoff
+
+        self._async_client = None
+        self._async_semaphore = None
+        self._sync_client = None
+        self._sync_semaphore = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+
+    def _payload(self, in_text):
+        return {
+            "text": in_text,
+            "text_lang": char_config['sovits_ping_config']['text_lang'],
+            "ref_audio_path": char_config['sovits_ping_config']['ref_audio_path'],  # Make sure this path is valid
+            "prompt_text": char_config['sovits_ping_config']['prompt_text'],
+            "prompt_lang": char_config['sovits_ping_config']['prompt_lang']
+        }
+
+    def _should_retry(self, error):
+        if isinstance(error, httpx.HTTPStatusError):
+            return error.response.status_code >= 500
+        return isinstance(error, httpx.TransportError)
+
+    @staticmethod
+    def _save(content, output_wav_pth):
         # Save the response audio if it's binary
         with open(output_wav_pth, "wb") as f:
-            f.write(response.content)
-        # print("Audio saved as output.wav")
-
+            f.write(content)
         return output_wav_pth
 
-    except Exception as e:
-        print("Error in sovits_gen:", e)
-        return None
+    async def synthesize(self, in_text, output_wav_pth="output.wav"):
+        # The async client and semaphore are bound to the loop that first uses them
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(timeout=self.timeout, limits=self.limits)
+            self._async_semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async with self._async_semaphore:
+            for attempt in range(self.retries + 1):
+                try:
+                    response = await self._async_client.post(self.url, json=self._payload(in_text))
+                    response.raise_for_status()  # throws if not 200
+                    return self._save(response.content, output_wav_pth)
+                except Exception as e:
+                    if attempt < self.retries and self._should_retry(e):
+                        await asyncio.sleep(self.backoff * (2 ** attempt))
+                        continue
+                    logger.error(f"Error in SoVITS synthesis: {e}")
+                    return None
+
+    def synthesize_sync(self, in_text, output_wav_pth="output.wav"):
+        with self._lock:
+            if self._sync_client is None:
+                self._sync_client = httpx.Client(timeout=self.timeout, limits=self.limits)
+
+        with self._sync_semaphore:
+            for attempt in range(self.retries + 1):
+                try:
+                    response = self._sync_client.post(self.url, json=self._payload(in_text))
+                    response.raise_for_status()  # throws if not 200
+                    return self._save(response.content, output_wav_pth)
+                except Exception as e:
+                    if attempt < self.retries and self._should_retry(e):
+                        time.sleep(self.backoff * (2 ** attempt))
+                        continue
+                    logger.error(f"Error in SoVITS synthesis: {e}")
+                    return None
+
+    async def aclose(self):
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+
+    def close(self):
+        if self._sync_client is not None:
+            self._sync_client.close()
+            self._sync_client = None
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+def get_tts_client():
+    """Returns the process-wide SoVITSClient so every caller shares one connection pool."""
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = SoVITSClient(**char_config.get('sovits_client', {}))
+    return _default_client
+
+def sovits_gen(in_text, output_wav_pth = "output.wav"):
+    return get_tts_client().synthesize_sync(in_text, output_wav_pth)
 
 
 
@@ -50,11 +136,10 @@ if __name__ == "__main__":
     start_time = time.time()
     output_wav_pth1 = "output.wav"
     path_to_aud = sovits_gen("if you hear this, that means it is set up correctly", output_wav_pth1)
-    
+
     end_time = time.time()
     elapsed_time = end_time - start_time
 
     print(f"Elapsed time: {elapsed_time:.4f} seconds")
     print(path_to_aud)
 
-
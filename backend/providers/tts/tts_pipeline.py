@@ -0,0 +1,162 @@
+import re
+import uuid
+import asyncio
+import logging
+import threading
+from pathlib import Path
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from .sovits_ping import sovits_gen
+
+logger = logging.getLogger(__name__)
+
+class SentenceSplitter:
+    """
+    Incrementally splits streamed LLM text at sentence boundaries.
+    Fragments shorter than min_chars are merged into the next sentence so the
+    TTS server isn't hit with one-word requests (which also sound choppy).
+    """
+    BOUNDARY = re.compile(r'(?<=[.!?…。！？~])["\'”’)\]]*\s+|\n+')
+
+    def __init__(self, min_chars=24):
+        self.min_chars = min_chars
+        self.buffer = ""
+
+    def feed(self, delta):
+        self.buffer += delta
+        sentences = []
+        start = 0
+        for match in self.BOUNDARY.finditer(self.buffer):
+            candidate = self.buffer[start:match.end()].strip()
+            if len(candidate) >= self.min_chars:
+                sentences.append(candidate)
+                start = match.end()
+        self.buffer = self.buffer[start:]
+        return sentences
+
+    def flush(self):
+        rest = self.buffer.strip()
+        self.buffer = ""
+        return [rest] if rest else []
+
+class TTSPipeline:
+    """
+    Synthesizes a reply sentence by sentence while the LLM is still generating.
+
+    feed() the streamed deltas; every completed sentence is handed to the TTS
+    worker(s) straight away. Segments come back in reply order through poll()
+    (non-blocking) or iter_segments() (blocking, ends after close()).
+    With the default single worker, sentence N is synthesized while the LLM
+    produces sentence N+1, without sending parallel requests to SoVITS.
+    executor may be anything with submit(fn, *args) -> Future (e.g. a StagePool);
+    a segment it refuses is kept without audio.
+    """
+    def __init__(self, synthesize=sovits_gen, output_dir="audio", prefix="tts", max_workers=1, executor=None, min_chars=24):
+        self.synthesize = synthesize
+        self.output_dir = Path(output_dir)
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.prefix = f"{prefix}_{uuid.uuid4().hex}"
+        self.splitter = SentenceSplitter(min_chars=min_chars)
+
+        self._own_executor = executor is None
+        self.executor = executor or ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tts")
+
+        self._segments = []  # list of (text, future)
+        self._cond = threading.Condition()
+        self._closed = False
+        self._polled = 0
+
+    def _synthesize(self, text, path):
+        try:
+            return self.synthesize(text, str(path))
+        except Exception as e:
+            logger.error(f"TTS failed for segment '{text[:40]}': {e}")
+            return None
+
+    def submit(self, text):
+        with self._cond:
+            index = len(self._segments)
+            path = self.output_dir / f"{self.prefix}_{index:03d}.wav"
+            try:
+                future = self.executor.submit(self._synthesize, text, path)
+            except Exception as e:
+                logger.warning(f"TTS segment '{text[:40]}' not queued: {e}")
+                future = Future()
+                future.set_result(None)
+            self._segments.append((text, future))
+            self._cond.notify_all()
+        return future
+
+    def feed(self, delta):
+        for sentence in self.splitter.feed(delta):
+            self.submit(sentence)
+
+    def close(self):
+        """Sends the trailing partial sentence and marks the reply as complete."""
+        if self._closed:
+            return
+        for sentence in self.splitter.flush():
+            self.submit(sentence)
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._own_executor:
+            self.executor.shutdown(wait=False)
+
+    def cancel(self):
+        """Drops segments that haven't started synthesizing yet (e.g. on interrupt)."""
+        with self._cond:
+            for _, future in self._segments:
+                future.cancel()
+            self._closed = True
+            self._cond.notify_all()
+        if self._own_executor:
+            self.executor.shutdown(wait=False)
+
+    def poll(self):
+        """Returns newly finished segments as (index, text, path), without blocking or reordering."""
+        ready = []
+        with self._cond:
+            while self._polled < len(self._segments) and self._segments[self._polled][1].done():
+                text, future = self._segments[self._polled]
+                ready.append((self._polled, text, future.result()))
+                self._polled += 1
+        return ready
+
+    def iter_segments(self):
+        """Yields (index, text, path) in order as each segment finishes, until close() and all are done."""
+        index = 0
+        while True:
+            with self._cond:
+                while index >= len(self._segments) and not self._closed:
+                    self._cond.wait()
+                if index >= len(self._segments):
+                    return
+                text, future = self._segments[index]
+            if future.cancelled():
+                return
+            yield index, text, future.result()
+            index += 1
+
+    def drain(self):
+        """Like iter_segments(), but skips the segments poll() already returned."""
+        for segment in self.iter_segments():
+            if segment[0] >= self._polled:
+                yield segment
+
+    async def adrain(self):
+        """Async drain() for after close(): awaits the remaining segments without tying up a thread."""
+        index = self._polled
+        while True:
+            with self._cond:
+                if index >= len(self._segments):
+                    return
+                text, future = self._segments[index]
+            if future.cancelled():
+                return
+            yield index, text, await asyncio.wrap_future(future)
+            index += 1
+
+    def results(self):
+        """Blocks until everything is synthesized and returns the ordered list of audio paths (None on failure)."""
+        return [path for _, _, path in self.iter_segments()]
@@ -0,0 +1,130 @@
+"""
+Query latency benchmark for memory retrieval at growing store sizes.
+
+Fills a scratch NumpyMemoryStore with synthetic chat lines (Zipf-distributed words
+plus a few rare names, random unit embeddings) and times vector-only, BM25-only and
+hybrid search at each size. Inserts go through the same path as live chat (store
+upsert + incremental lexical index), so insert throughput is reported too.
+
+    python scripts/benchmark_memory.py --sizes 10000 100000 1000000 --output memory_bench.json
+"""
+import sys
+import json
+import math
+import time
+import random
+import logging
+import argparse
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(ROOT / "backend"))
+
+from managers.memory_store import NumpyMemoryStore
+from managers.memory_retrieval import HybridRetriever
+
+logger = logging.getLogger("benchmark")
+
+SYLLABLES = ["ka", "ri", "mo", "to", "na", "shi", "ru", "ko", "yu", "me", "sa", "hi", "no", "ta", "ke", "ra"]
+
+def percentile(values, p):
+    """Nearest-rank percentile."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+def summarize(values):
+    return {
+        "count": len(values),
+        "mean_ms": round(1000 * sum(values) / len(values), 3),
+        "p50_ms": round(1000 * percentile(values, 50), 3),
+        "p95_ms": round(1000 * percentile(values, 95), 3),
+        "p99_ms": round(1000 * percentile(values, 99), 3)
+    }
+
+class SyntheticMemories:
+    """Chat-like lines over a Zipfian vocabulary; names are rare tokens that only exact matching finds."""
+    def __init__(self, vocab_size=20000, seed=0):
+        self.rng = random.Random(seed)
+        self.vocab = ["".join(self.rng.choice(SYLLABLES) for _ in range(self.rng.randint(1, 4))) + str(i % 7) for i in range(vocab_size)]
+        weights = [1 / (rank + 1) for rank in range(vocab_size)]
+        total = sum(weights)
+        self.cumulative = np.cumsum([w / total for w in weights])
+
+    def line(self):
+        count = self.rng.randint(6, 20)
+        picks = np.searchsorted(self.cumulative, [self.rng.random() for _ in range(count)])
+        return " ".join(self.vocab[min(i, len(self.vocab) - 1)] for i in picks)
+
+    def query(self):
+        return " ".join(self.line().split()[:self.rng.randint(2, 6)])
+
+def fill(store, retriever, memories, target, dim, batch_size, np_rng):
+    """Grows the store to `target` rows; returns insert throughput (rows/s)."""
+    start = time.perf_counter()
+    added = 0
+    now = time.time()
+    while store.count() < target:
+        n = min(batch_size, target - store.count())
+        first = store.count()
+        ids = [f"m{first + i}" for i in range(n)]
+        documents = [memories.line() for _ in range(n)]
+        # Spread timestamps over the last year so recency decay has work to do
+        metadatas = [{"role": "user", "created_at": now - np_rng.uniform(0, 365 * 86400)} for _ in range(n)]
+        embeddings = np_rng.standard_normal((n, dim), dtype=np.float32)
+        store.upsert(ids, documents, metadatas, embeddings)
+        retriever.add(ids, documents)
+        added += n
+    return added / max(time.perf_counter() - start, 1e-9)
+
+def time_queries(search, queries):
+    latencies = []
+    for query, embedding in queries:
+        start = time.perf_counter()
+        search(query, embedding)
+        latencies.append(time.perf_counter() - start)
+    return summarize(latencies)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark memory retrieval latency at several store sizes.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--dtype", default="float16", choices=NumpyMemoryStore.DTYPES)
+    parser.add_argument("--hnsw", action="store_true", help="Use hnswlib for the vector side (needs hnswlib)")
+    parser.add_argument("--dim", type=int, default=384, help="Embedding size (MiniLM-L6 is 384)")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--n-results", type=int, default=3)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--output", default="memory_benchmark.json")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    logger.setLevel(logging.INFO)
+
+    memories = SyntheticMemories()
+    np_rng = np.random.default_rng(0)
+    results = []
+    with tempfile.TemporaryDirectory() as scratch:
+        store = NumpyMemoryStore(scratch, dtype=args.dtype, hnsw=args.hnsw, hnsw_threshold=0 if args.hnsw else 20000)
+        retriever = HybridRetriever(store)
+        retriever.lexical_ready.set()
+        for size in sorted(args.sizes):
+            logger.info(f"Filling to {size} memories...")
+            inserts_per_second = fill(store, retriever, memories, size, args.dim, args.batch_size, np_rng)
+            queries = [(memories.query(), np_rng.standard_normal(args.dim, dtype=np.float32)) for _ in range(args.queries)]
+            n = args.n_results
+            result = {
+                "memories": size,
+                "inserts_per_second": round(inserts_per_second, 1),
+                "vector": time_queries(lambda q, e: store.query(e, n), queries),
+                "lexical": time_queries(lambda q, e: retriever.lexical.search(q, n * retriever.candidates), queries),
+                "hybrid": time_queries(lambda q, e: retriever.search(q, e, n), queries)
+            }
+            logger.info(json.dumps(result))
+            results.append(result)
+        store.close()
+
+    with open(args.output, 'w') as f:
+        json.dump({"dtype": args.dtype, "hnsw": args.hnsw, "dim": args.dim, "results": results}, f, indent=4)
+    logger.info(f"Results written to {args.output}")
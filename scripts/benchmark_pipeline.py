@@ -0,0 +1,333 @@
+"""
+End-to-end latency benchmark for the voice pipeline: ASR -> RikoCore.chat -> TTS.
+
+Replays a corpus (WAV files go through ASR, text prompts start at the LLM) with N
+concurrent sessions and writes per-stage p50/p95/p99 latency, throughput and peak RSS
+as JSON, so runs can be diffed across commits. Remote services are replaced by local
+stand-ins by default (a fixed-speed fake LLM for API providers, a fake SoVITS that
+writes silence), so numbers measure this code rather than the network. Memory, facts
+and conversation history go to scratch copies unless --live-data is given.
+
+    python scripts/benchmark_pipeline.py --corpus bench_corpus --concurrency 1 4 --output bench.json
+"""
+import os
+import sys
+import json
+import math
+import time
+import uuid
+import wave
+import yaml
+import shutil
+import logging
+import argparse
+import tempfile
+import threading
+import subprocess
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(ROOT / "backend"))
+
+from core.riko_core import RikoCore
+from providers.llm.llm_provider import LLMProvider
+
+logger = logging.getLogger("benchmark")
+
+DEFAULT_PROMPTS = [
+    "Hi Riko, how are you today?",
+    "Can you remind me what we talked about earlier?",
+    "Tell me a short joke about cats.",
+    "What should I cook for dinner tonight?",
+    "Give me one tip to focus better while studying."
+]
+
+REMOTE_PROVIDERS = ("openai", "gemini", "ollama")
+
+class StandInLLM(LLMProvider):
+    """Local stand-in for API models: streams a canned reply at a fixed time-to-first-token and token rate."""
+    def __init__(self, ttft_ms=300, tokens_per_second=40, reply_tokens=40):
+        self.ttft = ttft_ms / 1000
+        self.token_delay = 1 / tokens_per_second
+        self.reply_tokens = reply_tokens
+
+    def generate(self, messages: list) -> str:
+        return "".join(self.generate_stream(messages))
+
+    def generate_stream(self, messages: list):
+        time.sleep(self.ttft)
+        for i in range(self.reply_tokens):
+            if i:
+                time.sleep(self.token_delay)
+            yield ("Sure senpai" if i == 0 else " word")
+
+def stand_in_tts(ms_per_char=15):
+    """Local stand-in for the SoVITS server: takes time proportional to the text and writes silence."""
+    def synthesize(text, output_path):
+        time.sleep(len(text) * ms_per_char / 1000)
+        with wave.open(str(output_path), 'wb') as f:
+            f.setnchannels(1)
+            f.setsampwidth(2)
+            f.setframerate(32000)
+            f.writeframes(b"\0\0" * 3200)
+        return str(output_path)
+    return synthesize
+
+def percentile(values, p):
+    """Nearest-rank percentile."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+def summarize(values):
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "mean": round(sum(values) / len(values), 4),
+        "p50": round(percentile(values, 50), 4),
+        "p95": round(percentile(values, 95), 4),
+        "p99": round(percentile(values, 99), 4),
+        "max": round(max(values), 4)
+    }
+
+class RSSSampler:
+    """Tracks peak RSS in MB; samples with psutil if present, otherwise reads ru_maxrss (process lifetime peak)."""
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.peak_mb = 0.0
+        self._stop = threading.Event()
+        try:
+            import psutil
+            self._process = psutil.Process()
+        except ImportError:
+            self._process = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _sample(self):
+        if self._process is not None:
+            rss = self._process.memory_info().rss / (1 << 20)
+        else:
+            import resource
+            # KB on Linux, bytes on macOS
+            rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1 << 20 if sys.platform == "darwin" else 1 << 10)
+        self.peak_mb = max(self.peak_mb, rss)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def __enter__(self):
+        self._sample()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+
+def load_corpus(corpus_dir, prompts_file):
+    """Returns [("wav", path) | ("text", prompt)]."""
+    items = []
+    if corpus_dir:
+        corpus = Path(corpus_dir)
+        items += [("wav", str(p)) for p in sorted(corpus.glob("*.wav"))]
+        if prompts_file is None and (corpus / "prompts.txt").exists():
+            prompts_file = corpus / "prompts.txt"
+    if prompts_file:
+        with open(prompts_file, 'r', encoding='utf-8') as f:
+            items += [("text", line.strip()) for line in f if line.strip()]
+    return items or [("text", p) for p in DEFAULT_PROMPTS]
+
+def run_turn(riko, item, session_id, synthesize, out_dir, use_memory):
+    """Runs one corpus item through the pipeline and returns per-stage seconds."""
+    timings = {}
+    start = time.perf_counter()
+
+    kind, value = item
+    if kind == "wav":
+        t = time.perf_counter()
+        user_text = riko.asr.transcribe(value) or "Hello Riko"
+        timings["asr"] = time.perf_counter() - t
+    else:
+        user_text = value
+
+    t = time.perf_counter()
+    stream = riko.chat_stream(user_text, use_memory=use_memory, session_id=session_id)
+    first = None
+    try:
+        while True:
+            next(stream)
+            if first is None:
+                first = time.perf_counter() - t
+    except StopIteration as stop:
+        clean_response, _ = stop.value
+    timings["llm_first_token"] = first if first is not None else time.perf_counter() - t
+    timings["llm"] = time.perf_counter() - t
+
+    t = time.perf_counter()
+    synthesize(clean_response or "...", Path(out_dir) / f"{uuid.uuid4().hex}.wav")
+    timings["tts"] = time.perf_counter() - t
+
+    timings["end_to_end"] = time.perf_counter() - start
+    return timings
+
+def run_level(riko, corpus, concurrency, turns_per_session, synthesize, out_dir, use_memory):
+    """Runs `concurrency` sessions side by side, each replaying turns_per_session corpus items."""
+    samples = {}
+    errors = []
+    lock = threading.Lock()
+    session_ids = [f"bench-{uuid.uuid4().hex[:8]}" for _ in range(concurrency)]
+
+    def session_worker(index, session_id):
+        for turn in range(turns_per_session):
+            item = corpus[(index + turn) % len(corpus)]
+            try:
+                timings = run_turn(riko, item, session_id, synthesize, out_dir, use_memory)
+            except Exception as e:
+                logger.error(f"Turn failed ({item}): {e}")
+                with lock:
+                    errors.append(str(e))
+                continue
+            with lock:
+                for stage, seconds in timings.items():
+                    samples.setdefault(stage, []).append(seconds)
+
+    with RSSSampler() as rss:
+        start = time.perf_counter()
+        threads = [threading.Thread(target=session_worker, args=(i, sid)) for i, sid in enumerate(session_ids)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall = time.perf_counter() - start
+
+    for session_id in session_ids:
+        riko.sessions.remove(session_id)
+        riko.conversations.delete(session_id)
+
+    turns = len(samples.get("end_to_end", []))
+    return {
+        "concurrency": concurrency,
+        "turns": turns,
+        "errors": len(errors),
+        "wall_seconds": round(wall, 3),
+        "throughput_turns_per_second": round(turns / wall, 3) if wall else None,
+        "peak_rss_mb": round(rss.peak_mb, 1),
+        "stages": {stage: summarize(values) for stage, values in samples.items()}
+    }
+
+def scratch_config(config_path, scratch):
+    """Writes a copy of the config whose memory, facts and history stores live in `scratch`."""
+    with open(config_path, 'r') as f:
+        config = yaml.safe_load(f)
+    facts = ROOT / config.get('user_facts', 'configs/user_facts.json')
+    scratch_facts = os.path.join(scratch, "user_facts.json")
+    if facts.exists():
+        shutil.copy(facts, scratch_facts)
+    config['user_facts'] = scratch_facts
+    config['memory_db'] = os.path.join(scratch, "chroma_db")
+    config['conversation_db'] = os.path.join(scratch, "conversations.db")
+    # A compaction pass would compete with the measured turns
+    config.setdefault('memory', {})['compaction'] = {'enabled': False}
+    path = os.path.join(scratch, "config.yaml")
+    with open(path, 'w') as f:
+        yaml.safe_dump(config, f)
+    return path
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a corpus through ASR -> chat -> TTS and report latency.")
+    parser.add_argument("--corpus", help="Directory with *.wav files and/or prompts.txt")
+    parser.add_argument("--prompts", help="Text file with one prompt per line")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4], help="Concurrent session counts to run")
+    parser.add_argument("--turns", type=int, default=5, help="Turns per session at each level")
+    parser.add_argument("--warmup", type=int, default=1, help="Untimed turns before measuring")
+    parser.add_argument("--config", default=str(ROOT / "configs" / "character_config.yaml"))
+    parser.add_argument("--real-llm", action="store_true", help="Call API providers instead of the local stand-in")
+    parser.add_argument("--real-tts", action="store_true", help="Call the SoVITS server instead of the local stand-in")
+    parser.add_argument("--no-memory", action="store_true", help="Skip vector memory retrieval")
+    parser.add_argument("--live-data", action="store_true", help="Use the real memory / facts / history stores instead of scratch copies")
+    parser.add_argument("--stand-in-ttft-ms", type=float, default=300)
+    parser.add_argument("--stand-in-tps", type=float, default=40)
+    parser.add_argument("--output", default="benchmark_results.json")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    logger.setLevel(logging.INFO)
+
+    corpus = load_corpus(args.corpus, args.prompts)
+    logger.info(f"Corpus: {sum(k == 'wav' for k, _ in corpus)} WAV files, {sum(k == 'text' for k, _ in corpus)} prompts")
+
+    use_memory = not args.no_memory
+
+    with tempfile.TemporaryDirectory() as scratch:
+        config_path = args.config
+        if not args.live_data:
+            config_path = scratch_config(args.config, scratch)
+
+        with RSSSampler() as startup_rss:
+            start = time.perf_counter()
+            riko = RikoCore(config_path=config_path)
+            riko.subsystems.get("llm")
+            if any(kind == "wav" for kind, _ in corpus):
+                riko.subsystems.get("asr")
+            startup_seconds = time.perf_counter() - start
+
+        if riko.llm_provider in REMOTE_PROVIDERS and not args.real_llm:
+            logger.info(f"Replacing {riko.llm_provider} with the local stand-in LLM")
+            riko.llm = StandInLLM(args.stand_in_ttft_ms, args.stand_in_tps)
+            riko.summarizer.llm = riko.llm
+
+        if args.real_tts:
+            from providers.tts.sovits_ping import sovits_gen
+            synthesize = sovits_gen
+        else:
+            synthesize = stand_in_tts()
+
+        out_dir = os.path.join(scratch, "audio")
+        os.makedirs(out_dir)
+        if args.warmup:
+            run_level(riko, corpus, 1, args.warmup, synthesize, out_dir, use_memory)
+        levels = []
+        for concurrency in args.concurrency:
+            logger.info(f"Running {concurrency} concurrent session(s) x {args.turns} turns")
+            level = run_level(riko, corpus, concurrency, args.turns, synthesize, out_dir, use_memory)
+            logger.info(json.dumps(level))
+            levels.append(level)
+
+        # Flush and close the stores while the scratch directory still exists
+        if riko.compactor is not None:
+            riko.compactor.stop()
+        if riko.subsystems.is_ready("memory"):
+            riko.memory_db.close()
+
+    results = {
+        "revision": git_revision(),
+        "timestamp": time.time(),
+        "llm_provider": riko.llm_provider,
+        "model": riko.real_llm_path,
+        "backend": riko.backend,
+        "stand_ins": {"llm": isinstance(riko.llm, StandInLLM), "tts": not args.real_tts},
+        "corpus_items": len(corpus),
+        "startup_seconds": round(startup_seconds, 3),
+        "startup_peak_rss_mb": round(startup_rss.peak_mb, 1),
+        "levels": levels
+    }
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=4)
+    print(f"Results written to {args.output}")
+    for level in levels:
+        e2e = level["stages"].get("end_to_end", {})
+        print(f"  {level['concurrency']:>3} sessions: {level['throughput_turns_per_second']} turns/s, "
+              f"end-to-end p50 {e2e.get('p50')}s p95 {e2e.get('p95')}s p99 {e2e.get('p99')}s, peak RSS {level['peak_rss_mb']} MB")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Copies long-term memories from the Chroma database into the lightweight NumPy store.
+
+Embeddings are copied as stored (nothing is re-embedded), so the embedding model
+in the config must stay the same. Afterwards set `memory.store: numpy` and point
+`memory_db` at the output folder.
+
+    python scripts/migrate_memory.py --source chroma_db --target memory_store --dtype int8
+"""
+import sys
+import logging
+import argparse
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(ROOT / "backend"))
+
+from managers.memory_store import COLLECTION_NAME, NumpyMemoryStore
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def migrate(source, target, dtype="float16", batch_size=1000):
+    import chromadb
+
+    client = chromadb.PersistentClient(path=str(source))
+    try:
+        collection = client.get_collection(name=COLLECTION_NAME)
+    except Exception as e:
+        logger.error(f"No '{COLLECTION_NAME}' collection in {source}: {e}")
+        sys.exit(1)
+
+    store = NumpyMemoryStore(str(target), dtype=dtype)
+    total = collection.count()
+    logger.info(f"Migrating {total} memories from {source} to {target} ({dtype})...")
+
+    copied = 0
+    undated = 0
+    for offset in range(0, total, batch_size):
+        batch = collection.get(offset=offset, limit=batch_size, include=["documents", "metadatas", "embeddings"])
+        # Keep the original order so the oldest memories stay first in the log
+        rows = sorted(
+            zip(batch['ids'], batch['documents'], batch['metadatas'], batch['embeddings']),
+            key=lambda row: (row[2] or {}).get('created_at', 0)
+        )
+        if not rows:
+            continue
+        ids, documents, metadatas, embeddings = zip(*rows)
+        undated += sum('created_at' not in (m or {}) for m in metadatas)
+        store.upsert(list(ids), list(documents), [m or {"role": "user"} for m in metadatas], list(embeddings))
+        copied += len(rows)
+        logger.info(f"{copied}/{total}")
+
+    store.close()
+    logger.info(f"Done: {store.count()} memories in {target}")
+    if undated:
+        # No age can be made up for these; compaction and max_age_days leave them alone
+        logger.warning(f"{undated} memories have no created_at and are skipped by memory compaction.")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migrate long-term memory from ChromaDB to the NumPy memory store.")
+    parser.add_argument("--source", default=str(ROOT / "chroma_db"), help="Chroma database folder")
+    parser.add_argument("--target", default=str(ROOT / "memory_store"), help="Output folder for the NumPy store")
+    parser.add_argument("--dtype", default="float16", choices=NumpyMemoryStore.DTYPES)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    migrate(args.source, args.target, args.dtype, args.batch_size)